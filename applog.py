@@ -0,0 +1,195 @@
+"""Structured, non-blocking logging for the app.
+
+Records are handed to a bounded queue on the calling thread and written as
+JSON lines by a background listener, so a slow stream never holds up a model
+call. Each record carries the current run ID, stage and research iteration
+from context variables. Secrets are redacted before a record is queued, and
+DEBUG output is sampled per logger.
+"""
+
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-run fields attached to every record
+CONTEXT_FIELDS = ("run_id", "stage", "iteration")
+# Structured payloads a record may carry via `extra=` (e.g. the periodic metrics report)
+PAYLOAD_FIELDS = ("metrics",)
+_context = {name: contextvars.ContextVar(f"log_{name}", default=None) for name in CONTEXT_FIELDS}
+
+# Third-party loggers that are too chatty below WARNING
+DEFAULT_LOGGER_LEVELS = {
+    "google": logging.WARNING,
+    "grpc": logging.WARNING,
+    "urllib3": logging.WARNING,
+    "httpx": logging.WARNING,
+    "httpcore": logging.WARNING,
+    "fpdf": logging.WARNING,
+    "PIL": logging.WARNING,
+    "fontTools": logging.WARNING,
+}
+
+# Google API keys, bearer tokens and key=... query parameters
+SECRET_PATTERNS = (
+    re.compile(r"AIza[0-9A-Za-z_\-]{35}"),
+    re.compile(r"(?i)(bearer\s+)[0-9A-Za-z._\-]{16,}"),
+    re.compile(r"(?i)([?&]key=)[^&\s\"']+"),
+)
+REDACTED = "[REDACTED]"
+
+_secrets = set()
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def set_log_context(**fields):
+    """Set context fields for this thread's records. Returns tokens for reset_log_context."""
+    return [(_context[name], _context[name].set(value)) for name, value in fields.items()]
+
+
+def reset_log_context(tokens) -> None:
+    for var, token in reversed(tokens):
+        var.reset(token)
+
+
+@contextmanager
+def log_context(**fields):
+    """Tag records logged inside the block with `fields` (run_id, stage, iteration)."""
+    tokens = set_log_context(**fields)
+    try:
+        yield
+    finally:
+        reset_log_context(tokens)
+
+
+def add_secret(value: str) -> None:
+    """Redact `value` wherever it appears in a log record."""
+    if value:
+        _secrets.add(str(value))
+
+
+def redact(text: str) -> str:
+    for secret in _secrets:
+        text = text.replace(secret, REDACTED)
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(lambda m: (m.group(1) if m.groups() else "") + REDACTED, text)
+    return text
+
+
+class ContextFilter(logging.Filter):
+    """Copies the run context onto the record while still on the logging thread."""
+
+    def filter(self, record):
+        for name, var in _context.items():
+            setattr(record, name, var.get())
+        return True
+
+
+class RedactingFilter(logging.Filter):
+    """Merges args into the message and strips secrets from it and any traceback."""
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+            record.exc_info = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in `every` DEBUG records per logger; other levels always pass."""
+
+    def __init__(self, every: int = 100):
+        super().__init__()
+        self.every = max(1, every)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        with self._lock:
+            counter = self._counters.get(record.name)
+            if counter is None:
+                counter = self._counters[record.name] = itertools.count()
+            return next(counter) % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS + PAYLOAD_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # The filters have already merged args and rendered the traceback
+        return record
+
+
+def configure_logging(level=logging.INFO, logger_levels: dict = None, debug_sample_every: int = 100,
+                      queue_size: int = 10000, stream=None) -> logging.handlers.QueueListener:
+    """Route the root logger through a background JSON writer.
+
+    Safe to call on every script rerun; only the first call takes effect.
+    `logger_levels` overrides DEFAULT_LOGGER_LEVELS by logger name.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(SamplingFilter(debug_sample_every))
+        queue_handler.addFilter(RedactingFilter())
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+        for name, logger_level in {**DEFAULT_LOGGER_LEVELS, **(logger_levels or {})}.items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        return _listener
@@ -0,0 +1,338 @@
+"""Per-session artifact store with a memory ceiling and spill-to-disk.
+
+Sessions keep small ArtifactRef handles in session_state while the texts and
+PDFs they point to live here. Large blobs, and the least recently used ones
+once the memory ceiling is reached, are zlib-compressed to a local directory.
+Idle sessions are moved to disk entirely, and the artifacts of sessions that
+have been gone for a grace period, or have expired, are deleted. The spill directory is removed when the
+store is closed, at the latest when the process exits.
+"""
+
+import atexit
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ArtifactRef:
+    """Handle to a stored artifact, small enough to keep in session_state."""
+    session_id: str
+    name: str
+    key: str
+    kind: str  # "text", "bytes" or "json"
+    size: int  # uncompressed bytes
+
+
+class _Session:
+    __slots__ = ("artifacts", "last_seen", "is_alive", "gone_since")
+
+    def __init__(self):
+        self.artifacts = {}  # name -> ArtifactRef
+        self.last_seen = time.monotonic()
+        self.is_alive = None
+        self.gone_since = None  # when is_alive first reported the session gone
+
+
+class ArtifactStore:
+    """Process-wide store for large per-session results.
+
+    `memory_limit` caps the bytes held in memory across all sessions; blobs of
+    at least `spill_threshold` bytes go straight to disk. Sessions not seen
+    for `idle_after` seconds are spilled, and after `expire_after` seconds (or
+    once their `is_alive` check has failed for `disconnect_grace` seconds, as
+    a dropped connection may come back) their artifacts are deleted.
+    """
+
+    def __init__(self, spill_dir: str = None, memory_limit: int = 64 * 1024 * 1024,
+                 spill_threshold: int = 256 * 1024, idle_after: float = 600.0,
+                 expire_after: float = 24 * 3600.0, disconnect_grace: float = 120.0,
+                 reap_interval: float = 30.0, metrics=None):
+        # A directory of our own is deleted on close; a given one is only emptied of our files
+        self._tempdir = None if spill_dir else tempfile.TemporaryDirectory(prefix="mara-artifacts-")
+        self.spill_dir = spill_dir or self._tempdir.name
+        self.memory_limit = memory_limit
+        self.spill_threshold = spill_threshold
+        self.idle_after = idle_after
+        self.expire_after = expire_after
+        self.disconnect_grace = disconnect_grace
+        self.reap_interval = reap_interval
+        self.metrics = metrics
+
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> _Session
+        self._memory = OrderedDict()  # key -> raw bytes, least recently used first
+        self._memory_bytes = 0
+        self._disk = {}  # key -> (path, compressed size)
+        self._refs = {}  # key -> ArtifactRef
+        self._reaper = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def put(self, session_id: str, name: str, value) -> ArtifactRef:
+        """Store `value` (str, bytes, or a JSON-serializable list or dict) under `name`.
+
+        Replaces the session's previous artifact of the same name.
+        """
+        kind, data = _encode(value)
+        ref = ArtifactRef(session_id, name, uuid.uuid4().hex, kind, len(data))
+        with self._lock:
+            session = self._session(session_id)
+            previous = session.artifacts.get(name)
+            session.artifacts[name] = ref
+            self._refs[ref.key] = ref
+            if previous is not None:
+                self._delete(previous.key)
+            if len(data) >= self.spill_threshold:
+                self._write(ref, data)
+            else:
+                self._memory[ref.key] = data
+                self._memory_bytes += len(data)
+                self._enforce_limit()
+        self._ensure_reaper()
+        return ref
+
+    def get(self, ref: ArtifactRef):
+        """Return the artifact's value, or None if it has been evicted."""
+        with self._lock:
+            data = self._memory.get(ref.key)
+            if data is not None:
+                self._memory.move_to_end(ref.key)
+            elif ref.key not in self._disk:
+                return None
+            session = self._sessions.get(ref.session_id)
+            if session is not None:
+                session.last_seen = time.monotonic()
+        if data is None:
+            data = self._read(ref)
+            if data is None:
+                return None
+        return _decode(ref.kind, data)
+
+    def touch(self, session_id: str, is_alive=None) -> None:
+        """Mark the session as active; `is_alive` reports when it has gone away."""
+        with self._lock:
+            session = self._session(session_id)
+            if is_alive is not None:
+                session.is_alive = is_alive
+
+    def clear_session(self, session_id: str) -> None:
+        """Delete every artifact of the session, e.g. before a new run; its `is_alive` check stays."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            for ref in session.artifacts.values():
+                self._delete(ref.key)
+            session.artifacts = {}
+            # Also clears blobs orphaned by a failed delete
+            shutil.rmtree(os.path.join(self.spill_dir, session_id), ignore_errors=True)
+
+    def drop_session(self, session_id: str) -> None:
+        """Delete every artifact of the session and forget it."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return
+            for ref in session.artifacts.values():
+                self._delete(ref.key)
+        # Also clears blobs orphaned by a failed delete
+        shutil.rmtree(os.path.join(self.spill_dir, session_id), ignore_errors=True)
+        self._incr("artifacts.sessions_dropped")
+
+    def usage(self, session_id: str = None) -> dict:
+        """Bytes held in memory and on disk, per session (or for one session)."""
+        with self._lock:
+            sessions = (
+                {session_id: self._sessions[session_id]} if session_id in self._sessions
+                else {} if session_id is not None
+                else dict(self._sessions)
+            )
+            report = {
+                sid: {
+                    "artifacts": len(session.artifacts),
+                    "memory_bytes": sum(len(self._memory.get(ref.key, b"")) for ref in session.artifacts.values()),
+                    "disk_bytes": sum(self._disk.get(ref.key, (None, 0))[1] for ref in session.artifacts.values()),
+                }
+                for sid, session in sessions.items()
+            }
+        if session_id is not None:
+            return report.get(session_id, {"artifacts": 0, "memory_bytes": 0, "disk_bytes": 0})
+        return report
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return self._memory_bytes
+
+    def close(self) -> None:
+        """Delete every artifact and the spilled files; the store is empty afterwards."""
+        with self._lock:
+            self._closed = True
+            session_ids = list(self._sessions)
+        for session_id in session_ids:
+            self.drop_session(session_id)
+        self._sweep()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+        atexit.unregister(self.close)
+
+    def reap(self) -> None:
+        """Spill idle sessions to disk and drop ones gone past the grace period or expired."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [(sid, session.last_seen, session.is_alive) for sid, session in self._sessions.items()]
+        for sid, last_seen, is_alive in candidates:
+            idle = now - last_seen
+            try:
+                alive = is_alive() if is_alive is not None else True
+            except Exception as e:
+                logging.error(f"Liveness check failed for session {sid}: {str(e)}")
+                alive = True
+            with self._lock:
+                session = self._sessions.get(sid)
+                if session is None:
+                    continue
+                if alive:
+                    session.gone_since = None
+                elif session.gone_since is None:
+                    session.gone_since = now
+                gone_for = now - session.gone_since if session.gone_since is not None else 0
+            if (not alive and gone_for >= self.disconnect_grace) or idle >= self.expire_after:
+                self.drop_session(sid)
+            elif idle >= self.idle_after:
+                with self._lock:
+                    session = self._sessions.get(sid)
+                    for ref in list(session.artifacts.values()) if session else []:
+                        self._spill(ref)
+        self._sweep()
+
+    def _sweep(self):
+        """Delete spilled files no artifact points to, e.g. left by a failed delete."""
+        try:
+            listing = [
+                (entry.name, [f.name for f in os.scandir(entry.path)])
+                for entry in os.scandir(self.spill_dir) if entry.is_dir()
+            ]
+        except OSError:
+            return
+        for session_id, names in listing:
+            # Under the lock, so a put() can't write into a directory being removed
+            with self._lock:
+                if session_id not in self._sessions:
+                    shutil.rmtree(os.path.join(self.spill_dir, session_id), ignore_errors=True)
+                    continue
+                for name in names:
+                    if name[:-len(".z")] not in self._disk:
+                        try:
+                            os.remove(os.path.join(self.spill_dir, session_id, name))
+                        except OSError:
+                            pass
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+        session.last_seen = time.monotonic()
+        return session
+
+    def _enforce_limit(self):
+        """Spill least recently used blobs until memory is under the ceiling."""
+        while self._memory_bytes > self.memory_limit and self._memory:
+            if not self._spill(self._refs[next(iter(self._memory))]):
+                break
+
+    def _spill(self, ref) -> bool:
+        data = self._memory.get(ref.key)
+        if data is None:
+            return True
+        if not self._write(ref, data):
+            # Keep it in memory rather than lose it
+            return False
+        del self._memory[ref.key]
+        self._memory_bytes -= len(data)
+        self._incr("artifacts.spilled")
+        return True
+
+    def _write(self, ref, data) -> bool:
+        path = self._path(ref)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = zlib.compress(data, 6)
+            with open(path, "wb") as f:
+                f.write(compressed)
+        except OSError as e:
+            logging.error(f"Could not spill artifact {ref.name} for session {ref.session_id}: {str(e)}")
+            if ref.key not in self._memory:
+                self._memory[ref.key] = data
+                self._memory_bytes += len(data)
+            return False
+        self._disk[ref.key] = (path, len(compressed))
+        return True
+
+    def _read(self, ref):
+        try:
+            with open(self._path(ref), "rb") as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            logging.error(f"Could not load artifact {ref.name} for session {ref.session_id}: {str(e)}")
+            return None
+
+    def _delete(self, key):
+        self._refs.pop(key, None)
+        data = self._memory.pop(key, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+        path, _ = self._disk.pop(key, (None, 0))
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.error(f"Could not delete spilled artifact {path}: {str(e)}")
+
+    def _path(self, ref):
+        return os.path.join(self.spill_dir, ref.session_id, f"{ref.key}.z")
+
+    def _incr(self, name):
+        if self.metrics is not None:
+            self.metrics.incr(name)
+
+    def _ensure_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_forever, name="artifact-reaper", daemon=True
+            )
+        self._reaper.start()
+
+    def _reap_forever(self):
+        while not self._closed:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logging.error(f"Artifact reaper error: {str(e)}")
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return "bytes", value
+    if isinstance(value, str):
+        return "text", value.encode("utf-8")
+    return "json", json.dumps(value).encode("utf-8")
+
+
+def _decode(kind, data):
+    if kind == "bytes":
+        return data
+    if kind == "text":
+        return data.decode("utf-8")
+    return json.loads(data.decode("utf-8"))
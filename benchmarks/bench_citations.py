@@ -0,0 +1,60 @@
+"""Synthesis prompt size with per-iteration bibliographies versus one merged bibliography.
+
+Builds research results whose Works Cited sections overlap, as repeated
+research iterations do, and reports the tokens of the research section sent
+to the synthesis both ways, plus the time to index the results.
+
+Run from the repository root:
+    python benchmarks/bench_citations.py [iterations]
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from citations import CitationIndex  # noqa: E402
+from estimator import estimate_tokens  # noqa: E402
+
+AUTHORS = ["Smith", "Doe", "Lee", "Garcia", "Nguyen", "Müller", "Okafor", "Tanaka", "Rossi", "Kowalski"]
+
+
+def make_source(n):
+    author = AUTHORS[n % len(AUTHORS)]
+    year = 2000 + n % 24
+    doi = f" https://doi.org/10.{1000 + n}/bird.{n}" if n % 3 else ""
+    return f"{author}, {chr(65 + n % 26)}. ({year}). Study {n} of woodpecker habitat. Journal of Birds, {n % 40}(2), 1-20.{doi}"
+
+
+def make_research(iterations, sources_per_iteration=15, pool=40, seed=7):
+    rng = random.Random(seed)
+    sources = [make_source(n) for n in range(pool)]
+    results = []
+    for i in range(iterations):
+        cited = rng.sample(sources, sources_per_iteration)
+        body = " ".join(f"Finding {j} ({s.split(',')[0]}, {s.split('(')[1][:4]})." for j, s in enumerate(cited))
+        works_cited = "\n".join(f"* {s}" for s in cited)
+        results.append(f"Title: Aspect {i}\n{body}\n\n7. Works Cited\n{works_cited}")
+    return results
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    research = make_research(iterations)
+
+    before = estimate_tokens("\n\n".join(research))
+    index = CitationIndex()
+    bodies = [index.absorb(text) for text in research]
+    after = estimate_tokens("\n\n".join(bodies)) + estimate_tokens(index.render())
+
+    per_run = timeit.timeit(lambda: [CitationIndex().absorb(text) for text in research], number=50) / 50
+    print(f"{iterations} research results, {len(index)} distinct sources, {index.duplicates} duplicates dropped")
+    print(f"synthesis research tokens: {before:,} with per-iteration bibliographies, {after:,} merged "
+          f"({100 * (before - after) / before:.0f}% smaller)")
+    print(f"indexing: {per_run * 1e3:.2f} ms per run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Pooled, warmed model clients versus a new client per call, against a local stub.
+
+For each transport, starts benchmarks/stub_gemini.py's server and makes the
+same concurrent calls twice: once through a warmed ClientPool, and once
+with a fresh client (and so a fresh connection) per call. Reports wall
+time, mean call latency, connections opened and the pool's setup time.
+
+Run from the repository root:
+    python benchmarks/bench_client_pool.py [calls] [latency_seconds]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from client_pool import TRANSPORTS, ClientPool, count_tokens_ping, gemini_client_factory  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from stub_gemini import start_stub  # noqa: E402
+
+WORKERS = 8
+
+
+def run_calls(call, calls):
+    latencies = []
+
+    def timed(i):
+        started = time.monotonic()
+        call(f"Prompt {i}")
+        latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(WORKERS) as executor:
+        list(executor.map(timed, range(calls)))
+    return time.monotonic() - started, sum(latencies) / len(latencies)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    print(f"{calls} calls, {WORKERS} concurrent, stub latency {latency * 1000:.0f} ms")
+
+    for transport in TRANSPORTS:
+        stub = start_stub(transport, latency=latency)
+        factory = gemini_client_factory("stub", "stub-key", transport=transport, endpoint=stub.endpoint)
+
+        metrics = Metrics()
+        pool = ClientPool(factory, size=2, max_concurrent=4, warm_up=count_tokens_ping, metrics=metrics)
+        pool.start()
+        while pool.stats()["clients"] < pool.size:
+            time.sleep(0.01)
+        wall, mean = run_calls(pool.generate_content, calls)
+        stats = pool.stats()
+        setup = metrics.summary("client_pool.setup_seconds")
+        print(f"{transport:<5} pooled  wall {wall:6.2f}s  mean {mean * 1000:7.1f} ms  "
+              f"connections {stats['connections']:4d}  "
+              f"reused {metrics.get('client_pool.calls.reused_connection')}/{calls}  "
+              f"setup p50 {setup['p50'] * 1000:.1f} ms")
+        pool.close()
+
+        opened = []
+
+        def fresh(prompt):
+            client = factory()
+            try:
+                client.model.generate_content(prompt)
+                opened.append(client.connections)
+            finally:
+                client.close()
+
+        wall, mean = run_calls(fresh, calls)
+        print(f"{transport:<5} fresh   wall {wall:6.2f}s  mean {mean * 1000:7.1f} ms  connections {sum(opened):4d}")
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
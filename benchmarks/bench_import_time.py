@@ -0,0 +1,92 @@
+"""Import-time profile of the app's cold start, built on `python -X importtime`.
+
+STARTUP lists what streamlit_app.py imports at module level, which runs
+before the first widget appears. DEFERRED lists the modules the app
+imports on first use instead, and where. Each set is imported in fresh
+interpreters, and the script reports:
+- the startup total;
+- the slowest startup imports;
+- what each deferred import costs on top of startup.
+
+Keep both lists in step with the app's imports.
+
+Run from the repository root:
+    python benchmarks/bench_import_time.py [repeats]
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = [
+    "streamlit", "logging", "importlib", "math", "os", "time", "queue", "threading", "contextvars",
+    "concurrent.futures", "functools", "streamlit.runtime", "streamlit.runtime.scriptrunner",
+    "streamlit.runtime.scriptrunner.script_requests",
+    "applog", "artifacts", "cancellation", "citations", "client_pool", "estimator", "hedging", "metrics",
+    "planner", "progress", "scheduler", "shared_state", "speculation", "templates", "text_utils",
+]
+
+DEFERRED = [
+    ("google.generativeai", "client pool, first model client"),
+    ("google.ai.generativelanguage", "client pool, first model client"),
+    ("google.auth.api_key", "client pool, first model client"),
+    ("grpc", "client pool, gRPC transport"),
+    ("requests.adapters", "client pool, REST transport"),
+    ("fpdf", "first PDF download"),
+    ("streamlit_extras.st_keyup", "\"Start early\" mode"),
+]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_times(modules, repeats):
+    """{module: cumulative microseconds} for top-level imports, best of `repeats` fresh runs.
+
+    Modules the bare interpreter already imports (site, encodings) are left out.
+    """
+    code = "; ".join(f"import {name}" for name in modules) or "pass"
+    best = {}
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        for line in result.stderr.splitlines():
+            match = _LINE.match(line)
+            if match and not match.group(3):
+                name, cumulative = match.group(4), int(match.group(2))
+                best[name] = min(cumulative, best.get(name, cumulative))
+    if modules:
+        for name in import_times([], 1):
+            best.pop(name, None)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    startup = STARTUP
+
+    times = import_times(startup, repeats)
+    total = sum(times.values())
+    print(f"Startup imports ({len(startup)} modules): {total / 1000:8.1f} ms  (best of {repeats})")
+    print("Slowest startup imports (cumulative ms):")
+    for name, micros in sorted(times.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {name:<40} {micros / 1000:8.1f}")
+
+    print("Deferred until first use (ms on top of startup):")
+    for module, used_by in DEFERRED:
+        # Only what the module newly imports; anything startup already loaded is free
+        try:
+            extra = import_times(startup + [module], repeats)
+        except subprocess.CalledProcessError:
+            print(f"  {module:<40} {'not installed':>8}  ({used_by})")
+            continue
+        cost = sum(micros for name, micros in extra.items() if name not in times)
+        print(f"  {module:<40} {cost / 1000:8.1f}  ({used_by})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Compare the verbose and compact prompt templates.
+
+Reports template overhead tokens per prompt, and the cost of rendering a
+compiled template next to calling str.format on its text (the two should
+match: rendering is str.format_map once the template is validated).
+
+Run from the repository root:
+    python benchmarks/bench_templates.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templates import VARIANTS, load_templates  # noqa: E402
+
+SAMPLE_VALUES = {
+    "topic": "Is the Ivory-billed woodpecker really extinct?",
+    "summary": "A short summary 🐦 with a few emojis 🌲.",
+    "refined_prompt": "Assess the evidence for the continued existence of the Ivory-billed woodpecker. " * 3,
+    "framework": "POINT_1.1:Habitat|Remaining old-growth forest\n" * 40,
+    "previous_analysis": "Title: Habitat analysis\n" + "Findings (Smith, 2020). " * 400,
+    "current_aspect": "Habitat",
+    "iteration": 2,
+    "research_results": "Title: Habitat analysis\n" + "Findings (Smith, 2020). " * 1200,
+    "bibliography": "Works Cited\n\n" + "* Smith, J. (2020). Woodpeckers. Nature.\n" * 30,
+    "question": "What evidence would settle the question?",
+    "final_analysis": "Title: Final\n" + "Conclusions (Smith, 2020). " * 600,
+    "new_research": "Title: Follow-up evidence\n" + "New findings (Doe, 2021). " * 300,
+}
+
+
+def main():
+    templates = {variant: load_templates(variant)[0] for variant in VARIANTS}
+
+    print("Template overhead (tokens)")
+    print(f"{'prompt':<20}" + "".join(f"{variant:>10}" for variant in VARIANTS))
+    for name in VARIANTS["verbose"]:
+        print(f"{name:<20}" + "".join(f"{templates[v][name].overhead_tokens:>10}" for v in VARIANTS))
+
+    print("\nRender time per call (microseconds)")
+    for variant in VARIANTS:
+        for name, template in templates[variant].items():
+            text = template.text
+            compiled = timeit.timeit(lambda: template.render(**SAMPLE_VALUES), number=2000) / 2000
+            formatted = timeit.timeit(lambda: text.format(**SAMPLE_VALUES), number=2000) / 2000
+            print(f"{variant:<8} {name:<20} compiled {compiled * 1e6:7.1f}   str.format {formatted * 1e6:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Micro-benchmarks for text_utils against the helpers it replaced.
+
+Times each helper over a batch of synthetic research blocks and prints
+microseconds per call for the previous inline implementation and the
+text_utils one.
+
+Run from the repository root:
+    python benchmarks/bench_text_utils.py [blocks]
+"""
+
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import text_utils  # noqa: E402
+
+
+def legacy_count_emojis(text):
+    emoji_pattern = re.compile("["
+        u"\U0001F600-\U0001F64F"
+        u"\U0001F300-\U0001F5FF"
+        u"\U0001F680-\U0001F6FF"
+        u"\U0001F1E0-\U0001F1FF"
+        u"\U00002702-\U000027B0"
+        u"\U000024C2-\U0001F251"
+        "]+", flags=re.UNICODE)
+    return len(emoji_pattern.findall(text))
+
+
+def legacy_get_title_emoji(title):
+    keywords = dict(text_utils.TITLE_EMOJIS)  # rebuilt on every call, as before
+    title_lower = title.lower()
+    for keyword, emoji in keywords.items():
+        if keyword in title_lower:
+            return f"{emoji} "
+    return "🔍 "
+
+
+def legacy_clean_fact(fact):
+    fact = fact.strip().strip('"')
+    return re.sub(r'^(Fact:|Here\'s a fact:|The fact is:?)', '', fact, flags=re.IGNORECASE).strip()
+
+
+def legacy_split_research_block(research, fallback_title):
+    lines = research.strip().split('\n', 1)
+    title = re.sub(r'^[#*\s]*(Title:)?', '', lines[0], flags=re.IGNORECASE).strip(' *')
+    body = lines[1].strip() if len(lines) > 1 else ""
+    return (title or fallback_title), body
+
+
+WORDS = ("habitat forest sighting woodpecker recording survey population decline "
+         "logging swamp evidence expert report museum specimen").split()
+TITLE_WORDS = ["Habitat", "Acoustic", "Sightings", "Population", "Range", "Specimen", "Policy", "Outlook",
+               "Analysis", "Review", "Conservation", "Evidence"]
+EMOJIS = ["🐦", "🌲", "📊", "🔍", "🇺🇸", "👍🏽", "❤️"]
+
+
+def make_blocks(count, seed=7):
+    rng = random.Random(seed)
+    blocks = []
+    for _ in range(count):
+        title = " ".join(rng.sample(TITLE_WORDS, 2))
+        body = " ".join(rng.choice(WORDS) for _ in range(300))
+        blocks.append(f"## Title: {title}\n{body} {rng.choice(EMOJIS)} (Smith, 2020).")
+    return blocks
+
+
+def make_framework(points=40):
+    lines = ["Refined Prompt: study woodpeckers", "---"]
+    for section in range(1, 6):
+        lines.append(f"{section}. Section {section}:")
+        for point in range(points // 5):
+            lines.append(f"- Point {point}: description of point {point}")
+            lines.append(f"    * Detail {point}: supporting detail")
+    return "\n".join(lines)
+
+
+def bench(label, legacy, current, inputs):
+    legacy_s = timeit.timeit(lambda: [legacy(x) for x in inputs], number=3) / (3 * len(inputs))
+    current_s = timeit.timeit(lambda: [current(x) for x in inputs], number=3) / (3 * len(inputs))
+    print(f"{label:<24} legacy {legacy_s * 1e6:8.2f}   text_utils {current_s * 1e6:8.2f}   "
+          f"x{legacy_s / current_s:5.1f}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    blocks = make_blocks(count)
+    titles = [text_utils.split_research_block(b, "")[0] for b in blocks]
+    facts = [f'"Fact: {b[:200]}"' for b in blocks]
+
+    print(f"{count} research blocks, microseconds per call")
+    bench("count_emojis", legacy_count_emojis, text_utils.count_emojis, blocks)
+    bench("get_title_emoji", legacy_get_title_emoji, text_utils.get_title_emoji, titles)
+    bench("clean_fact", legacy_clean_fact, text_utils.clean_fact, facts)
+    bench("split_research_block", lambda b: legacy_split_research_block(b, ""),
+          lambda b: text_utils.split_research_block(b, ""), blocks)
+
+    framework = make_framework()
+    per_call = timeit.timeit(lambda: text_utils.process_framework_output(framework), number=200) / 200
+    print(f"{'process_framework_output':<24} text_utils {per_call * 1e6:8.2f} ({framework.count(chr(10)) + 1} lines)")
+
+
+if __name__ == "__main__":
+    main()
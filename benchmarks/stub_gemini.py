@@ -0,0 +1,103 @@
+"""A local stand-in for the Gemini API, for exercising the client pool.
+
+Serves generateContent and countTokens over gRPC or REST (plain HTTP/1.1
+with keep-alive) and answers every prompt with a fixed text after an
+optional delay. It counts the connections it accepts over REST, so
+connection reuse can be checked from the server side too.
+
+    stub = start_stub("grpc", latency=0.05)
+    factory = gemini_client_factory("stub", "key", transport="grpc", endpoint=stub.endpoint)
+    ...
+    stub.stop()
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+
+def _response(glm, text):
+    return glm.GenerateContentResponse(candidates=[glm.Candidate(
+        content=glm.Content(parts=[glm.Part(text=text)], role="model"),
+        finish_reason=glm.Candidate.FinishReason.STOP,
+    )])
+
+
+class StubServer:
+    def __init__(self, endpoint, stop):
+        self.endpoint = endpoint
+        self.connections = 0
+        self.requests = 0
+        self._stop = stop
+
+    def stop(self):
+        self._stop()
+
+
+def start_stub(transport: str = "grpc", latency: float = 0.0, text: str = "Stub response.") -> StubServer:
+    """Serve on an ephemeral localhost port; `endpoint` is for gemini_client_factory."""
+    from google.ai import generativelanguage as glm
+
+    if transport == "grpc":
+        import grpc
+
+        server = grpc.server(ThreadPoolExecutor(max_workers=32))
+        stub = StubServer(None, lambda: server.stop(0))
+
+        def generate(request, context):
+            stub.requests += 1
+            time.sleep(latency)
+            return _response(glm, text)
+
+        def count_tokens(request, context):
+            stub.requests += 1
+            return glm.CountTokensResponse(total_tokens=1)
+
+        server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(SERVICE, {
+            "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                generate, request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize),
+            "CountTokens": grpc.unary_unary_rpc_method_handler(
+                count_tokens, request_deserializer=glm.CountTokensRequest.deserialize,
+                response_serializer=glm.CountTokensResponse.serialize),
+        }),))
+        port = server.add_insecure_port("localhost:0")
+        server.start()
+        stub.endpoint = f"http://localhost:{port}"
+        return stub
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep connections open between requests
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def setup(self):
+            super().setup()
+            stub.connections += 1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            stub.requests += 1
+            if self.path.endswith(":countTokens"):
+                body = json.dumps({"totalTokens": 1})
+            else:
+                time.sleep(latency)
+                body = glm.GenerateContentResponse.to_json(_response(glm, text))
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("localhost", 0), Handler)
+    server.daemon_threads = True
+    stub = StubServer(f"http://localhost:{server.server_address[1]}", lambda: (server.shutdown(), server.server_close()))
+    threading.Thread(target=server.serve_forever, name="stub-gemini", daemon=True).start()
+    return stub
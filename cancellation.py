@@ -0,0 +1,243 @@
+"""Cooperative cancellation of in-flight LLM work.
+
+Every analysis run gets a CancelToken tied to a run ID. The pipeline checks
+the token between stages, and callers waiting on worker threads stop waiting
+(and drop the result) as soon as the token fires. A token can also watch an
+`interrupted` check, e.g. whether its script run has been asked to rerun, so
+a wait notices a topic change without having to return to the script first.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError as FutureCancelled
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class CancelledError(BaseException):
+    """Raised when a run has been cancelled.
+
+    Derives from BaseException (like asyncio.CancelledError) so the
+    `except Exception` blocks around each generation call don't swallow it.
+    """
+
+
+class CancelToken:
+    """A one-shot cancellation flag for a single run.
+
+    `interrupted()`, if given, returns a reason to cancel (or None); it is
+    polled at every checkpoint and by every wait on the token.
+    """
+
+    def __init__(self, run_id: str, session_id: str = None, interrupted=None):
+        self.run_id = run_id
+        self.session_id = session_id
+        self.reason = None
+        self._interrupted = interrupted
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Cancel the run. Returns False if it was already cancelled."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Cancel callback failed for run {self.run_id}: {str(e)}")
+        return True
+
+    def add_callback(self, callback) -> None:
+        """Call `callback()` on cancellation (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def poll(self) -> bool:
+        """Cancel the run if its `interrupted` check fires. Returns True if cancelled."""
+        if not self._event.is_set() and self._interrupted is not None:
+            try:
+                reason = self._interrupted()
+            except Exception as e:
+                logging.error(f"Interrupt check failed for run {self.run_id}: {str(e)}")
+                reason = None
+            if reason:
+                self.cancel(reason)
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """Checkpoint between pipeline stages."""
+        if self.poll():
+            raise CancelledError(f"Run {self.run_id} cancelled: {self.reason}")
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until cancelled or `timeout` elapses. Returns True if cancelled."""
+        return self._event.wait(timeout)
+
+    def sleep(self, seconds: float, poll_interval: float = 0.1) -> None:
+        """Sleep for `seconds`, raising CancelledError as soon as the run is cancelled or interrupted."""
+        deadline = time.monotonic() + seconds
+        while True:
+            self.raise_if_cancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._event.wait(min(poll_interval, remaining))
+
+
+def wait_for(future, token: CancelToken = None, poll_interval: float = 0.1):
+    """Wait for `future`, giving up as soon as `token` is cancelled.
+
+    Work that has not started yet is removed from the pool; work already on
+    the wire is left to finish in the background and its result discarded.
+    """
+    if token is None:
+        return future.result()
+
+    token.add_callback(future.cancel)
+    try:
+        while True:
+            token.raise_if_cancelled()
+            try:
+                return future.result(timeout=poll_interval)
+            except FutureTimeout:
+                continue
+            except FutureCancelled:
+                # Pulled from the queue by our own callback
+                token.raise_if_cancelled()
+                raise
+    finally:
+        token.remove_callback(future.cancel)
+
+
+class RunRegistry:
+    """Process-wide map of sessions to their active run.
+
+    Starting a run for a session cancels the one it replaces, and a
+    background reaper cancels runs whose session has been gone for
+    `disconnect_grace` seconds. A browser that drops its connection briefly,
+    or reconnects through another worker, may come back within that time.
+    """
+
+    def __init__(self, metrics=None, reap_interval: float = 2.0, disconnect_grace: float = 60.0):
+        self.metrics = metrics
+        self.reap_interval = reap_interval
+        self.disconnect_grace = disconnect_grace
+        self._lock = threading.Lock()
+        self._runs = {}  # session_id -> CancelToken
+        self._liveness = {}  # run_id -> callable returning False once the session is gone
+        self._gone_since = {}  # run_id -> when its session was first seen gone
+        self._reaper = None
+
+    def start_run(self, session_id: str, is_alive=None, interrupted=None) -> CancelToken:
+        """Create a token for a new run, cancelling the session's previous run.
+
+        `interrupted` is passed on to the token; see CancelToken.
+        """
+        token = CancelToken(uuid.uuid4().hex, session_id, interrupted)
+        with self._lock:
+            previous = self._runs.get(session_id)
+            self._runs[session_id] = token
+            if is_alive is not None:
+                self._liveness[token.run_id] = is_alive
+        if previous is not None:
+            self._cancel(previous, "superseded by a new run")
+        self._incr("runs_started")
+        self._ensure_reaper()
+        return token
+
+    def detach(self, token: CancelToken) -> None:
+        """Let the run outlive its session, e.g. one any worker can show from its ?run= link."""
+        with self._lock:
+            self._liveness.pop(token.run_id, None)
+            self._gone_since.pop(token.run_id, None)
+
+    def cancel_session(self, session_id: str, reason: str) -> bool:
+        """Cancel the session's active run, if any."""
+        with self._lock:
+            token = self._runs.get(session_id)
+        return token is not None and self._cancel(token, reason)
+
+    def finish_run(self, token: CancelToken, completed: bool = False) -> None:
+        """Unregister a run. Runs that did not complete are cancelled."""
+        with self._lock:
+            if self._runs.get(token.session_id) is token:
+                del self._runs[token.session_id]
+            self._liveness.pop(token.run_id, None)
+            self._gone_since.pop(token.run_id, None)
+        if completed:
+            self._incr("runs_completed")
+        else:
+            self._cancel(token, "run ended before completion")
+
+    def active_runs(self) -> int:
+        with self._lock:
+            return len(self._runs)
+
+    def reap(self) -> None:
+        """Cancel runs whose session has been gone too long or whose interrupt check fires."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                (token, self._liveness.get(token.run_id))
+                for token in self._runs.values()
+            ]
+        for token, is_alive in candidates:
+            if token.poll() or is_alive is None:
+                continue
+            try:
+                alive = is_alive()
+            except Exception as e:
+                logging.error(f"Liveness check failed for run {token.run_id}: {str(e)}")
+                continue
+            with self._lock:
+                if alive:
+                    self._gone_since.pop(token.run_id, None)
+                    continue
+                gone_since = self._gone_since.setdefault(token.run_id, now)
+            if now - gone_since >= self.disconnect_grace:
+                self._cancel(token, f"session gone for {now - gone_since:.0f}s")
+
+    def _cancel(self, token: CancelToken, reason: str) -> bool:
+        if token.cancel(reason):
+            logging.info(f"Cancelled run {token.run_id}: {reason}")
+            self._incr("runs_cancelled")
+            return True
+        return False
+
+    def _incr(self, name: str) -> None:
+        if self.metrics is not None:
+            self.metrics.incr(name)
+
+    def _ensure_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_forever, name="run-reaper", daemon=True
+            )
+        self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap()
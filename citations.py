@@ -0,0 +1,143 @@
+"""Citations in model output: parsing, de-duplication and one merged bibliography.
+
+Every research call ends with its own APA "Works Cited". As results arrive,
+that section is split off and its entries merged into a per-run
+CitationIndex, keyed by DOI or by first author, year and title. What goes on
+to later prompts carries no bibliography, and the synthesis and the exports
+get the merged one.
+"""
+
+import re
+import unicodedata
+
+# "Works Cited", "7. Works Cited", "## References:", "**Bibliography**"
+_HEADING = re.compile(
+    r"^[ \t#*_]*(?:\d+[.)]\s*)?(?:works cited|references|bibliography)[ \t:*_]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_BULLET = re.compile(r"^(?:[-*•]|\d+[.)])\s+")
+_DOI = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>]+)", re.IGNORECASE)
+# Authors (Year). Title. Rest
+_APA_ENTRY = re.compile(r"^(?P<authors>.+?)\s*\((?P<year>\d{4}[a-z]?|n\.d\.)[^)]*\)\.?\s*(?P<title>[^.?!]*)")
+# (Smith, 2020), (Smith & Doe, 2020a; Lee et al., n.d.)
+_IN_TEXT = re.compile(r"\(([^()]*?,\s*(?:\d{4}[a-z]?|n\.d\.)[^()]*)\)")
+_IN_TEXT_PART = re.compile(r"^\s*(?:e\.g\.,?\s*|see\s+)?(?P<authors>[^,;]+?),\s*(?P<year>\d{4}[a-z]?|n\.d\.)")
+
+HEADING = "Works Cited"
+
+
+def _fold(text: str) -> str:
+    """Lowercase ASCII letters and digits only, for comparing names and titles."""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _surname(authors: str) -> str:
+    words = _fold(authors.split(",", 1)[0].split("&", 1)[0].replace("et al", "")).split()
+    return words[-1] if words else ""
+
+
+def split_bibliography(text: str):
+    """Split `text` at its last Works Cited heading: (body, [entry, ...])."""
+    if not text:
+        return text, []
+    headings = list(_HEADING.finditer(text))
+    if not headings:
+        return text, []
+    heading = headings[-1]
+    entries = []
+    for line in text[heading.end():].split("\n"):
+        line = _BULLET.sub("", line.strip(), count=1).strip()
+        if line:
+            entries.append(line)
+    return text[:heading.start()].rstrip(), entries
+
+
+def in_text_citations(text: str) -> set:
+    """(surname, year) of each APA in-text citation in `text`."""
+    cited = set()
+    for group in _IN_TEXT.findall(text or ""):
+        for part in group.split(";"):
+            match = _IN_TEXT_PART.match(part)
+            if match:
+                cited.add((_surname(match["authors"]), match["year"].lower()))
+    return cited
+
+
+class CitationIndex:
+    """Works Cited entries of one run, each source listed once."""
+
+    def __init__(self):
+        self._entries = []  # display text, in order first seen
+        self._by_key = {}  # DOI or (surname, year, title) key -> position in _entries
+        self.cited = set()  # (surname, year) cited in the text absorbed so far
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _keys(entry: str) -> list:
+        keys = []
+        doi = _DOI.search(entry)
+        if doi:
+            keys.append("doi:" + doi.group(1).rstrip(".,;)").lower())
+        match = _APA_ENTRY.match(entry)
+        if match:
+            keys.append(f"apa:{_surname(match['authors'])}|{match['year'].lower()}|{_fold(match['title'])[:80]}")
+        return keys or ["text:" + _fold(entry)]
+
+    def add(self, entry: str) -> bool:
+        """Add one entry. Returns False if the source is already listed."""
+        entry = " ".join(entry.split())
+        if not entry:
+            return False
+        if not entry.endswith("."):
+            entry += "."
+        keys = self._keys(entry)
+        known = next((self._by_key[key] for key in keys if key in self._by_key), None)
+        if known is not None:
+            self.duplicates += 1
+            # Keep the more complete copy, e.g. the one with the DOI
+            if len(entry) > len(self._entries[known]):
+                self._entries[known] = entry
+            for key in keys:
+                self._by_key.setdefault(key, known)
+            return False
+        for key in keys:
+            self._by_key[key] = len(self._entries)
+        self._entries.append(entry)
+        return True
+
+    def absorb(self, text: str) -> str:
+        """Index the citations in `text` and return it without its Works Cited section."""
+        body, entries = split_bibliography(text)
+        for entry in entries:
+            self.add(entry)
+        self.cited |= in_text_citations(body)
+        return body
+
+    def unresolved(self) -> set:
+        """In-text citations with no matching entry."""
+        listed = set()
+        for entry in self._entries:
+            match = _APA_ENTRY.match(entry)
+            if match:
+                listed.add((_surname(match["authors"]), match["year"].lower()))
+        return self.cited - listed
+
+    def entries(self) -> list:
+        """Entries in APA order (alphabetical)."""
+        return sorted(self._entries, key=_fold)
+
+    def render(self) -> str:
+        """The merged bibliography as a Works Cited section, or "" if empty."""
+        if not self._entries:
+            return ""
+        return HEADING + "\n\n" + "\n".join(f"* {entry}" for entry in self.entries())
+
+    def finalize(self, text: str) -> str:
+        """`text` with its own Works Cited merged into the index and replaced by the full bibliography."""
+        body = self.absorb(text)
+        bibliography = self.render()
+        return f"{body}\n\n{bibliography}" if bibliography else body
@@ -0,0 +1,342 @@
+"""Pool of warmed, reusable Gemini clients shared by every session.
+
+Each pooled client owns its connection: a gRPC channel with keep-alive
+pings, or a REST session that keeps its HTTP connections open. Clients are
+created and warmed with a cheap count_tokens call in the background, so a
+session's first call doesn't pay for connection setup and the TLS
+handshake. A client serves at most `max_concurrent` calls at once, and
+calls go to the least busy client. Idle clients are health-checked
+periodically; one that fails its check, or several calls in a row, is
+replaced.
+"""
+
+import logging
+import threading
+import time
+
+GRPC = "grpc"
+REST = "rest"
+TRANSPORTS = (GRPC, REST)
+
+GRPC_SERVICE_HOST = "generativelanguage.googleapis.com"
+
+
+class PoolExhausted(Exception):
+    """Raised when no client frees up within the acquire timeout."""
+
+
+class PooledClient:
+    """One model client and the connection it owns.
+
+    `connections` returns how many connections the client has opened so
+    far, so the pool can tell a call that reused one from a call that had
+    to connect.
+    """
+
+    def __init__(self, model, close=None, connections=None):
+        self.model = model
+        self._close = close
+        self._connections = connections
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0  # consecutive failed calls or checks
+        self.last_used = time.monotonic()
+
+    @property
+    def connections(self) -> int:
+        return self._connections() if self._connections is not None else 0
+
+    def close(self) -> None:
+        if self._close is not None:
+            try:
+                self._close()
+            except Exception as e:
+                logging.error(f"Error closing model client: {str(e)}")
+
+
+def count_tokens_ping(model) -> None:
+    """Warm-up and health check: a count_tokens call costs no generation quota."""
+    model.count_tokens("ping")
+
+
+def _parse_endpoint(endpoint: str):
+    """(host, secure) for "host[:port]", "https://host" or "http://localhost:8080"."""
+    if not endpoint:
+        return None, True
+    if "://" in endpoint:
+        scheme, _, host = endpoint.partition("://")
+        return host.rstrip("/"), scheme != "http"
+    return endpoint, True
+
+
+def gemini_client_factory(model_name: str, api_key: str, transport: str = GRPC, endpoint: str = None,
+                          keepalive_seconds: float = 60.0, max_concurrent: int = 4):
+    """Make a factory for PooledClients, each a GenerativeModel with its own connection.
+
+    `endpoint` overrides Google's, e.g. "http://localhost:8080" for a local
+    stub server ("http://" means no TLS). gRPC channels ping every
+    `keepalive_seconds` while calls are in flight to detect dead connections;
+    between calls the pool's health checks keep them warm.
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {transport!r}; expected one of {', '.join(TRANSPORTS)}")
+    host, secure = _parse_endpoint(endpoint)
+
+    def make():
+        # The SDK is imported here, off the startup path
+        import google.generativeai as genai
+        from google.ai import generativelanguage as glm
+        from google.ai.generativelanguage_v1beta.services.generative_service import transports
+        from google.auth.api_key import Credentials
+
+        credentials = Credentials(api_key)
+        opened = [0]
+        if transport == GRPC:
+            import grpc
+
+            options = [
+                ("grpc.keepalive_time_ms", int(keepalive_seconds * 1000)),
+                ("grpc.keepalive_timeout_ms", 20000),
+                ("grpc.keepalive_permit_without_calls", 0),
+                ("grpc.max_receive_message_length", -1),
+            ]
+            target = host or GRPC_SERVICE_HOST
+            if secure:
+                channel = transports.GenerativeServiceGrpcTransport.create_channel(
+                    target, credentials=credentials, options=options
+                )
+            else:
+                channel = grpc.insecure_channel(target, options=options)
+
+            def on_state(state):
+                if state == grpc.ChannelConnectivity.READY:
+                    opened[0] += 1
+
+            channel.subscribe(on_state)
+            rpc_transport = transports.GenerativeServiceGrpcTransport(host=target, channel=channel)
+            connections = lambda: opened[0]  # noqa: E731
+        else:
+            from requests.adapters import HTTPAdapter
+
+            rpc_transport = transports.GenerativeServiceRestTransport(
+                host=host or GRPC_SERVICE_HOST, credentials=credentials,
+                url_scheme="https" if secure else "http"
+            )
+            # One persistent connection per concurrent call
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent)
+            rpc_transport._session.mount("https://" if secure else "http://", adapter)
+
+            def connections():
+                pools = adapter.poolmanager.pools
+                return sum(getattr(pools.get(key), "num_connections", 0) for key in list(pools.keys()))
+
+        model = genai.GenerativeModel(model_name)
+        # The SDK binds a model to its client lazily; bind it to this one instead. This and
+        # the REST transport's _session are SDK internals, as of google-generativeai 0.3.2
+        # (pinned in requirements.txt); tests/test_client_pool.py checks both
+        model._client = glm.GenerativeServiceClient(transport=rpc_transport)
+        return PooledClient(model, close=rpc_transport.close, connections=connections)
+
+    return make
+
+
+class ClientPool:
+    """Up to `size` clients, each serving at most `max_concurrent` calls at once.
+
+    `factory()` returns a PooledClient. `warm_up(model)` makes a cheap call;
+    it runs on each new background client and as the periodic health check.
+    """
+
+    def __init__(self, factory, size: int = 2, max_concurrent: int = 4, warm_up=None,
+                 health_interval: float = 120.0, max_failures: int = 3,
+                 acquire_timeout: float = 300.0, metrics=None):
+        self.factory = factory
+        self.size = max(1, size)
+        self.max_concurrent = max(1, max_concurrent)
+        self.warm_up = warm_up
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.acquire_timeout = acquire_timeout
+        self.metrics = metrics
+        self._cond = threading.Condition()
+        self._clients = []
+        self._pending = 0  # clients being created
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Fill the pool and start health checks in a background thread."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._maintain, name="client-pool", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._cond:
+            clients, self._clients = self._clients, []
+            self._cond.notify_all()
+        for client in clients:
+            client.close()
+
+    def generate_content(self, *args, **kwargs):
+        """model.generate_content on the least busy client."""
+        client = self.acquire()
+        connections = client.connections
+        ok = False
+        try:
+            response = client.model.generate_content(*args, **kwargs)
+            ok = True
+            return response
+        finally:
+            reused = client.connections == connections
+            self._incr("client_pool.calls.reused_connection" if reused else "client_pool.calls.new_connection")
+            self.release(client, ok)
+
+    def acquire(self, timeout: float = None) -> PooledClient:
+        """Reserve a slot on the least busy client, creating a client if the pool has room."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                client = min(
+                    (c for c in self._clients if c.in_flight < self.max_concurrent),
+                    key=lambda c: c.in_flight, default=None
+                )
+                if client is not None:
+                    client.in_flight += 1
+                    return client
+                if len(self._clients) + self._pending < self.size:
+                    self._pending += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._incr("client_pool.exhausted")
+                    raise PoolExhausted(f"No model client free after {timeout:.0f}s")
+                self._cond.wait(remaining)
+
+        # A call is waiting, so it connects on first use instead of warming up first
+        return self._create(warm=False, reserve=True)
+
+    def release(self, client: PooledClient, ok: bool = True) -> None:
+        with self._cond:
+            client.in_flight -= 1
+            client.calls += 1
+            client.last_used = time.monotonic()
+            client.failures = 0 if ok else client.failures + 1
+            retire = client.failures >= self.max_failures and client in self._clients
+            if retire:
+                self._clients.remove(client)
+            self._cond.notify_all()
+        if retire:
+            logging.warning(f"Replacing a model client after {client.failures} failed calls")
+            self._incr("client_pool.recycled")
+            self._retire(client)
+
+    def free_slots(self) -> int:
+        """Calls that could start now, on existing clients or ones the pool may still create."""
+        with self._cond:
+            free = sum(self.max_concurrent - c.in_flight for c in self._clients)
+            return free + (self.size - len(self._clients) - self._pending) * self.max_concurrent
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "clients": len(self._clients),
+                "in_flight": sum(c.in_flight for c in self._clients),
+                "calls": sum(c.calls for c in self._clients),
+                "connections": sum(c.connections for c in self._clients),
+            }
+
+    def _create(self, warm: bool, reserve: bool = False) -> PooledClient:
+        """Make a client and add it to the pool, with a slot taken if `reserve`.
+
+        The caller has already counted it in _pending.
+        """
+        started = time.monotonic()
+        try:
+            client = self.factory()
+            if warm and self.warm_up is not None:
+                try:
+                    self.warm_up(client.model)
+                except Exception as e:
+                    # Still usable; a real call will connect or fail on its own
+                    logging.error(f"Model client warm-up failed: {str(e)}")
+                    self._incr("client_pool.warmup_failures")
+        except Exception:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+            raise
+        self._incr("client_pool.created")
+        self._observe("client_pool.setup_seconds", time.monotonic() - started)
+        with self._cond:
+            self._pending -= 1
+            if reserve:
+                client.in_flight += 1
+            self._clients.append(client)
+            self._cond.notify_all()
+        return client
+
+    def _retire(self, client):
+        # Let calls still running on it finish before closing the connection
+        def close_when_idle():
+            while client.in_flight > 0 and not self._closed.is_set():
+                time.sleep(1.0)
+            client.close()
+        threading.Thread(target=close_when_idle, name="client-pool-retire", daemon=True).start()
+
+    def _fill(self):
+        while not self._closed.is_set():
+            with self._cond:
+                if len(self._clients) + self._pending >= self.size:
+                    return
+                self._pending += 1
+            try:
+                self._create(warm=True)
+            except Exception as e:
+                logging.error(f"Could not create a model client: {str(e)}")
+                return
+
+    def _check(self):
+        """Health-check clients that have been idle for a while; replace those that fail."""
+        idle_since = time.monotonic() - self.health_interval / 2
+        with self._cond:
+            idle = [c for c in self._clients if c.in_flight == 0 and c.last_used < idle_since]
+            for client in idle:
+                client.in_flight += 1  # keep calls off it during the check
+        for client in idle:
+            ok = True
+            try:
+                self.warm_up(client.model)
+            except Exception as e:
+                ok = False
+                logging.error(f"Model client health check failed: {str(e)}")
+                self._incr("client_pool.health_failures")
+            with self._cond:
+                client.in_flight -= 1
+                client.last_used = time.monotonic()
+                client.failures = 0 if ok else client.failures + 1
+                retire = not ok and client in self._clients
+                if retire:
+                    self._clients.remove(client)
+                self._cond.notify_all()
+            if retire:
+                self._incr("client_pool.recycled")
+                self._retire(client)
+
+    def _maintain(self):
+        while not self._closed.is_set():
+            self._fill()
+            if self.warm_up is not None:
+                self._check()
+            self._closed.wait(self.health_interval)
+
+    def _incr(self, name):
+        if self.metrics is not None:
+            self.metrics.incr(name)
+
+    def _observe(self, name, value):
+        if self.metrics is not None:
+            self.metrics.observe(name, value)
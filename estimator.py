@@ -0,0 +1,181 @@
+"""Pre-flight cost and latency estimates for an analysis run.
+
+Estimates combine prompt sizes (templates, topic and the expected framework
+size) with the latency and token statistics recorded in Metrics, falling back
+to conservative defaults until enough calls have been observed.
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+# Research loops per depth level (min, max)
+DEPTH_LOOPS = {
+    "Puddle": (1, 1),
+    "Lake": (2, 3),
+    "Ocean": (4, 6),
+    "Mariana Trench": (7, 10),
+}
+
+# (mean latency in seconds, output tokens) until real calls have been observed
+DEFAULT_CALL_PROFILES = {
+    "fact": (4.0, 60),
+    "summary": (4.0, 80),
+    "framework": (15.0, 700),
+    "research": (35.0, 1800),
+    "research_followup": (35.0, 1800),
+    "synthesis": (50.0, 2500),
+    "followup_research": (35.0, 1500),
+    "followup_update": (25.0, 800),
+}
+
+MIN_SAMPLES = 3
+REFINED_PROMPT_TOKENS = 120
+ASPECT_TOKENS = 10
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English prose)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+@dataclass
+class CallProfile:
+    """Expected latency and output size of one call type."""
+    latency: float
+    latency_p90: float
+    output_tokens: int
+
+
+def call_profile(call_type: str, metrics=None) -> CallProfile:
+    """Profile for `call_type` from recorded stats, or the defaults."""
+    stats = metrics.call_stats(call_type) if metrics is not None else None
+    if stats and stats["count"] >= MIN_SAMPLES:
+        return CallProfile(
+            stats["latency_mean"], stats["latency_p90"], int(stats["output_tokens_mean"])
+        )
+    latency, output_tokens = DEFAULT_CALL_PROFILES[call_type]
+    return CallProfile(latency, latency * 1.5, output_tokens)
+
+
+@dataclass
+class RunEstimate:
+    """Predicted size of a run with a fixed number of research loops."""
+    loops: int
+    calls: int
+    prompt_tokens: int
+    output_tokens: int
+    seconds: float
+    seconds_p90: float
+    research_tokens: int  # one follow-up research iteration, prompt + output
+    research_seconds: float
+    synthesis_tokens: int  # the final synthesis, prompt + output
+    synthesis_seconds: float
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+
+def estimate_run(loops: int, topic: str, template_tokens: dict, metrics=None) -> RunEstimate:
+    """Estimate calls, tokens and wall time for a run with `loops` research iterations.
+
+    `template_tokens` maps each call type to the prompt tokens of its template
+    with the inputs left empty.
+    """
+    profiles = {call_type: call_profile(call_type, metrics) for call_type in DEFAULT_CALL_PROFILES}
+    topic_tokens = estimate_tokens(topic)
+    framework_tokens = profiles["framework"].output_tokens
+    research_output = profiles["research"].output_tokens
+
+    # (call type, prompt tokens) for every call in pipeline order
+    steps = [
+        ("fact", template_tokens["fact"] + topic_tokens),
+        ("summary", template_tokens["summary"] + topic_tokens),
+        ("framework", template_tokens["framework"] + topic_tokens),
+        ("research", template_tokens["research"] + REFINED_PROMPT_TOKENS + framework_tokens + ASPECT_TOKENS),
+    ]
+    followup_prompt = template_tokens["research_followup"] + research_output
+    steps += [("research_followup", followup_prompt)] * (loops - 1)
+    synthesis_prompt = (
+        template_tokens["synthesis"] + REFINED_PROMPT_TOKENS + framework_tokens + loops * research_output
+    )
+    steps.append(("synthesis", synthesis_prompt))
+
+    followup = profiles["research_followup"]
+    synthesis = profiles["synthesis"]
+    return RunEstimate(
+        loops=loops,
+        calls=len(steps),
+        prompt_tokens=sum(prompt for _, prompt in steps),
+        output_tokens=sum(profiles[call_type].output_tokens for call_type, _ in steps),
+        seconds=sum(profiles[call_type].latency for call_type, _ in steps),
+        seconds_p90=sum(profiles[call_type].latency_p90 for call_type, _ in steps),
+        research_tokens=followup_prompt + followup.output_tokens,
+        research_seconds=followup.latency,
+        synthesis_tokens=synthesis_prompt + synthesis.output_tokens,
+        synthesis_seconds=synthesis.latency,
+    )
+
+
+def estimate_depth(depth: str, topic: str, template_tokens: dict, metrics=None):
+    """Return (lowest, highest) estimates across the depth's loop range."""
+    low, high = DEPTH_LOOPS[depth]
+    return (
+        estimate_run(low, topic, template_tokens, metrics),
+        estimate_run(high, topic, template_tokens, metrics),
+    )
+
+
+class RunBudget:
+    """Per-run token and wall-time budget. A limit of None means unlimited."""
+
+    def __init__(self, max_tokens: int = None, max_seconds: float = None):
+        self.max_tokens = max_tokens or None
+        self.max_seconds = max_seconds or None
+        self.tokens_used = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def charge(self, tokens: int) -> None:
+        """Record tokens spent by a completed call."""
+        with self._lock:
+            self.tokens_used += tokens
+
+    def fits(self, estimate: RunEstimate) -> bool:
+        """Whether a whole run of this size fits the budget."""
+        return (
+            (self.max_tokens is None or estimate.total_tokens <= self.max_tokens)
+            and (self.max_seconds is None or estimate.seconds <= self.max_seconds)
+        )
+
+    def allows(self, tokens: int, seconds: float, reserve_tokens: int = 0, reserve_seconds: float = 0) -> bool:
+        """Whether another call of this size still fits, keeping `reserve_*` free for later calls."""
+        with self._lock:
+            used = self.tokens_used
+        if self.max_tokens is not None and used + tokens + reserve_tokens > self.max_tokens:
+            return False
+        if self.max_seconds is not None and self.elapsed + seconds + reserve_seconds > self.max_seconds:
+            return False
+        return True
+
+
+def choose_loops(depth: str, topic: str, template_tokens: dict, metrics=None, budget: RunBudget = None) -> int:
+    """Pick the number of research loops for `depth`.
+
+    Without a budget this is a random draw from the depth's range. With one,
+    it is the deepest run whose estimate fits (or the shallowest if none do).
+    """
+    low, high = DEPTH_LOOPS[depth]
+    if budget is None or (budget.max_tokens is None and budget.max_seconds is None):
+        return random.randint(low, high)
+
+    for loops in range(high, low - 1, -1):
+        if budget.fits(estimate_run(loops, topic, template_tokens, metrics)):
+            return loops
+    return low
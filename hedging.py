@@ -0,0 +1,138 @@
+"""Hedged model calls to cut tail latency.
+
+If a call has not returned by a percentile of recent latency for its call
+type, a duplicate is issued and whichever finishes first wins; the loser is
+cancelled (dropped from the queue, or its result discarded if already
+running). A rolling cap on the hedge rate keeps the extra cost bounded, and
+losers that are still running count against it. Only a call that is already
+running is hedged, and only while there is spare capacity, so duplicates
+never queue ahead of first attempts.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from cancellation import wait_for
+
+
+class Hedger:
+    """Issues duplicate calls for slow requests of the configured call types.
+
+    `has_capacity()`, if given, says whether a duplicate would start right
+    away without holding up other calls.
+    """
+
+    def __init__(self, metrics, call_types=("research", "research_followup"),
+                 percentile: float = 95, max_hedge_rate: float = 0.1,
+                 min_samples: int = 20, window: int = 200, has_capacity=None):
+        self.metrics = metrics
+        self.call_types = set(call_types)
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.has_capacity = has_capacity
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)  # True for each recent call that was hedged
+        self._losers_running = 0  # abandoned attempts still holding a worker
+
+    def hedge_delay(self, call_type: str):
+        """Seconds to wait before hedging `call_type`, or None if it is never hedged."""
+        if call_type not in self.call_types:
+            return None
+        return self.metrics.latency_percentile(call_type, self.percentile, self.min_samples)
+
+    def call(self, submit, call_type: str, token=None, duplicate=None, has_capacity=None):
+        """Run `submit()` (which returns a Future), hedging it if it runs long.
+
+        The hedge is issued with `duplicate()` (default `submit()`), e.g. one
+        that doesn't charge the prompt to a quota again. `has_capacity`
+        replaces the hedger's own check for this call, e.g. to count the
+        caller's concurrency limits. Returns the first successful result.
+        Raises the primary's error if every attempt fails.
+        """
+        primary = submit()
+        delay = self.hedge_delay(call_type)
+        if delay is None:
+            return wait_for(primary, token)
+
+        # A call still queued would only be joined by its duplicate
+        if (self._wait_first([primary], token, delay) or not primary.running()
+                or not self._may_hedge(has_capacity or self.has_capacity)):
+            self._record(False)
+            return wait_for(primary, token)
+
+        try:
+            secondary = (duplicate or submit)()
+        except Exception:
+            # e.g. the duplicate would exceed a quota; keep waiting on the original
+            self._record(False)
+            return wait_for(primary, token)
+
+        self._record(True)
+        self.metrics.incr(f"hedge.issued.{call_type}")
+        return self._race(primary, secondary, call_type, token)
+
+    def _race(self, primary, secondary, call_type, token):
+        pending = [primary, secondary]
+
+        def cancel_both():
+            for future in pending:
+                future.cancel()
+
+        if token is not None:
+            token.add_callback(cancel_both)
+        try:
+            while pending:
+                done = self._wait_first(pending, token, None)
+                for future in done:
+                    pending.remove(future)
+                    if future.cancelled() or future.exception() is not None:
+                        continue
+                    for loser in pending:
+                        loser.cancel()
+                    self.metrics.incr(f"hedge.{'won' if future is secondary else 'lost'}.{call_type}")
+                    return future.result()
+            return primary.result()
+        finally:
+            if token is not None:
+                token.remove_callback(cancel_both)
+            for future in pending:
+                if not future.cancel():
+                    self._track_loser(future)
+
+    def _wait_first(self, futures, token, timeout, poll_interval: float = 0.1):
+        """Wait until one of `futures` is done or `timeout` passes. Returns the done set."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if token is not None:
+                token.raise_if_cancelled()
+            remaining = poll_interval if deadline is None else min(poll_interval, deadline - time.monotonic())
+            done, _ = wait(futures, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+            if done or (deadline is not None and time.monotonic() >= deadline):
+                return done
+
+    def _may_hedge(self, has_capacity=None) -> bool:
+        with self._lock:
+            hedged = sum(self._recent) + self._losers_running
+            if hedged + 1 > self.max_hedge_rate * (len(self._recent) + 1):
+                return False
+        if has_capacity is not None and not has_capacity():
+            self.metrics.incr("hedge.skipped_no_capacity")
+            return False
+        return True
+
+    def _track_loser(self, future) -> None:
+        """Count an abandoned attempt against the hedge rate until it finishes."""
+        with self._lock:
+            self._losers_running += 1
+        future.add_done_callback(self._loser_done)
+
+    def _loser_done(self, future) -> None:
+        with self._lock:
+            self._losers_running -= 1
+
+    def _record(self, hedged: bool) -> None:
+        with self._lock:
+            self._recent.append(hedged)
@@ -0,0 +1,124 @@
+"""Process-wide counters and per-call statistics shared by every session of the app."""
+
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of `values` (pct in 0-100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Metrics:
+    """Thread-safe named counters plus a rolling window of model-call samples."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._calls = defaultdict(lambda: deque(maxlen=window))
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._reporter = None
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Add `amount` to counter `name`."""
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, name: str) -> int:
+        """Return the current value of counter `name`."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        """Return a copy of all counters."""
+        with self._lock:
+            return dict(self._counters)
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one sample of a named measurement (e.g. a queue wait)."""
+        with self._lock:
+            self._samples[name].append(value)
+
+    def summary(self, name: str):
+        """p50/p90/p99 of recent samples of `name`, or None if none were recorded."""
+        with self._lock:
+            values = list(self._samples.get(name, ()))
+        if not values:
+            return None
+        return {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+        }
+
+    def record_call(self, call_type: str, seconds: float, prompt_tokens: int, output_tokens: int) -> None:
+        """Record one completed model call of the given type."""
+        with self._lock:
+            self._calls[call_type].append((seconds, prompt_tokens, output_tokens))
+            self._counters[f"calls.{call_type}"] += 1
+
+    def latency_percentile(self, call_type: str, pct: float, min_samples: int = 1):
+        """Latency percentile of recent `call_type` calls, or None with too few samples."""
+        with self._lock:
+            latencies = [s[0] for s in self._calls.get(call_type, ())]
+        if len(latencies) < max(1, min_samples):
+            return None
+        return percentile(latencies, pct)
+
+    def call_stats(self, call_type: str):
+        """Summarize recent calls of `call_type`, or None if none were recorded."""
+        with self._lock:
+            samples = list(self._calls.get(call_type, ()))
+        if not samples:
+            return None
+
+        latencies = [s[0] for s in samples]
+        return {
+            "count": len(samples),
+            "latency_mean": sum(latencies) / len(latencies),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p90": percentile(latencies, 90),
+            "prompt_tokens_mean": sum(s[1] for s in samples) / len(samples),
+            "output_tokens_mean": sum(s[2] for s in samples) / len(samples),
+        }
+
+    def report(self) -> dict:
+        """Counters, per-call-type stats and sample summaries in one JSON-ready dict."""
+        with self._lock:
+            call_types = list(self._calls)
+            sample_names = list(self._samples)
+        return {
+            "counters": self.snapshot(),
+            "calls": {call_type: self.call_stats(call_type) for call_type in call_types},
+            "samples": {name: self.summary(name) for name in sample_names},
+        }
+
+    def start_reporting(self, interval: float, logger: str = "metrics") -> None:
+        """Log `report()` every `interval` seconds as the record's `metrics` field.
+
+        Only the first call starts the reporter thread.
+        """
+        with self._lock:
+            if self._reporter is not None:
+                return
+            self._reporter = threading.Thread(
+                target=self._report_forever, args=(interval, logging.getLogger(logger)),
+                name="metrics-reporter", daemon=True
+            )
+        self._reporter.start()
+
+    def _report_forever(self, interval: float, logger: logging.Logger) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                logger.info("metrics report", extra={"metrics": self.report()})
+            except Exception as e:
+                logging.error(f"Metrics report failed: {str(e)}")
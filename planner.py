@@ -0,0 +1,73 @@
+"""Deadline-aware planning of the research stage.
+
+Given a time box, the planner decides how many framework aspects to research
+in parallel and how many iterations each aspect gets, using the observed
+per-call latency. While the plan runs, `can_dispatch` stops new iterations in
+time for the final synthesis to finish before the deadline.
+"""
+
+import time
+from dataclasses import dataclass, field
+
+from estimator import call_profile
+
+# Calls a time-boxed run waits for before research starts; the fact and TL;DR run
+# alongside the framework and are skipped if they are late
+OPENING_CALLS = ("framework",)
+
+
+@dataclass
+class ResearchPlan:
+    """Aspects to research in parallel, each with up to `iterations` sequential calls."""
+    aspects: list = field(default_factory=list)
+    iterations: int = 0
+    deadline: float = 0.0
+    research_seconds: float = 0.0
+    synthesis_seconds: float = 0.0
+
+    @property
+    def parallelism(self) -> int:
+        return len(self.aspects)
+
+    def can_dispatch(self, now: float = None) -> bool:
+        """Whether another research iteration still finishes in time for the synthesis."""
+        now = time.monotonic() if now is None else now
+        return now + self.research_seconds + self.synthesis_seconds <= self.deadline
+
+
+def plan_research(aspects: list, deadline: float, max_iterations: int, metrics=None,
+                  max_parallel: int = 4, now: float = None) -> ResearchPlan:
+    """Plan the research stage to fit before `deadline` (a time.monotonic() value).
+
+    Latencies are taken at p90 so a typical slow call still fits. Returns an
+    empty plan when not even one iteration fits before the synthesis.
+    """
+    now = time.monotonic() if now is None else now
+    first = call_profile("research", metrics)
+    followup = call_profile("research_followup", metrics)
+    synthesis = call_profile("synthesis", metrics)
+
+    available = deadline - now - synthesis.latency_p90
+    if not aspects or max_iterations < 1 or available < first.latency_p90:
+        return ResearchPlan(deadline=deadline, synthesis_seconds=synthesis.latency_p90)
+
+    # Iterations of one aspect run back to back, so the deadline bounds the chain length
+    rounds = 1 + int((available - first.latency_p90) // followup.latency_p90)
+    width = min(len(aspects), max_parallel, max_iterations)
+    iterations = min(rounds, max(1, max_iterations // width))
+
+    return ResearchPlan(
+        aspects=list(aspects[:width]),
+        iterations=iterations,
+        deadline=deadline,
+        research_seconds=followup.latency_p90,
+        synthesis_seconds=synthesis.latency_p90,
+    )
+
+
+def minimum_time_box(metrics=None) -> float:
+    """Shortest time box (in seconds) that fits the framework, one research call and the synthesis, at p90."""
+    return sum(
+        call_profile(call_type, metrics).latency_p90
+        for call_type in OPENING_CALLS + ("research", "synthesis")
+    )
@@ -0,0 +1,214 @@
+"""Run progress as small typed events instead of re-rendered HTML.
+
+The pipeline and research threads emit ProgressEvents on a ProgressChannel.
+On the script thread a ProgressView drains the channel and keeps one element
+per piece of progress: the stepper, a status line, and a bar per research
+aspect when aspects run in parallel. Only elements whose content changed are
+rewritten, and the stepper CSS is sent once per page, not with every step.
+"""
+
+import queue
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+STEPPER_CSS = """
+<style>
+.stepper-container {
+    display: flex;
+    align-items: center;
+    justify-content: space-between;
+    margin: 2rem auto;
+    padding: 1rem 2rem;
+    max-width: 700px;
+    background: transparent;
+    position: relative;
+}
+.step {
+    display: flex;
+    flex-direction: column;
+    align-items: center;
+    position: relative;
+    flex: 1;
+    max-width: 140px;
+    margin: 0 0.5rem;
+}
+.step-number {
+    width: 36px;
+    height: 36px;
+    border-radius: 50%;
+    background-color: rgba(255, 255, 255, 0.1);
+    border: 2px solid rgba(255, 255, 255, 0.2);
+    color: rgba(255, 255, 255, 0.6);
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    font-weight: bold;
+    margin-bottom: 8px;
+    z-index: 2;
+    position: relative;
+    transition: all 0.3s ease;
+}
+.step-label {
+    font-size: 0.85rem;
+    color: rgba(255, 255, 255, 0.6);
+    text-align: center;
+    max-width: 110px;
+    word-wrap: break-word;
+    position: relative;
+    z-index: 2;
+    line-height: 1.2;
+    margin-top: 4px;
+}
+.step-line {
+    position: absolute;
+    top: 18px;
+    left: calc(50% + 25px);
+    right: calc(-50% + 25px);
+    height: 2px;
+    background-color: rgba(255, 255, 255, 0.2);
+    z-index: 1;
+}
+.step.active .step-number {
+    border-color: #2439f7;
+    color: #2439f7;
+    background-color: rgba(255, 255, 255, 0.9);
+    box-shadow: 0 0 0 4px rgba(36, 57, 247, 0.1);
+}
+.step.active .step-label {
+    color: rgba(255, 255, 255, 0.9);
+    font-weight: 500;
+}
+.step.complete .step-number {
+    background-color: #28a745;
+    border-color: #28a745;
+    color: white;
+}
+.step.complete .step-line {
+    background-color: #28a745;
+}
+.step:last-child .step-line {
+    display: none;
+}
+</style>
+"""
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """One progress update. Events with an `aspect` describe that aspect alone."""
+    stage: int  # index into the view's steps; len(steps) means done
+    iteration: Optional[int] = None
+    aspect: Optional[str] = None
+    percent: Optional[float] = None  # 0-100, of the stage or of the aspect
+    eta: Optional[float] = None  # seconds until the run is expected to finish
+
+
+class ProgressChannel:
+    """Thread-safe queue of progress events; any thread may emit."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def emit(self, event: ProgressEvent) -> None:
+        self._queue.put(event)
+
+    def drain(self) -> list:
+        """Events emitted since the last drain, in order."""
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+
+def format_duration(seconds):
+    """Format seconds as e.g. '45s' or '3m 20s'."""
+    seconds = int(round(seconds))
+    return f"{seconds // 60}m {seconds % 60:02d}s" if seconds >= 60 else f"{seconds}s"
+
+
+@lru_cache(maxsize=64)
+def stepper_html(steps: tuple, current_step: int) -> str:
+    """Stepper markup for `current_step`; the styles are in STEPPER_CSS."""
+    current_step = max(0, min(current_step, len(steps)))
+    parts = ['<div class="stepper-container">']
+    for i, label in enumerate(steps):
+        status = "complete" if i < current_step else "active" if i == current_step else ""
+        parts.append(
+            f'<div class="step {status}"><div class="step-number">{i + 1}</div>'
+            f'<div class="step-label">{label}</div><div class="step-line"></div></div>'
+        )
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+def status_text(steps: tuple, event: ProgressEvent) -> str:
+    """One-line summary of a stage-level event, e.g. 'Researching · iteration 2 · 40% · ~1m 05s left'."""
+    if event.stage >= len(steps):
+        return ""
+    parts = [steps[event.stage]]
+    if event.iteration is not None:
+        parts.append(f"iteration {event.iteration}")
+    if event.percent is not None:
+        parts.append(f"{event.percent:.0f}%")
+    if event.eta is not None:
+        parts.append(f"~{format_duration(event.eta)} left")
+    return " · ".join(parts)
+
+
+class ProgressView:
+    """Applies progress events to a Streamlit container as element-level deltas.
+
+    Must be used from the script thread; other threads emit on `channel`.
+    """
+
+    def __init__(self, container, steps, channel: ProgressChannel = None):
+        self.steps = tuple(steps)
+        self.channel = channel or ProgressChannel()
+        self._stepper = container.empty()
+        self._status = container.empty()
+        self._aspect_area = container.container()
+        self._bars = {}  # aspect -> placeholder
+        self._shown = {}  # element -> content last written to it
+
+    def emit(self, event: ProgressEvent) -> None:
+        """Emit and apply at once, for events raised on the script thread."""
+        self.channel.emit(event)
+        self.flush()
+
+    def flush(self) -> None:
+        """Apply pending events. Only the latest event per aspect (and for the stage) is drawn."""
+        latest = {}
+        for event in self.channel.drain():
+            latest[event.aspect] = event
+        stage_event = latest.pop(None, None)
+        if stage_event is not None:
+            self._apply_stage(stage_event)
+        for event in latest.values():
+            self._apply_aspect(event)
+
+    def _apply_stage(self, event):
+        self._write(self._stepper, "stepper", stepper_html(self.steps, event.stage),
+                    lambda el, html: el.markdown(html, unsafe_allow_html=True))
+        text = status_text(self.steps, event)
+        self._write(self._status, "status", text, lambda el, value: el.caption(value) if value else el.empty())
+        if event.stage >= len(self.steps):
+            for bar in self._bars.values():
+                bar.empty()
+            self._bars.clear()
+
+    def _apply_aspect(self, event):
+        bar = self._bars.get(event.aspect)
+        if bar is None:
+            bar = self._bars[event.aspect] = self._aspect_area.empty()
+        label = event.aspect if event.iteration is None else f"{event.aspect} · iteration {event.iteration}"
+        value = int(max(0.0, min(event.percent or 0.0, 100.0)))
+        self._write(bar, ("aspect", event.aspect), (value, label),
+                    lambda el, content: el.progress(content[0], text=content[1]))
+
+    def _write(self, element, key, content, draw):
+        if self._shown.get(key) != content:
+            self._shown[key] = content
+            draw(element, content)
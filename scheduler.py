@@ -0,0 +1,274 @@
+"""Priority scheduler in front of every model call.
+
+All sessions share one pool of workers. Short, interactive calls (fact,
+TL;DR, framework) are served before the final synthesis and follow-ups,
+and all of those before research iterations; speculative prefetches come
+last. Within a priority level sessions are served round-robin so one deep
+run cannot hold the pool while quick requests wait behind it.
+Per-session and per-user limits cap concurrent calls and tokens spent in a
+rolling window.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future
+from functools import partial
+
+INTERACTIVE = 0
+SYNTHESIS = 1
+RESEARCH = 2
+SPECULATIVE = 3
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive", SYNTHESIS: "synthesis", RESEARCH: "research", SPECULATIVE: "speculative"
+}
+
+CALL_PRIORITIES = {
+    "fact": INTERACTIVE,
+    "summary": INTERACTIVE,
+    "framework": INTERACTIVE,
+    "synthesis": SYNTHESIS,
+    "followup_research": SYNTHESIS,
+    "followup_update": SYNTHESIS,
+    "research": RESEARCH,
+    "research_followup": RESEARCH,
+}
+
+
+# Streamlit reports this email for every session unless Streamlit Cloud signs the user in
+PLACEHOLDER_EMAIL = "test@example.com"
+USAGE_SWEEP_SECONDS = 60.0
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call would exceed a session or user token quota."""
+
+
+def quota_user_id(email: str, session_id: str) -> str:
+    """The ID user limits apply to: the signed-in user's email, else the session.
+
+    Without a real identity every session would share one user's limits.
+    """
+    if not email or email == PLACEHOLDER_EMAIL:
+        return session_id
+    return email
+
+
+class _Job:
+    __slots__ = ("call", "future", "session_id", "user_id", "priority", "enqueued", "context", "charges")
+
+    def __init__(self, call, session_id, user_id, priority):
+        self.call = call
+        self.future = Future()
+        self.session_id = session_id
+        self.user_id = user_id
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        # Run the call with the submitter's context variables (e.g. log context)
+        self.context = contextvars.copy_context()
+        self.charges = []  # usage entries for the prompt tokens, zeroed if the job never runs
+
+
+class Scheduler:
+    """Fair, prioritized worker pool with per-session and per-user quotas.
+
+    A quota of None means unlimited. Token quotas apply to the tokens charged
+    in the last `token_window` seconds.
+    """
+
+    def __init__(self, max_workers: int = 8, session_concurrency: int = 3,
+                 user_concurrency: int = 4, session_token_quota: int = None,
+                 user_token_quota: int = None, token_window: float = 3600.0,
+                 metrics=None):
+        self.max_workers = max_workers
+        self.session_concurrency = session_concurrency
+        self.user_concurrency = user_concurrency
+        self.session_token_quota = session_token_quota
+        self.user_token_quota = user_token_quota
+        self.token_window = token_window
+        self.metrics = metrics
+
+        self._cond = threading.Condition()
+        self._queues = defaultdict(OrderedDict)  # priority -> session_id -> deque of jobs
+        self._running_sessions = defaultdict(int)
+        self._running_users = defaultdict(int)
+        self._usage = defaultdict(deque)  # ("session"|"user", id) -> deque of [time, tokens]
+        self._swept = time.monotonic()
+        self._workers = []
+
+    def submit(self, call, session_id: str, user_id: str = None, call_type: str = None,
+               tokens: int = 0, priority: int = None) -> Future:
+        """Queue a zero-argument `call` and return a Future for its result.
+
+        `priority` overrides the call type's priority. Raises QuotaExceeded if
+        `tokens` would take the session or user over their token quota. The
+        tokens are refunded if the call is cancelled before it starts.
+        """
+        user_id = user_id or session_id
+        if priority is None:
+            priority = CALL_PRIORITIES.get(call_type, RESEARCH)
+        job = _Job(call, session_id, user_id, priority)
+
+        with self._cond:
+            job.charges = self._admit(session_id, user_id, tokens)
+            self._queues[priority].setdefault(session_id, deque()).append(job)
+            self._ensure_workers()
+            self._cond.notify()
+        job.future.add_done_callback(partial(self._refund_if_cancelled, job))
+        return job.future
+
+    def charge(self, session_id: str, user_id: str, tokens: int) -> None:
+        """Count tokens spent after a call (e.g. its output) against the quotas."""
+        user_id = user_id or session_id
+        with self._cond:
+            self._record_usage(session_id, user_id, tokens)
+
+    def remaining_tokens(self, session_id: str, user_id: str = None):
+        """Tokens left in the tighter of the two quotas, or None if unlimited."""
+        user_id = user_id or session_id
+        with self._cond:
+            remaining = [
+                quota - self._used(key)
+                for key, quota in ((("session", session_id), self.session_token_quota),
+                                   (("user", user_id), self.user_token_quota))
+                if quota is not None
+            ]
+        return min(remaining) if remaining else None
+
+    def queued(self) -> int:
+        with self._cond:
+            return sum(len(jobs) for sessions in self._queues.values() for jobs in sessions.values())
+
+    def idle_workers(self) -> int:
+        """Workers that would still be free after starting every queued call."""
+        with self._cond:
+            running = sum(self._running_sessions.values())
+            queued = sum(len(jobs) for sessions in self._queues.values() for jobs in sessions.values())
+            return max(0, self.max_workers - running - queued)
+
+    def free_slots(self, session_id: str, user_id: str = None) -> int:
+        """Calls the session could still start at once under its and its user's concurrency limits."""
+        user_id = user_id or session_id
+        with self._cond:
+            queued = [job for sessions in self._queues.values() for jobs in sessions.values() for job in jobs
+                      if not job.future.cancelled()]
+            session_free = (self.session_concurrency - self._running_sessions.get(session_id, 0)
+                            - sum(1 for job in queued if job.session_id == session_id))
+            user_free = (self.user_concurrency - self._running_users.get(user_id, 0)
+                         - sum(1 for job in queued if job.user_id == user_id))
+            return max(0, min(session_free, user_free))
+
+    def _admit(self, session_id, user_id, tokens):
+        for key, quota in ((("session", session_id), self.session_token_quota),
+                           (("user", user_id), self.user_token_quota)):
+            if quota is not None and self._used(key) + tokens > quota:
+                self._incr(f"scheduler.quota_rejected.{key[0]}")
+                raise QuotaExceeded(f"{key[0].capitalize()} token quota of {quota:,} exceeded")
+        return self._record_usage(session_id, user_id, tokens)
+
+    def _record_usage(self, session_id, user_id, tokens):
+        now = time.monotonic()
+        if now - self._swept > USAGE_SWEEP_SECONDS:
+            # Forget sessions and users with nothing left in the window
+            self._swept = now
+            for key in list(self._usage):
+                self._used(key)
+        entries = [[now, tokens], [now, tokens]]
+        self._usage[("session", session_id)].append(entries[0])
+        self._usage[("user", user_id)].append(entries[1])
+        return entries
+
+    def _refund_if_cancelled(self, job, future):
+        if not future.cancelled():
+            return
+        with self._cond:
+            for entry in job.charges:
+                entry[1] = 0
+        self._incr("scheduler.refunded")
+
+    def _used(self, key) -> int:
+        usage = self._usage.get(key)
+        if usage is None:
+            return 0
+        cutoff = time.monotonic() - self.token_window
+        while usage and usage[0][0] < cutoff:
+            usage.popleft()
+        if not usage:
+            del self._usage[key]
+        return sum(tokens for _, tokens in usage)
+
+    def _next_job(self):
+        """Pop the next eligible job: highest priority first, sessions round-robin."""
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            for _ in range(len(sessions)):
+                if not sessions:
+                    break
+                session_id, jobs = next(iter(sessions.items()))
+                sessions.move_to_end(session_id)
+
+                # Drop calls their run already gave up on
+                while jobs and jobs[0].future.cancelled():
+                    jobs.popleft()
+                if not jobs:
+                    del sessions[session_id]
+                    continue
+
+                job = jobs[0]
+                if (self._running_sessions.get(job.session_id, 0) >= self.session_concurrency
+                        or self._running_users.get(job.user_id, 0) >= self.user_concurrency):
+                    continue
+
+                jobs.popleft()
+                if not jobs:
+                    del sessions[session_id]
+                return job
+        return None
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._work, name=f"scheduler-{len(self._workers)}", daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running_sessions[job.session_id] += 1
+                self._running_users[job.user_id] += 1
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    self._observe(f"queue_wait.{PRIORITY_NAMES[job.priority]}", time.monotonic() - job.enqueued)
+                    try:
+                        job.future.set_result(job.context.run(job.call))
+                    except Exception as e:
+                        job.future.set_exception(e)
+            except Exception as e:
+                logging.error(f"Scheduler worker error: {str(e)}")
+            finally:
+                with self._cond:
+                    for running, key in ((self._running_sessions, job.session_id),
+                                         (self._running_users, job.user_id)):
+                        running[key] -= 1
+                        if not running[key]:
+                            del running[key]
+                    # A finished call may unblock a session or user at its limit
+                    self._cond.notify_all()
+
+    def _incr(self, name):
+        if self.metrics is not None:
+            self.metrics.incr(name)
+
+    def _observe(self, name, value):
+        if self.metrics is not None:
+            self.metrics.observe(name, value)
@@ -0,0 +1,275 @@
+"""Run state shared by every app worker.
+
+Runs, their results and progress events, and cached model responses live in
+a SQLite database in WAL mode, so any Streamlit process on the host (or on
+nodes sharing the file) can render a run started elsewhere. Each thread gets
+its own connection; readers never block the writer.
+
+Identical requests in flight at the same time are coalesced: the first run
+claims the request's flight key and later ones follow its progress.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    session_id TEXT,
+    topic TEXT,
+    status TEXT NOT NULL,
+    current_step INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_run ON events (run_id, id);
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    call_type TEXT,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS flights (
+    key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    started REAL NOT NULL
+);
+"""
+
+RUNNING = "running"
+COMPLETE = "complete"
+CANCELLED = "cancelled"
+INCOMPLETE = "incomplete"
+
+
+@dataclass
+class CachedResponse:
+    """Stand-in for a model response served from the cache."""
+    text: str
+
+
+def cache_key(model_name: str, prompt: str, **kwargs) -> str:
+    """Key for a model call: the model, the prompt and any generation settings."""
+    payload = json.dumps([model_name, prompt, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_topic(topic: str) -> str:
+    """Case, spacing and trailing punctuation don't make a different question."""
+    return re.sub(r"\s+", " ", topic).strip().rstrip("?!. ").lower()
+
+
+def flight_key(topic: str, depth: str, templates_hash: str, max_tokens: int = None,
+               max_seconds: float = None) -> str:
+    """Key under which identical in-flight requests are coalesced.
+
+    The run budget is part of it: a time-boxed or token-capped run produces a
+    different report than an unlimited one. A limit of 0 means none.
+    """
+    payload = json.dumps([normalize_topic(topic), depth, templates_hash, max_tokens or None, max_seconds or None])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SharedStore:
+    """SQLite-backed store for runs, progress events and cached model responses."""
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Runs
+
+    def start_run(self, run_id: str, session_id: str, topic: str) -> None:
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO runs (run_id, session_id, topic, status, current_step, created, updated)"
+            " VALUES (?, ?, ?, ?, 0, ?, ?)",
+            (run_id, session_id, topic, RUNNING, now, now),
+        )
+
+    def update_run(self, run_id: str, status: str = None, current_step: int = None) -> None:
+        self._connect().execute(
+            "UPDATE runs SET status = COALESCE(?, status), current_step = COALESCE(?, current_step),"
+            " updated = ? WHERE run_id = ?",
+            (status, current_step, time.time(), run_id),
+        )
+
+    def fork_run(self, run_id: str, new_run_id: str, session_id: str) -> None:
+        """Copy a run, its results and its events to `new_run_id`, owned by `session_id`."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, session_id, topic, status, current_step, created, updated)"
+                " SELECT ?, ?, topic, status, current_step, ?, ? FROM runs WHERE run_id = ?",
+                (new_run_id, session_id, now, now, run_id),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO results (run_id, name, value) SELECT ?, name, value FROM results WHERE run_id = ?",
+                (new_run_id, run_id),
+            )
+            conn.execute(
+                "INSERT INTO events (run_id, kind, payload, created)"
+                " SELECT ?, kind, payload, created FROM events WHERE run_id = ? ORDER BY id",
+                (new_run_id, run_id),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def delete_run(self, run_id: str) -> None:
+        """Remove a run and everything recorded for it."""
+        conn = self._connect()
+        for table in ("results", "events", "runs"):
+            conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+
+    def set_result(self, run_id: str, name: str, value) -> None:
+        """Store a JSON-serializable result of the run under `name`."""
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (run_id, name, value) VALUES (?, ?, ?)",
+            (run_id, name, json.dumps(value)),
+        )
+        conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (time.time(), run_id))
+
+    def get_run(self, run_id: str):
+        """The run's fields plus a `results` dict, or None if unknown."""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = dict(row)
+        run["results"] = {
+            name: json.loads(value)
+            for name, value in conn.execute("SELECT name, value FROM results WHERE run_id = ?", (run_id,))
+        }
+        return run
+
+    # Progress events
+
+    def add_event(self, run_id: str, kind: str, payload=None) -> int:
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT INTO events (run_id, kind, payload, created) VALUES (?, ?, ?, ?)",
+            (run_id, kind, json.dumps(payload), time.time()),
+        )
+        conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (time.time(), run_id))
+        return cursor.lastrowid
+
+    def events(self, run_id: str, kind: str = None, after_id: int = 0) -> list:
+        """The run's events in order as (id, kind, payload) tuples."""
+        query = "SELECT id, kind, payload FROM events WHERE run_id = ? AND id > ?"
+        params = [run_id, after_id]
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        rows = self._connect().execute(query + " ORDER BY id", params)
+        return [(row["id"], row["kind"], json.loads(row["payload"])) for row in rows]
+
+    # Model response cache
+
+    def cache_get(self, key: str, max_age: float = None):
+        """Cached response text for `key`, or None if missing or older than `max_age` seconds."""
+        conn = self._connect()
+        row = conn.execute("SELECT response, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (max_age is not None and time.time() - row["created"] > max_age):
+            return None
+        conn.execute("UPDATE llm_cache SET hits = hits + 1 WHERE key = ?", (key,))
+        return row["response"]
+
+    def cache_put(self, key: str, call_type: str, response: str) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO llm_cache (key, call_type, response, created) VALUES (?, ?, ?, ?)",
+            (key, call_type, response, time.time()),
+        )
+
+    # Single-flight coalescing
+
+    def flight_leader(self, key: str, stale_after: float):
+        """Run ID of the live run that owns `key`, or None.
+
+        A run counts as live while it is running and has recorded progress
+        in the last `stale_after` seconds.
+        """
+        row = self._connect().execute(
+            "SELECT f.run_id FROM flights f JOIN runs r ON r.run_id = f.run_id"
+            " WHERE f.key = ? AND r.status = ? AND r.updated >= ?",
+            (key, RUNNING, time.time() - stale_after),
+        ).fetchone()
+        return row["run_id"] if row else None
+
+    def claim_flight(self, key: str, run_id: str, stale_after: float) -> str:
+        """Make `run_id` the owner of `key` unless a live run already is. Returns the owner."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            leader = self.flight_leader(key, stale_after)
+            if leader is None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO flights (key, run_id, started) VALUES (?, ?, ?)",
+                    (key, run_id, time.time()),
+                )
+                leader = run_id
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return leader
+
+    def release_flight(self, key: str, run_id: str) -> None:
+        self._connect().execute("DELETE FROM flights WHERE key = ? AND run_id = ?", (key, run_id))
+
+    def prune(self, older_than: float) -> None:
+        """Delete runs, results, events, flights and cache entries not updated in `older_than` seconds."""
+        cutoff = time.time() - older_than
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            stale = "SELECT run_id FROM runs WHERE updated < ?"
+            conn.execute(f"DELETE FROM results WHERE run_id IN ({stale})", (cutoff,))
+            conn.execute(f"DELETE FROM events WHERE run_id IN ({stale})", (cutoff,))
+            conn.execute("DELETE FROM runs WHERE updated < ?", (cutoff,))
+            conn.execute("DELETE FROM llm_cache WHERE created < ?", (cutoff,))
+            conn.execute("DELETE FROM flights WHERE run_id NOT IN (SELECT run_id FROM runs)")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logging.error(f"Shared state prune failed: {str(e)}")
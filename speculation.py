@@ -0,0 +1,142 @@
+"""Speculative prefetch of a run's first stages while the user is typing.
+
+Once the topic has been idle for a moment, the cheap opening stages (fact,
+TL;DR and optionally the framework) are started in the background. When the
+run is submitted for the same topic and prompts, finished stages are
+adopted and the rest is cancelled; a speculation for anything else is
+cancelled as wasted.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+import uuid
+
+from cancellation import CancelledError, CancelToken
+
+_speculating = contextvars.ContextVar("speculating", default=False)
+
+
+def is_speculating() -> bool:
+    """Whether the current thread is running a speculative stage."""
+    return _speculating.get()
+
+
+class Speculation:
+    """Results of one speculative prefetch, filled in as stages finish."""
+
+    def __init__(self, key, token):
+        self.key = key
+        self.token = token
+        self.results = {}
+        self.finished = threading.Event()
+        self.started = time.monotonic()
+
+
+class Speculator:
+    """Runs at most one speculation per session and `max_concurrent` overall."""
+
+    def __init__(self, metrics=None, max_concurrent: int = 4, keep_for: float = 600.0):
+        self.metrics = metrics
+        self.keep_for = keep_for  # unclaimed results are dropped after this many seconds
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._speculations = {}  # session_id -> Speculation
+
+    def start(self, session_id: str, key, stages, initializer=None):
+        """Start running `stages` for `key` unless that speculation is already going.
+
+        `stages` is a list of (name, fn) where fn(token) returns the stage's
+        result or None. `initializer(thread)` runs before the thread starts.
+        Returns the Speculation, or None if no slot was free.
+        """
+        with self._lock:
+            self._prune()
+            current = self._speculations.get(session_id)
+            if current is not None and current.key == key and not current.token.cancelled:
+                return current
+        if not self._slots.acquire(blocking=False):
+            self._incr("speculation.skipped")
+            return None
+
+        # Not registered as the session's run, so it never cancels (or is cancelled by) the real one
+        speculation = Speculation(key, CancelToken(uuid.uuid4().hex, session_id))
+        with self._lock:
+            previous = self._speculations.get(session_id)
+            self._speculations[session_id] = speculation
+        if previous is not None:
+            self._finish(previous, "topic changed")
+            self._incr("speculation.wasted")
+
+        thread = threading.Thread(
+            target=self._run, args=(speculation, stages), name="speculation", daemon=True
+        )
+        if initializer is not None:
+            initializer(thread)
+        self._incr("speculation.started")
+        thread.start()
+        return speculation
+
+    def take(self, session_id: str, key) -> dict:
+        """Claim the session's speculation for a submitted run.
+
+        Returns the stages that finished for `key`; anything still running is
+        cancelled, as is a speculation for a different key.
+        """
+        with self._lock:
+            speculation = self._speculations.pop(session_id, None)
+        if speculation is None:
+            return {}
+        if speculation.key != key:
+            self._finish(speculation, "topic changed before submit")
+            self._incr("speculation.wasted")
+            return {}
+
+        results = dict(speculation.results)
+        for name in results:
+            self._incr(f"speculation.adopted.{name}")
+        if not speculation.finished.is_set():
+            self._incr("speculation.cancelled")
+        self._finish(speculation, "run submitted")
+        return results
+
+    def cancel(self, session_id: str, reason: str) -> None:
+        with self._lock:
+            speculation = self._speculations.pop(session_id, None)
+        if speculation is not None:
+            if not speculation.finished.is_set():
+                self._incr("speculation.cancelled")
+            self._finish(speculation, reason)
+
+    def _run(self, speculation, stages):
+        _speculating.set(True)
+        try:
+            for name, fn in stages:
+                speculation.token.raise_if_cancelled()
+                result = fn(speculation.token)
+                if result is None:
+                    break
+                speculation.results[name] = result
+        except CancelledError:
+            pass
+        except Exception as e:
+            logging.error(f"Speculation error: {str(e)}")
+        finally:
+            speculation.finished.set()
+            self._slots.release()
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.keep_for
+        for session_id, speculation in list(self._speculations.items()):
+            if speculation.finished.is_set() and speculation.started < cutoff:
+                del self._speculations[session_id]
+                self._incr("speculation.wasted")
+
+    def _finish(self, speculation, reason):
+        if not speculation.finished.is_set():
+            speculation.token.cancel(reason)
+
+    def _incr(self, name):
+        if self.metrics is not None:
+            self.metrics.incr(name)
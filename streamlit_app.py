@@ -7,131 +7,120 @@
 
 
 import streamlit as st
-import google.generativeai as genai
 import logging
-import random
-import io
-from fpdf import FPDF
-import re
+import importlib
+import math
+import os
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_requests import ScriptRequestType
+
+from applog import add_secret, configure_logging, log_context, reset_log_context, set_log_context
+from artifacts import ArtifactStore
+from cancellation import CancelledError, CancelToken, RunRegistry
+from citations import CitationIndex, split_bibliography
+from client_pool import ClientPool, count_tokens_ping, gemini_client_factory
+from estimator import (
+    DEPTH_LOOPS, RunBudget, call_profile, choose_loops, estimate_depth, estimate_run, estimate_tokens
+)
+from hedging import Hedger
+from metrics import Metrics
+from planner import minimum_time_box, plan_research
+from progress import STEPPER_CSS, ProgressEvent, ProgressView, format_duration, stepper_html
+from scheduler import SPECULATIVE, QuotaExceeded, Scheduler, quota_user_id
+from shared_state import (
+    CANCELLED, COMPLETE, INCOMPLETE, RUNNING, CachedResponse, SharedStore, cache_key, flight_key
+)
+from speculation import Speculator, is_speculating
+from templates import VARIANTS, load_templates, template_hash
+from text_utils import (
+    clean_fact, count_emojis, extract_research_aspects, format_framework_text, get_title_emoji,
+    process_framework_output, split_research_block, to_latin1
+)
 
 ########################################
 # GLOBAL CONFIG & LOGGING
 ########################################
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# JSON lines written by a background thread; see applog.py
+LOG_LEVEL = logging.INFO
+LOGGER_LEVELS = {}  # e.g. {"scheduler": logging.DEBUG}; noisy libraries default to WARNING
+DEBUG_SAMPLE_EVERY = 100  # keep one in N DEBUG records per logger
+configure_logging(level=LOG_LEVEL, logger_levels=LOGGER_LEVELS, debug_sample_every=DEBUG_SAMPLE_EVERY)
+# Counters (cancellations, hedge wins, speculation, cache hits, connections) and call
+# latencies are logged as one "metrics report" record this often; None = never
+METRICS_REPORT_SECONDS = 300
+
+# SHARED CALL SCHEDULER LIMITS (None = unlimited)
+SCHEDULER_WORKERS = 8
+SESSION_CONCURRENCY = 3
+USER_CONCURRENCY = 4
+SESSION_TOKENS_PER_HOUR = 400_000
+USER_TOKENS_PER_HOUR = 1_000_000
+QUOTA_MESSAGE = "You've reached your usage quota for now. Please try again later."
+
+# HEDGED RESEARCH CALLS: duplicate a call still running past this latency
+# percentile, capped at this fraction of calls
+HEDGE_CALL_TYPES = ("research", "research_followup")  # () disables hedging
+HEDGE_PERCENTILE = 95
+HEDGE_MAX_RATE = 0.1
+
+# TIME-BOXED RUNS: research aspects in parallel, at most this many at once (and never
+# more than the session and user concurrency limits allow)
+RESEARCH_MAX_PARALLEL = 4
+
+# DISCONNECTS: Streamlit keeps a dropped session open for reconnection, so its run and
+# results are kept this long before being treated as gone. Runs other workers can show
+# from their ?run= link keep going regardless
+DISCONNECT_GRACE_SECONDS = 120
+
+# SESSION ARTIFACTS: large results live in the artifact store, not session_state
+ARTIFACT_MEMORY_LIMIT = 64 * 1024 * 1024  # bytes in memory across all sessions
+ARTIFACT_SPILL_THRESHOLD = 256 * 1024  # blobs this large go straight to disk
+ARTIFACT_IDLE_SECONDS = 600  # idle sessions are moved to disk
+ARTIFACT_EXPIRE_SECONDS = 24 * 3600  # and deleted after this long
+
+# SHARED RUN STATE: every worker on the host (or sharing the file) reads and writes
+# runs here, so any of them can render a run from its ?run= link
+SHARED_STATE_PATH = os.environ.get("MARA_STATE_DB", "mara_state.db")
+SHARED_STATE_RETENTION = 7 * 24 * 3600  # seconds before old runs are pruned
+LLM_CACHE_SECONDS = 6 * 3600  # reuse identical model calls this long; 0 disables
+CACHED_CALL_TYPES = ("summary", "framework", "research", "research_followup", "synthesis")
+
+# SINGLE-FLIGHT: a request identical to one in flight (same topic, depth and prompts)
+# follows that run instead of starting its own
+FLIGHT_STALE_SECONDS = 300  # a leader silent this long is presumed dead
+FOLLOW_POLL_SECONDS = 1.0
+
+# SPECULATIVE PREFETCH (opt-in): start the opening stages once typing pauses
+SPECULATION_DEBOUNCE_MS = 800
+SPECULATION_MIN_CHARS = 12
+SPECULATION_MAX_CONCURRENT = 4  # across all sessions
+SPECULATION_MAX_TOKENS = 6000  # per topic; the framework is only prefetched if all three stages fit
+
+# MODEL CLIENTS: a process-wide pool of warmed clients, each with its own connection.
+# The SDK is imported when the pool starts, once the page is up, not before the first widget
+MODEL_NAME = "gemini-1.5-pro-latest"
+MODEL_TRANSPORT = os.environ.get("MARA_MODEL_TRANSPORT", "grpc")  # "grpc" or "rest"
+MODEL_ENDPOINT = os.environ.get("MARA_MODEL_ENDPOINT")  # e.g. "http://localhost:8080" for a stub; None for Google
+CLIENT_POOL_SIZE = 2
+CLIENT_MAX_CONCURRENT = 4  # calls per client; POOL_SIZE x this should cover SCHEDULER_WORKERS
+CLIENT_KEEPALIVE_SECONDS = 60  # gRPC keep-alive ping interval while calls are in flight
+CLIENT_HEALTH_SECONDS = 120  # idle clients are checked (and kept warm) this often
+PREWARM_IMPORTS = ("fpdf",)  # imported in the background once the page is up; () disables
 
 # STEP LABELS FOR YOUR WIZARD
-STEPS = [
+STEPS = (
     "Preparing",
     "Developing",
     "Researching",
     "Complete"
-]
-
-########################################
-# FUNCTION: RENDER STEPPER
-########################################
-def render_stepper(current_step: int) -> str:
-    """Renders a 5-step wizard with proper styling."""
-    # Clamp current_step
-    current_step = max(0, min(current_step, 4))
-    
-    # Create the CSS and HTML
-    html = """
-        <style>
-        .stepper-container {
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            margin: 2rem auto;
-            padding: 1rem 2rem;
-            max-width: 700px;
-            background: transparent;
-            position: relative;
-        }
-        .step {
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            position: relative;
-            flex: 1;
-            max-width: 140px;
-            margin: 0 0.5rem;
-        }
-        .step-number {
-            width: 36px;
-            height: 36px;
-            border-radius: 50%;
-            background-color: rgba(255, 255, 255, 0.1);
-            border: 2px solid rgba(255, 255, 255, 0.2);
-            color: rgba(255, 255, 255, 0.6);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-weight: bold;
-            margin-bottom: 8px;
-            z-index: 2;
-            position: relative;
-            transition: all 0.3s ease;
-        }
-        .step-label {
-            font-size: 0.85rem;
-            color: rgba(255, 255, 255, 0.6);
-            text-align: center;
-            max-width: 110px;
-            word-wrap: break-word;
-            position: relative;
-            z-index: 2;
-            line-height: 1.2;
-            margin-top: 4px;
-        }
-        .step-line {
-            position: absolute;
-            top: 18px;
-            left: calc(50% + 25px);
-            right: calc(-50% + 25px);
-            height: 2px;
-            background-color: rgba(255, 255, 255, 0.2);
-            z-index: 1;
-        }
-        .step.active .step-number {
-            border-color: #2439f7;
-            color: #2439f7;
-            background-color: rgba(255, 255, 255, 0.9);
-            box-shadow: 0 0 0 4px rgba(36, 57, 247, 0.1);
-        }
-        .step.active .step-label {
-            color: rgba(255, 255, 255, 0.9);
-            font-weight: 500;
-        }
-        .step.complete .step-number {
-            background-color: #28a745;
-            border-color: #28a745;
-            color: white;
-        }
-        .step.complete .step-line {
-            background-color: #28a745;
-        }
-        .step:last-child .step-line {
-            display: none;
-        }
-        </style>
-    """
-    
-    # Create the HTML with minimal whitespace
-    html_parts = [
-        '<div class="stepper-container">',
-        *[f'<div class="step {status}"><div class="step-number">{i + 1}</div><div class="step-label">{label}</div><div class="step-line"></div></div>'
-          for i, label in enumerate(STEPS)
-          for status in ["complete" if i < current_step else "active" if i == current_step else ""]],
-        '</div>'
-    ]
-    
-    # Return the complete HTML
-    return html + ''.join(html_parts)
-
+)
 
 ########################################
 # ORIGINAL STREAMLIT + LLM CODE
@@ -225,6 +214,9 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Stepper styles go out once per page; step changes only send the stepper markup
+st.markdown(STEPPER_CSS, unsafe_allow_html=True)
+
 # Initialize session state
 def init_session_state():
     """Initialize all session state variables with default values."""
@@ -239,7 +231,9 @@ def init_session_state():
         'framework': None,
         'previous_input': "",
         'start_button_clicked': False,
-        'random_fact': None
+        'random_fact': None,
+        'followups': [],
+        'run_id': None
     }
     
     for key, default_value in defaults.items():
@@ -258,18 +252,194 @@ init_session_state()
 # Error handling for Streamlit Cloud
 try:
     api_key = st.secrets["GOOGLE_API_KEY"]
+    add_secret(api_key)
 except Exception as e:
     st.error("Please set the GOOGLE_API_KEY in your Streamlit Cloud secrets.")
     st.info("For local development, create a .streamlit/secrets.toml file with your API key.")
     st.stop()
 
-try:
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-pro-latest")
-except Exception as e:
-    st.error("Error initializing Gemini API. Please check your API key and try again.")
-    st.info("If the error persists, please contact support.")
-    st.stop()
+########################################
+# PROCESS-WIDE RESOURCES
+########################################
+@st.cache_resource(show_spinner=False)
+def get_client_pool():
+    """Warmed Gemini clients shared by all sessions; they connect in the background."""
+    pool = ClientPool(
+        gemini_client_factory(
+            MODEL_NAME, api_key,
+            transport=MODEL_TRANSPORT,
+            endpoint=MODEL_ENDPOINT,
+            keepalive_seconds=CLIENT_KEEPALIVE_SECONDS,
+            max_concurrent=CLIENT_MAX_CONCURRENT
+        ),
+        size=CLIENT_POOL_SIZE,
+        max_concurrent=CLIENT_MAX_CONCURRENT,
+        warm_up=count_tokens_ping,
+        health_interval=CLIENT_HEALTH_SECONDS,
+        metrics=get_metrics()
+    )
+    pool.start()
+    return pool
+
+def import_quietly(names):
+    """Import each module, logging rather than raising on failure."""
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.error(f"Background import of {name} failed: {str(e)}")
+
+@st.cache_resource(show_spinner=False)
+def prewarm_imports():
+    """Import PREWARM_IMPORTS in a background thread, once per process."""
+    thread = threading.Thread(target=import_quietly, args=(PREWARM_IMPORTS,), name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    """Counters shared by all sessions, reported to the log every METRICS_REPORT_SECONDS."""
+    metrics = Metrics()
+    if METRICS_REPORT_SECONDS:
+        metrics.start_reporting(METRICS_REPORT_SECONDS)
+    return metrics
+
+@st.cache_resource(show_spinner=False)
+def get_run_registry():
+    """Tracks each session's active run so it can be cancelled."""
+    return RunRegistry(metrics=get_metrics(), disconnect_grace=DISCONNECT_GRACE_SECONDS)
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    """Shared worker pool every model call goes through, with priorities and quotas."""
+    return Scheduler(
+        max_workers=SCHEDULER_WORKERS,
+        session_concurrency=SESSION_CONCURRENCY,
+        user_concurrency=USER_CONCURRENCY,
+        session_token_quota=SESSION_TOKENS_PER_HOUR,
+        user_token_quota=USER_TOKENS_PER_HOUR,
+        metrics=get_metrics()
+    )
+
+def hedge_capacity(session_id=None, user_id=None):
+    """Whether a duplicate call would start at once rather than hold up first attempts.
+
+    With a session, the duplicate must also fit its session and user concurrency limits.
+    """
+    if session_id is not None and get_scheduler().free_slots(session_id, user_id) < 1:
+        return False
+    return get_scheduler().idle_workers() > 0 and get_client_pool().free_slots() > 0
+
+@st.cache_resource(show_spinner=False)
+def get_hedger():
+    """Duplicates slow research calls to cut tail latency."""
+    return Hedger(
+        get_metrics(),
+        call_types=HEDGE_CALL_TYPES,
+        percentile=HEDGE_PERCENTILE,
+        max_hedge_rate=HEDGE_MAX_RATE,
+        has_capacity=hedge_capacity
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_artifact_store():
+    """Holds each session's research texts, analysis and PDF, spilling to disk."""
+    return ArtifactStore(
+        memory_limit=ARTIFACT_MEMORY_LIMIT,
+        spill_threshold=ARTIFACT_SPILL_THRESHOLD,
+        idle_after=ARTIFACT_IDLE_SECONDS,
+        expire_after=ARTIFACT_EXPIRE_SECONDS,
+        disconnect_grace=DISCONNECT_GRACE_SECONDS,
+        metrics=get_metrics()
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_shared_store():
+    """Run state, progress events and cached responses shared across workers."""
+    store = SharedStore(SHARED_STATE_PATH)
+    store.prune(SHARED_STATE_RETENTION)
+    return store
+
+@st.cache_resource(show_spinner=False)
+def get_speculator():
+    """Prefetches the fact, TL;DR and framework while users type."""
+    return Speculator(metrics=get_metrics(), max_concurrent=SPECULATION_MAX_CONCURRENT)
+
+def get_session_id():
+    """Return the ID of the current browser session."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+def session_is_active(session_id):
+    """Whether the browser session is connected (a dropped one may still reconnect)."""
+    try:
+        return Runtime.instance().is_active_session(session_id)
+    except Exception:
+        return True
+
+def script_run_interrupted(ctx):
+    """Why the script run behind `ctx` is ending early, or None while it continues.
+
+    A widget change (such as a new topic) asks the running script to rerun;
+    Streamlit acts on that at the script's next st call, which can be a whole
+    model call away. Checking the request lets waits cancel the run at once.
+    """
+    requests = getattr(ctx, "script_requests", None)
+    # Streamlit has no public accessor for a pending request
+    state = getattr(requests, "_state", None)
+    if state == ScriptRequestType.RERUN:
+        return "script rerun requested"
+    if state == ScriptRequestType.STOP:
+        return "script stopped"
+    return None
+
+def start_session_run():
+    """Register a run for this session, replacing (and cancelling) its previous one.
+
+    The run is cancelled once this script run is asked to rerun or stop, or
+    once the session has been gone for DISCONNECT_GRACE_SECONDS.
+    """
+    return get_run_registry().start_run(
+        session_id,
+        is_alive=lambda: session_is_active(session_id),
+        interrupted=partial(script_run_interrupted, get_script_run_ctx())
+    )
+
+def get_user_id():
+    """Identify the signed-in user for quotas, falling back to the session."""
+    try:
+        email = st.experimental_user.get("email")
+    except Exception:
+        email = None
+    return quota_user_id(email, session_id)
+
+session_id = get_session_id()
+user_id = get_user_id()
+get_artifact_store().touch(session_id, is_alive=lambda: session_is_active(session_id))
+
+def save_artifact(name, value):
+    """Store a large result and keep only its handle in session_state."""
+    st.session_state[name] = None if value is None else get_artifact_store().put(session_id, name, value)
+
+def share(action, *args, **kwargs):
+    """Call the shared store's `action` method; a store failure, even opening it, must not stop the run.
+
+    Returns whether the call succeeded.
+    """
+    try:
+        getattr(get_shared_store(), action)(*args, **kwargs)
+        return True
+    except Exception as e:
+        logging.error(f"Shared state error: {str(e)}")
+        return False
+
+def load_artifact(name, default=None):
+    """Load a result saved with save_artifact, or `default` if missing or evicted."""
+    ref = st.session_state.get(name)
+    if ref is None:
+        return default
+    value = get_artifact_store().get(ref)
+    return default if value is None else value
 
 # --- Main Title ---
 st.markdown(
@@ -284,16 +454,40 @@ def handle_enter():
         st.session_state.start_button_clicked = True
         st.experimental_rerun()
 
-topic = st.text_input(
-    "Enter a topic or question:",
-    placeholder='e.g. "Is the Ivory-billed woodpecker really extinct?"',
-    key="topic_input",
-    on_change=handle_enter
+speculative_mode = st.session_state.get("speculative_mode", False)
+if speculative_mode:
+    from streamlit_extras.st_keyup import st_keyup  # only needed in this mode
+
+    # Reruns when typing pauses so the opening stages can start early; "Dive In" submits
+    topic = st_keyup(
+        "Enter a topic or question:",
+        placeholder='e.g. "Is the Ivory-billed woodpecker really extinct?"',
+        key="topic_keyup",
+        debounce=SPECULATION_DEBOUNCE_MS
+    ) or ""
+else:
+    topic = st.text_input(
+        "Enter a topic or question:",
+        placeholder='e.g. "Is the Ivory-billed woodpecker really extinct?"',
+        key="topic_input",
+        on_change=handle_enter
+    )
+st.checkbox(
+    "⚡ Start early while I type",
+    key="speculative_mode",
+    help="Begins the fact, TL;DR and framework when you pause typing, so they are ready "
+         "when you press Dive In. Press Dive In to start."
 )
 
+# The input is on screen; connect to the model while the user types
+get_client_pool()
+if PREWARM_IMPORTS:
+    prewarm_imports()
+
 # Add a complete reset function
 def reset_all_states():
     """Reset all session states to their initial values."""
+    get_artifact_store().clear_session(session_id)
     st.session_state.update({
         'analysis_complete': False,
         'current_step': 0,
@@ -304,13 +498,20 @@ def reset_all_states():
         'refined_prompt': None,
         'framework': None,
         'random_fact': None,
+        'followups': [],
+        'run_id': None,
         'start_button_clicked': False
     })
 
 # Update the topic change handler
 if topic != st.session_state.previous_input:
     st.session_state.previous_input = topic
+    # A run that was waiting on a call has already stopped on the rerun request
+    get_run_registry().cancel_session(session_id, "topic changed")
+    get_speculator().cancel(session_id, "topic changed")
     reset_all_states()
+    if "run" in st.query_params:
+        del st.query_params["run"]
     st.experimental_rerun()
 
 # If analysis is done, show step #5
@@ -319,197 +520,50 @@ if st.session_state.analysis_complete:
 
 # ---------- EXPANDERS FOR PROMPTS ----------
 with st.expander("**☠️ Advanced Prompt Customization ☠️**"):
-    agent1_prompt = st.text_area(
-        "Agent 1 Prompt (Prompt Engineer)",
-        '''You are an expert prompt engineer. Your task is to take the user's topic:
-{topic}
-
-Create a refined prompt and structured investigation framework.
-
-Format your response EXACTLY as follows:
-
-Refined Prompt:
-[Your refined prompt here]
-
----
-
-[Create a concise, descriptive title that directly states the analysis focus]
-
-A. Research Objectives:
-   1. Primary Research Questions
-      - Key inquiries driving the investigation
-      - Specific aspects to explore
-   2. Secondary Research Questions
-      - Supporting questions
-      - Related areas of interest
-   3. Expected Outcomes
-      - Anticipated findings
-      - Potential implications
-
-B. Methodological Approach:
-   1. Research Methods
-      - Primary investigation techniques
-      - Analytical frameworks
-   2. Data Collection Strategies
-      - Types of information needed
-      - Sources to be consulted
-   3. Analysis Techniques
-      - Methods for synthesizing findings
-      - Evaluation approaches
-
-C. Investigation Areas:
-   1. Core Topics
-      - Central themes
-      - Primary concepts
-   2. Subtopics
-      - Related elements
-      - Supporting aspects
-   3. Cross-cutting Themes
-      - Interconnections
-      - Common patterns
-
-D. Critical Considerations:
-   1. Key Issues
-      - Main challenges
-      - Important factors
-   2. Stakeholder Perspectives
-      - Different viewpoints
-      - Affected parties
-   3. Impact Assessment
-      - Potential effects
-      - Broader implications
-
-E. Evaluation Criteria:
-   1. Success Metrics
-      - Indicators of quality
-      - Measurement approaches
-   2. Quality Standards
-      - Benchmarks
-      - Assessment criteria
-   3. Verification Methods
-      - Validation techniques
-      - Quality checks
-
-Structure Requirements:
-1. Each section should be clearly labeled (A, B, C, etc.)
-2. Use hierarchical numbering (1, 2, 3) for subsections
-3. Include bullet points for specific details
-4. Maintain consistent formatting throughout
-5. Focus on methodological and structural aspects
-6. Use clear, precise language
-7. Ensure logical flow between sections
-
-Note: Focus on creating a comprehensive research structure. The framework should be methodologically sound and topic-appropriate.''',
-        height=250
+    prompt_variant = st.selectbox(
+        "Prompt style",
+        options=list(VARIANTS),
+        help="Compact prompts drop the repeated formatting and citation instructions."
     )
-    agent2_prompt = st.text_area(
-        "Agent 2 Prompt (Researcher)",
-        '''Using the following inputs:
-
-REFINED PROMPT:
-{refined_prompt}
-
-FRAMEWORK:
-{framework}
+    # Placeholders in {braces} are filled in for each call; edits apply to this session
+    variant_defaults = VARIANTS[prompt_variant]
+    prompt_overrides = {
+        "framework": st.text_area(
+            "Agent 1 Prompt (Prompt Engineer)",
+            variant_defaults["framework"],
+            key=f"agent1_prompt_{prompt_variant}",
+            height=250
+        ),
+        "research": st.text_area(
+            "Agent 2 Prompt (Researcher)",
+            variant_defaults["research"],
+            key=f"agent2_prompt_{prompt_variant}",
+            height=250
+        ),
+        "research_followup": st.text_area(
+            "Agent 2 Follow-up Prompt (Researcher, later iterations)",
+            variant_defaults["research_followup"],
+            key=f"agent2_followup_prompt_{prompt_variant}",
+            height=250
+        ),
+        "synthesis": st.text_area(
+            "Agent 3 Prompt (Expert Analyst)",
+            variant_defaults["synthesis"],
+            key=f"agent3_prompt_{prompt_variant}",
+            height=250
+        ),
+    }
 
-PREVIOUS ANALYSIS:
-{previous_analysis}
+    prompt_templates, template_errors = load_templates(prompt_variant, prompt_overrides)
+    for error in template_errors.values():
+        st.warning(f"{error}. Using the default prompt instead.")
 
-CURRENT FOCUS:
-{current_aspect}
-
-Perform additional research and provide new findings. 
-Include any relevant data, references, or analysis points. 
-Begin your response with a short title, then detail your findings.
-''',
-        height=250
-    )
-    agent3_prompt = st.text_area(
-        "Agent 3 Prompt (Expert Analyst)",
-        '''Based on all previous research and analysis:
-
-REFINED PROMPT:
-{refined_prompt}
-
-FRAMEWORK:
-{framework}
-
-ALL RESEARCH RESULTS:
-{research_results}
-
-Create a comprehensive research synthesis following this exact structure:
-
-Title: [Descriptive title reflecting the main focus of topic analysis]
-Subtitle: [Specific aspect of analysis]
-
-1. Executive Summary
-Provide a 2-3 paragraph overview that:
-- Synthesizes key findings with citations
-- Highlights major discoveries
-- Summarizes methodology
-
-2. Key Insights
-Present 4-6 major insights that:
-- Include specific citations
-- Focus on significant findings
-- Connect to methodology
-
-3. Analysis
-Develop a thorough analysis that:
-- Synthesizes all findings
-- Integrates perspectives
-- Evaluates evidence
-- Organizes by themes
-
-4. Conclusion
-Provide research implications:
-- Summarize key findings
-- Discuss impacts
-- Suggest future directions
-- Make recommendations
-
-5. Further Considerations
-Address complexities:
-- Present counter-arguments
-- Discuss limitations
-- Note uncertainties
-- Identify challenges
-
-6. Recommended Readings
-List essential sources:
-- Note seminal works
-- Include recent research
-- Add methodology guides
-- List digital resources
-
-7. Works Cited
-Provide full bibliography:
-- Use APA 7th edition format
-- Include all in-text citations
-- Add DOIs where available
-- List primary sources first
-- Organize alphabetically
-- Each entry should be on a new line
-- Each entry should end with a period
-- Each entry should start with a bullet point (*)
-
-Important Guidelines:
-- Use proper APA in-text citations (Author, Year)
-- Ensure every citation has a reference
-- Include both classic and recent works
-- Maintain academic tone
-- Cross-reference analyses
-- Format citations consistently
-- Include DOIs for recent works
-
-Format Guidelines:
-- Use numbered sections (1., 2., etc.)
-- Use bullet points for lists (-)
-- Include proper spacing between sections
-- Format references with bullet points
-- End each reference with a period''',
-        height=250
-    )
+    if st.checkbox("Show prompt sizes"):
+        st.table([
+            {"Prompt": name, "Section": label, "Tokens": tokens}
+            for name, template in prompt_templates.items()
+            for label, tokens in template.section_tokens()
+        ])
 
 # Depth slider
 loops = st.select_slider(
@@ -518,6 +572,31 @@ loops = st.select_slider(
     value="Lake",
 )
 
+estimate_caption = st.empty()
+
+with st.expander("⏱️ Run Budget"):
+    budget_tokens = st.number_input(
+        "Max tokens per run (0 = no limit)", min_value=0, value=0, step=10000
+    )
+    budget_seconds = st.number_input(
+        "Time box in seconds (0 = no limit)", min_value=0, value=0, step=30,
+        help="Researches aspects in parallel and stops in time to deliver the best report it can before the deadline."
+    )
+    # Anything shorter can't fit the framework, one research call and the final analysis
+    shortest_time_box = math.ceil(minimum_time_box(get_metrics()))
+    time_box_too_short = 0 < budget_seconds < shortest_time_box
+    if time_box_too_short:
+        st.caption(
+            f"⚠️ The shortest time box that fits one research pass and the final analysis is "
+            f"about {format_duration(shortest_time_box)}."
+        )
+    artifact_usage = get_artifact_store().usage(session_id)
+    if artifact_usage["artifacts"]:
+        st.caption(
+            f"Stored results for this session: {artifact_usage['memory_bytes'] / 1024:,.0f} KB in memory, "
+            f"{artifact_usage['disk_bytes'] / 1024:,.0f} KB compressed on disk."
+        )
+
 # Button
 start_button = st.button("🌊 Dive In")
 
@@ -534,9 +613,70 @@ def handle_response(response):
         return response.text.strip()
     return ""
 
-def create_download_pdf():
+def generate(prompt, token=None, call_type="other", accept=None, **kwargs):
+    """Run a model call through the shared scheduler, abandoning it if the run is cancelled.
+
+    Slow research calls may be hedged with a duplicate; the first to finish wins.
+    Responses of cached call types are cached only if `accept(text)` is true
+    (by default, any non-empty text), so a reply the caller rejects isn't
+    served again on retry.
+
+    Records latency and token stats for the estimator and charges the
+    current run's budget and the session/user quotas.
+    """
+    if token is not None:
+        token.raise_if_cancelled()
+
+    key = None
+    if LLM_CACHE_SECONDS and call_type in CACHED_CALL_TYPES:
+        key = cache_key(MODEL_NAME, prompt, **kwargs)
+        try:
+            cached = get_shared_store().cache_get(key, max_age=LLM_CACHE_SECONDS)
+        except Exception as e:
+            logging.error(f"Response cache error: {str(e)}")
+            cached = None
+        if cached is not None:
+            get_metrics().incr(f"llm_cache.hits.{call_type}")
+            return CachedResponse(cached)
+
+    started = time.monotonic()
+    prompt_tokens = estimate_tokens(prompt)
+    submit = partial(
+        get_scheduler().submit,
+        partial(get_client_pool().generate_content, prompt, **kwargs),
+        session_id=session_id, user_id=user_id, call_type=call_type, tokens=prompt_tokens,
+        priority=SPECULATIVE if is_speculating() else None
+    )
+    try:
+        # Scheduler workers inherit the run context, so their records carry the stage too
+        with log_context(stage=call_type):
+            # A duplicate is the same logical call, so its prompt isn't charged to the quota again
+            resp = get_hedger().call(
+                submit, call_type, token, duplicate=partial(submit, tokens=0),
+                has_capacity=partial(hedge_capacity, session_id, user_id)
+            )
+    except CancelledError:
+        get_metrics().incr("calls_cancelled")
+        raise
+
+    text = handle_response(resp)
+    output_tokens = estimate_tokens(text)
+    if key is not None and text and (accept is None or accept(text)):
+        share("cache_put", key, call_type, text)
+    get_scheduler().charge(session_id, user_id, output_tokens)
+    elapsed = time.monotonic() - started
+    get_metrics().record_call(call_type, elapsed, prompt_tokens, output_tokens)
+    # Per prompt style, so the compact and verbose prompts can be compared
+    get_metrics().record_call(f"{call_type}.{prompt_variant}", elapsed, prompt_tokens, output_tokens)
+    if run_budget is not None:
+        run_budget.charge(prompt_tokens + output_tokens)
+    return resp
+
+def create_download_pdf(tldr_summary, research_results, final_analysis):
     """Create a PDF report of the analysis results."""
     try:
+        from fpdf import FPDF  # imported on first download, not at startup
+
         # Initialize PDF
         pdf = FPDF()
         pdf.add_page()
@@ -549,235 +689,102 @@ def create_download_pdf():
         pdf.ln(10)
         
         # TL;DR Summary
-        if st.session_state.tldr_summary:
+        if tldr_summary:
             pdf.set_font("Arial", "B", 14)
             pdf.cell(0, 10, "Executive Summary", ln=True)
             pdf.set_font("Arial", "", 12)
-            pdf.multi_cell(0, 10, st.session_state.tldr_summary)
+            pdf.multi_cell(0, 10, to_latin1(tldr_summary))
             pdf.ln(10)
         
         # Research Results
-        if st.session_state.research_results:
+        if research_results:
             pdf.set_font("Arial", "B", 14)
             pdf.cell(0, 10, "Research Findings", ln=True)
             pdf.ln(5)
             
-            for title, content in st.session_state.research_results:
+            for title, content in research_results:
                 pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 10, title, ln=True)
+                pdf.cell(0, 10, to_latin1(title), ln=True)
                 pdf.set_font("Arial", "", 12)
-                pdf.multi_cell(0, 10, content)
+                pdf.multi_cell(0, 10, to_latin1(content))
                 pdf.ln(5)
         
         # Final Analysis
-        if st.session_state.final_analysis:
+        if final_analysis:
             pdf.set_font("Arial", "B", 14)
             pdf.cell(0, 10, "Final Analysis", ln=True)
             pdf.set_font("Arial", "", 12)
-            pdf.multi_cell(0, 10, st.session_state.final_analysis)
-        
-        # Save to buffer
-        pdf_buffer = io.BytesIO()
-        pdf.output(pdf_buffer)
-        pdf_buffer.seek(0)
+            pdf.multi_cell(0, 10, to_latin1(final_analysis))
         
-        return pdf_buffer
+        # fpdf 1.7 returns the document as a Latin-1 string
+        return pdf.output(dest='S').encode('latin-1')
         
     except Exception as e:
         logging.error(f"PDF generation failed: {str(e)}")
         st.error("Unable to generate PDF. Please try again.")
         return None
 
-def generate_random_fact(topic):
+def generate_random_fact(topic, token=None):
     """Generate a fascinating and unexpected fact about the topic."""
     try:
-        fact_prompt = (
-            "Generate a fascinating and unexpected fact about this topic: "
-            f"'{topic}'\n\n"
-            "The fact should:\n"
-            "- Be surprising, unique, or counter-intuitive\n"
-            "- Reveal an interesting connection or lesser-known aspect\n"
-            "- Use vivid, engaging language\n"
-            "- Include relevant statistics or specific details when possible\n"
-            "- Add 1-2 relevant emojis that enhance understanding\n"
-            "- Be exactly one sentence that hooks the reader\n"
-            "- Challenge common assumptions or expectations\n\n"
-            "Make it memorable and thought-provoking. Respond with just the fact, no additional text."
-        )
+        fact_prompt = prompt_templates["fact"].render(topic=topic)
         
-        fact_resp = model.generate_content(fact_prompt)
+        fact_resp = generate(fact_prompt, token, call_type="fact")
         fact = handle_response(fact_resp)
         
         if fact:
             # Clean up any verification language or extra formatting
-            fact = fact.strip().strip('"')
-            fact = re.sub(r'^(Fact:|Here\'s a fact:|The fact is:?)', '', fact, flags=re.IGNORECASE).strip()
-            return fact
+            return clean_fact(fact)
             
         return None
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Random fact generation error: {str(e)}")
         return None
 
-def count_emojis(text):
-    """Count the number of emojis in text using regex pattern."""
-    emoji_pattern = re.compile("["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        u"\U00002702-\U000027B0"  # dingbats
-        u"\U000024C2-\U0001F251" 
-        "]+", flags=re.UNICODE)
-    return len(emoji_pattern.findall(text))
-
-def generate_quick_summary(topic):
+def summary_emojis_ok(summary):
+    """Whether a TL;DR keeps to the emoji limit."""
+    return count_emojis(summary) <= 4
+
+def generate_quick_summary(topic, token=None):
     """Generate a quick summary (TL;DR) with naturally integrated emojis."""
     try:
-        summary_prompt = f'''Create a concise 1-2 sentence summary about {topic}.
-Include 1-4 relevant emojis naturally integrated into the text (not just at the beginning).
-The emojis should enhance readability and meaning, not distract from it.
-
-Guidelines:
-- Place emojis where they naturally relate to the concepts they represent
-- Don't cluster emojis together
-- Use emojis to highlight key points or transitions
-- Keep the total number of emojis between 1-4
-- Ensure the text makes sense even if emojis were removed
+        summary_prompt = prompt_templates["summary"].render(topic=topic)
 
-Example format:
-"The rise of social media 📱 has transformed how we communicate, creating new opportunities for connection 🤝 while also raising concerns about privacy 🔐."
-
-Return only the summary with integrated emojis.'''
-
-        resp = model.generate_content(summary_prompt)
+        resp = generate(summary_prompt, token, call_type="summary", accept=summary_emojis_ok)
         summary = handle_response(resp)
         
         # Validate emoji count
-        emoji_count = count_emojis(summary)
-        if emoji_count > 4:
+        if not summary_emojis_ok(summary):
             # If too many emojis, try to get a new summary
-            retry_prompt = f'''Revise this summary to use fewer emojis (maximum 4):
-{summary}
-
-Keep the most relevant emojis and remove others while maintaining the meaning.'''
+            retry_prompt = prompt_templates["summary_retry"].render(summary=summary)
             
-            retry_resp = model.generate_content(retry_prompt)
+            retry_resp = generate(retry_prompt, token, call_type="summary")
             summary = handle_response(retry_resp)
         
         return summary.strip()
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
-        logging.error(e)
+        logging.error(f"Summary error: {str(e)}")
         return None
 
-def process_framework_output(raw_framework: str) -> str:
-    """Process raw LLM framework output into a structured, machine-readable format."""
-    try:
-        lines = [line.strip() for line in raw_framework.split('\n') if line.strip()]
-        processed = []
-        current_section = 0
-        
-        for line in lines:
-            # Main section headers
-            if any(line.lower().startswith(p) for p in ['**1', '1.', '*1', '1)', '#1', 'section 1']):
-                current_section += 1
-                title = re.sub(r'^[*\d.)\s]+', '', line).split(':', 1)[0].strip().upper()
-                processed.append(f"SECTION_{current_section}:{title}")
-                continue
-            
-            # Primary research points
-            if line.lstrip().startswith(('-', '•', '⚫', '○', '●')) or (len(line) > 2 and line[0].isalpha() and line[1] == ')'):
-                text = line.lstrip('-•⚫○●abcdefghijklmnopqrstuvwxyz) ')
-                if ':' in text:
-                    point, desc = text.split(':', 1)
-                    processed.append(f"POINT_{current_section}.{len([l for l in processed if l.startswith(f'POINT_{current_section}')])+ 1}:{point.strip()}|{desc.strip()}")
-                else:
-                    processed.append(f"POINT_{current_section}.{len([l for l in processed if l.startswith(f'POINT_{current_section}')])+ 1}:{text.strip()}")
-                continue
-            
-            # Supporting details and sub-points
-            if line.startswith(('  ', '\t')) or line.lower().startswith(('i.', 'ii.', 'iii.')):
-                text = line.lstrip(' \t-•⚫○●ivxIVX.)')
-                parent_points = [l for l in processed if l.startswith(f'POINT_{current_section}')]
-                if parent_points:
-                    parent_num = parent_points[-1].split(':')[0].split('_')[1]
-                    sub_count = len([l for l in processed if l.startswith(f'SUB_{current_section}.{parent_num}')])
-                    if ':' in text:
-                        point, desc = text.split(':', 1)
-                        processed.append(f"SUB_{current_section}.{parent_num}.{sub_count + 1}:{point.strip()}|{desc.strip()}")
-                    else:
-                        processed.append(f"SUB_{current_section}.{parent_num}.{sub_count + 1}:{text.strip()}")
-                continue
-            
-            # Additional context or metadata
-            if line:
-                processed.append(f"META_{current_section}:{line.strip()}")
-        
-        return '\n'.join(processed)
-        
-    except Exception as e:
-        logging.error(f"Framework processing error: {str(e)}")
-        return raw_framework
-
-def extract_research_aspects(framework: str) -> list:
-    """Extract research aspects from machine-readable framework format."""
-    aspects = []
-    
-    for line in framework.split('\n'):
-        if not line.strip():
-            continue
-            
-        # Extract points from structured format
-        if line.startswith('POINT_'):
-            try:
-                content = line.split(':', 1)[1]
-                if '|' in content:
-                    point, desc = content.split('|', 1)
-                    aspects.append((point.strip(), desc.strip()))
-                else:
-                    aspects.append((content.strip(), ''))
-            except:
-                continue
-                
-        # Include relevant metadata
-        elif line.startswith('META_'):
-            try:
-                content = line.split(':', 1)[1].strip()
-                if len(content) > 10:  # Only include substantial metadata
-                    aspects.append((content, ''))
-            except:
-                continue
-    
-    return [aspect[0] for aspect in aspects if aspect[0]]  # Return only point titles
+def is_framework_response(text):
+    """Whether a framework reply has the refined prompt and framework parts."""
+    return bool(text) and "---" in text
 
-def generate_refined_prompt_and_framework(topic):
+def generate_refined_prompt_and_framework(topic, token=None):
     """Generate structured research framework optimized for agent processing."""
     try:
-        initial_prompt = f'''Analyze this topic and create:
-1. A refined research prompt
-2. A structured investigation framework
-
-Topic: {topic}
-
-Framework Requirements:
-1. Use clear section markers (SECTION_1, SECTION_2, etc.)
-2. Each point should have a clear identifier (POINT_1.1, POINT_1.2, etc.)
-3. Include supporting details with parent references (SUB_1.1.1, SUB_1.1.2, etc.)
-4. Add relevant metadata with META_ prefix
-5. Use pipe symbol (|) to separate point titles from descriptions
-
-Format:
-Refined Prompt:
-[prompt]
----
-[structured framework]'''
-
-        initial_resp = model.generate_content(initial_prompt)
+        initial_prompt = prompt_templates["framework"].render(topic=topic)
+
+        initial_resp = generate(initial_prompt, token, call_type="framework", accept=is_framework_response)
         initial_result = handle_response(initial_resp)
         
-        if not initial_result or "---" not in initial_result:
+        if not is_framework_response(initial_result):
             return None, None
             
         parts = initial_result.split("---")
@@ -789,266 +796,806 @@ Refined Prompt:
             
         return refined_prompt, processed_framework
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Framework generation error: {str(e)}")
         return None, None
 
-def conduct_research(refined_prompt, framework, prev_analysis, aspect, iteration):
+def conduct_research(refined_prompt, framework, prev_analysis, aspect, iteration, token=None):
     """Call Agent 2 to conduct deeper research."""
     try:
-        # Base prompt for initial research
-        base_prompt = f'''Using the following inputs:
-
-REFINED PROMPT:
-{refined_prompt}
-
-FRAMEWORK:
-{framework}
-
-CURRENT FOCUS:
-{aspect}
-
-Follow the methodological approaches and evaluation criteria specified in the framework.
-Provide detailed findings for each key area of investigation outlined.
-
-Structure your analysis using this format:
-
-Title: [Descriptive title reflecting the main focus of {aspect}]
-Subtitle: [Specific aspect of analysis and/or approach being analyzed]
-
-1. Introduction
-   - Context and background
-   - Scope of analysis
-   - Key objectives
-
-2. Methodology Overview
-   - Approach used
-   - Data sources
-   - Analytical methods
-
-3. Key Findings
-   - Primary discoveries (with citations)
-   - Supporting evidence (with citations)
-   - Critical insights
-
-4. Analysis
-   - Detailed examination of findings (with citations)
-   - Interpretation of results
-   - Connections and patterns
-
-5. Implications
-   - Theoretical implications
-   - Practical applications
-   - Future considerations
-
-6. Limitations and Gaps
-   - Current limitations
-   - Areas needing further research
-   - Potential biases
-
-7. Works Cited
-   - Use APA 7th edition format
-   - Include all in-text citations
-   - Add DOIs where available
-   - List primary sources first
-   - Organize alphabetically
-   - Each entry should be on a new line
-   - Each entry should end with a period
-   - Each entry should start with a bullet point (*)
-
-Important:
-- Use proper APA in-text citations (Author, Year)
-- Each section should have at least 2-3 relevant citations
-- Ensure citations are from reputable academic sources
-- Include a mix of seminal works and recent research (last 5 years)
-- All citations must have corresponding entries in Works Cited
-
-Note: As this is iteration {iteration}, be more explorative and creative while maintaining academic rigor.'''
-
-        # Additional prompt for subsequent iterations
-        iteration_prompt = f'''
-PREVIOUS ANALYSIS:
-{prev_analysis}
-
-For iteration #{iteration}, focus on:
-1. Identifying gaps or areas needing more depth
-2. Exploring new connections and implications
-3. Refining and strengthening key arguments
-4. Adding new supporting evidence or perspectives
-
-Structure your analysis using this format:
-
-Title: [Descriptive title reflecting the new focus]
-Subtitle: [Specific aspect being expanded upon]
-
-1. Previous Analysis Review
-   - Key points from previous iteration
-   - Areas identified for expansion
-   - New perspectives to explore
-
-2. Expanded Analysis
-   - Deeper investigation of key themes (with citations)
-   - New evidence and insights (with citations)
-   - Advanced interpretations
-
-3. Novel Connections
-   - Cross-cutting themes (with citations)
-   - Interdisciplinary insights
-   - Emerging patterns
-
-4. Critical Evaluation
-   - Strengthened arguments (with citations)
-   - Counter-arguments addressed
-   - Enhanced evidence base
-
-5. Synthesis and Integration
-   - Integration with previous findings
-   - Enhanced understanding
-   - Refined conclusions
-
-6. Works Cited
-   - Use APA 7th edition format
-   - Include all in-text citations
-   - Add DOIs where available
-   - List primary sources first
-   - Organize alphabetically
-   - Each entry should be on a new line
-   - Each entry should end with a period
-   - Each entry should start with a bullet point (*)
-
-Important:
-- Use proper APA in-text citations (Author, Year)
-- Each section should have at least 2-3 relevant citations
-- Ensure citations are from reputable academic sources
-- Include a mix of seminal works and recent research (last 5 years)
-- All citations must have corresponding entries in Works Cited
-
-Note: As this is iteration {iteration}, be more explorative and creative while maintaining academic rigor.'''
-
-        # Choose prompt based on iteration
-        prompt = base_prompt if iteration == 1 else iteration_prompt
+        # The first iteration works from the framework, later ones build on the previous analysis
+        call_type = "research" if iteration == 1 else "research_followup"
+        prompt = prompt_templates[call_type].render(
+            refined_prompt=refined_prompt,
+            framework=framework,
+            previous_analysis=prev_analysis,
+            current_aspect=aspect,
+            iteration=iteration
+        )
         
-        resp = model.generate_content(prompt)
+        with log_context(iteration=iteration):
+            resp = generate(prompt, token, call_type=call_type)
         return handle_response(resp)
+    except QuotaExceeded:
+        raise
     except Exception as e:
-        logging.error(e)
+        logging.error(f"Research error: {str(e)}")
     return None
 
-def get_title_emoji(title: str) -> str:
-    """Select an emoji based on keywords in the research block title."""
-    keywords = {
-        # Analysis & Research
-        'analysis': '📊', 'research': '🔍', 'study': '📝', 'investigation': '🔎',
-        'findings': '📋', 'results': '📈', 'data': '📊', 'evidence': '🔍',
-        
-        # Topics & Concepts
-        'history': '📜', 'development': '📈', 'impact': '💥', 'evolution': '🔄',
-        'technology': '💻', 'science': '🔬', 'nature': '🌿', 'social': '👥',
-        'economic': '💰', 'culture': '🎭', 'environment': '🌍', 'health': '🏥',
-        'education': '📚', 'politics': '🏛️', 'industry': '🏭', 'art': '🎨',
-        
-        # Methods & Approaches
-        'comparison': '⚖️', 'evaluation': '📋', 'assessment': '📝', 'review': '🔎',
-        'survey': '📊', 'experiment': '🧪', 'observation': '👁️', 'test': '✅',
-        
-        # Outcomes & Insights
-        'conclusion': '🎯', 'recommendation': '💡', 'solution': '🔑', 'problem': '⚠️',
-        'challenge': '🎯', 'success': '🏆', 'failure': '❌', 'improvement': '📈'
+def start_opening_extras(topic, token, prefetched):
+    """Start the fact and TL;DR in the background unless prefetched.
+
+    Returns ({stage: future}, extras_token); cancelling `extras_token` abandons
+    the extras without cancelling the run.
+    """
+    extras_token = CancelToken(
+        token.run_id, token.session_id,
+        interrupted=lambda: token.reason if token.poll() else None
+    )
+    pool = ThreadPoolExecutor(
+        max_workers=2,
+        thread_name_prefix="opening",
+        initializer=add_script_run_ctx,
+        initargs=(None, get_script_run_ctx())
+    )
+    extras = {
+        stage: pool.submit(contextvars.copy_context().run, produce, topic, extras_token)
+        for stage, produce in (("fact", generate_random_fact), ("summary", generate_quick_summary))
+        if not prefetched.get(stage)
     }
-    
-    title_lower = title.lower()
-    for keyword, emoji in keywords.items():
-        if keyword in title_lower:
-            return f"{emoji} "
-    return "🔍 "  # Default emoji
-
-# Convert slider selection to numeric loops
-if loops == "Puddle":
-    loops_num = 1
-elif loops == "Lake":
-    loops_num = random.randint(2, 3)
-elif loops == "Ocean":
-    loops_num = random.randint(4, 6)
-elif loops == "Mariana Trench":
-    loops_num = random.randint(7, 10)
-else:
-    loops_num = 2
+    pool.shutdown(wait=False)
+    return extras, extras_token
+
+def finished_extra(extras, stage):
+    """The stage's result if it has already finished, else None (a late call is abandoned)."""
+    future = extras.get(stage)
+    if future is None or not future.done() or future.cancelled():
+        return None
+    error = future.exception()
+    if isinstance(error, QuotaExceeded):
+        raise error
+    return None if error is not None else future.result()
+
+def show_opening_extras(random_fact, tldr_summary):
+    if random_fact:
+        with st.expander("🎲 Did You Know?", expanded=True):
+            st.markdown(random_fact)
+    if tldr_summary:
+        with st.expander("💡 TL;DR", expanded=True):
+            st.markdown(tldr_summary)
+
+def research_budget_allows(calls=1):
+    """Whether the run budget has room for `calls` more research iterations and the synthesis."""
+    return run_budget.allows(
+        calls * run_estimate.research_tokens, run_estimate.research_seconds,
+        reserve_tokens=run_estimate.synthesis_tokens,
+        reserve_seconds=run_estimate.synthesis_seconds
+    )
+
+def research_chain(aspect, plan, refined_prompt, framework, token, results, progress=None):
+    """Run one aspect's research iterations back to back while the deadline and budget allow."""
+    prev_analysis = ""
+    completed = 0
+    for iteration in range(1, plan.iterations + 1):
+        token.raise_if_cancelled()
+        if not plan.can_dispatch():
+            get_metrics().incr("iterations_skipped_for_deadline")
+            break
+        # The first round is sized to the budget; after that every other chain
+        # may have a call in flight that is not charged yet
+        if iteration > 1 and not research_budget_allows(plan.parallelism):
+            get_metrics().incr("iterations_skipped_for_budget")
+            break
+        research = conduct_research(refined_prompt, framework, prev_analysis, aspect, iteration, token)
+        if not research:
+            break
+        prev_analysis = split_bibliography(research)[0]
+        completed = iteration
+        results.put((aspect, research))
+        if progress is not None:
+            progress.emit(ProgressEvent(
+                stage=2, iteration=iteration, aspect=aspect, percent=100 * iteration / plan.iterations
+            ))
+    if progress is not None and completed < plan.iterations:
+        # Stopped early for the deadline or a failed call; the aspect is done either way
+        progress.emit(ProgressEvent(stage=2, iteration=completed or None, aspect=aspect, percent=100))
+
+def run_research_plan(plan, refined_prompt, framework, token, progress_view=None):
+    """Run the plan's aspects in parallel, yielding (aspect, research) as results arrive.
+
+    Per-aspect progress is applied to `progress_view` while waiting. If the
+    caller stops early (a rerun, st.stop() or an error closes the generator),
+    the run is cancelled and the chains are abandoned without waiting for them.
+    """
+    results = queue.Queue()
+    progress = progress_view.channel if progress_view is not None else None
+    if progress is not None:
+        for aspect in plan.aspects:
+            progress.emit(ProgressEvent(stage=2, aspect=aspect, percent=0))
+    pool = ThreadPoolExecutor(
+        max_workers=plan.parallelism,
+        thread_name_prefix="research",
+        initializer=add_script_run_ctx,
+        initargs=(None, get_script_run_ctx())
+    )
+    finished = False
+    try:
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run,
+                research_chain, aspect, plan, refined_prompt, framework, token, results, progress
+            )
+            for aspect in plan.aspects
+        ]
+        while True:
+            token.raise_if_cancelled()
+            if progress_view is not None:
+                progress_view.flush()
+            try:
+                yield results.get(timeout=0.1)
+                continue
+            except queue.Empty:
+                pass
+            if all(f.done() for f in futures) and results.empty():
+                break
+        for future in futures:
+            future.result()
+        finished = True
+    finally:
+        if not finished:
+            # Cancel first: chains stop at their next check and in-flight calls are abandoned
+            token.cancel("research stopped early")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def generate_final_analysis(refined_prompt, framework, research_results, token=None, bibliography=""):
+    """Call Agent 3 to synthesize all research into the final report."""
+    try:
+        all_research = '\n\n'.join(f"{title}\n{content}" for title, content in research_results)
+        prompt = prompt_templates["synthesis"].render(
+            refined_prompt=refined_prompt,
+            framework=framework,
+            research_results=all_research,
+            bibliography=bibliography
+        )
+        resp = generate(prompt, token, call_type="synthesis")
+        return handle_response(resp)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        logging.error(f"Final analysis error: {str(e)}")
+    return None
+
+def conduct_followup_research(question, refined_prompt, framework, final_analysis, token=None):
+    """Research a follow-up question on top of the completed analysis."""
+    try:
+        prompt = prompt_templates["followup_research"].render(
+            question=question,
+            refined_prompt=refined_prompt,
+            framework=framework,
+            final_analysis=final_analysis
+        )
+        resp = generate(prompt, token, call_type="followup_research")
+        return handle_response(resp)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        logging.error(f"Follow-up research error: {str(e)}")
+    return None
+
+def generate_followup_update(question, new_research, final_analysis, token=None):
+    """Write an addendum to the final analysis that answers the follow-up."""
+    try:
+        prompt = prompt_templates["followup_update"].render(
+            question=question,
+            new_research=new_research,
+            final_analysis=final_analysis
+        )
+        resp = generate(prompt, token, call_type="followup_update")
+        return handle_response(resp)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        logging.error(f"Follow-up update error: {str(e)}")
+    return None
+
+def render_results(current_step, random_fact, tldr_summary, refined_prompt, framework,
+                   research_results, final_analysis, pdf_data):
+    """Show a finished (or partial) analysis."""
+    st.markdown(stepper_html(STEPS, current_step), unsafe_allow_html=True)
+
+    show_opening_extras(random_fact, tldr_summary)
+
+    st.markdown("---")
+
+    if refined_prompt:
+        with st.expander("🎯 Refined Prompt", expanded=False):
+            st.markdown(refined_prompt)
+    if framework:
+        with st.expander("🗺️ Investigation Framework", expanded=False):
+            st.markdown(format_framework_text(framework))
+
+    for title, content in research_results:
+        with st.expander(f"{get_title_emoji(title)}{title}", expanded=False):
+            st.markdown(content)
+
+    if final_analysis:
+        with st.expander("📋 Final Analysis", expanded=True):
+            st.markdown(final_analysis)
+
+    if pdf_data:
+        st.download_button(
+            "📥 Download Report (PDF)",
+            data=pdf_data,
+            file_name="research_report.pdf",
+            mime="application/pdf"
+        )
+
+def render_stored_results():
+    """Show the completed analysis kept in session state and the artifact store."""
+    final_analysis = load_artifact('final_analysis')
+    if final_analysis is None:
+        # The store expired this session's results while the tab sat idle
+        st.info("These results have expired. Enter a topic to start a new analysis.")
+        reset_all_states()
+        return
+
+    render_results(
+        st.session_state.current_step,
+        st.session_state.random_fact,
+        st.session_state.tldr_summary,
+        st.session_state.refined_prompt,
+        load_artifact('framework', ""),
+        load_artifact('research_results', []),
+        final_analysis,
+        load_artifact('pdf_buffer')
+    )
+
+def shared_research_results(run_id):
+    """The run's research blocks, in the order they were recorded."""
+    return [tuple(payload) for _, _, payload in get_shared_store().events(run_id, kind="research")]
+
+def render_shared_run(run_id):
+    """Show a run from the shared store, whichever worker ran it."""
+    try:
+        run = get_shared_store().get_run(run_id)
+        research_results = shared_research_results(run_id) if run else []
+    except Exception as e:
+        logging.error(f"Shared state error: {str(e)}")
+        st.error("Could not load that analysis. Please try again.")
+        return
+    if run is None:
+        st.info("That analysis could not be found. It may have expired.")
+        return
+
+    results = run["results"]
+    if run["status"] == RUNNING:
+        st.info(f"The analysis of \"{run['topic']}\" is still running. Refresh to see its progress.")
+        st.button("🔄 Refresh")
+    elif run["status"] != COMPLETE:
+        st.warning(f"The analysis of \"{run['topic']}\" did not finish.")
+
+    final_analysis = results.get("final_analysis")
+    render_results(
+        run["current_step"],
+        results.get("random_fact"),
+        results.get("tldr_summary"),
+        results.get("refined_prompt"),
+        results.get("framework"),
+        research_results,
+        final_analysis,
+        create_download_pdf(results.get("tldr_summary"), research_results, final_analysis)
+        if run["status"] == COMPLETE else None
+    )
+
+def prefetch_framework(topic, token=None):
+    """Framework stage for speculation: (refined_prompt, framework), or None if it failed."""
+    refined_prompt, framework = generate_refined_prompt_and_framework(topic, token)
+    return (refined_prompt, framework) if refined_prompt and framework else None
+
+def speculative_stages(topic, template_tokens):
+    """Opening stages to prefetch for `topic`, within the speculative token budget."""
+    stages = [
+        ("fact", partial(generate_random_fact, topic)),
+        ("summary", partial(generate_quick_summary, topic)),
+    ]
+    opening_tokens = sum(
+        template_tokens[call_type] + estimate_tokens(topic) + call_profile(call_type, get_metrics()).output_tokens
+        for call_type in ("fact", "summary", "framework")
+    )
+    if opening_tokens <= SPECULATION_MAX_TOKENS:
+        stages.append(("framework", partial(prefetch_framework, topic)))
+    return stages
+
+def follow_shared_run(leader_run_id, token):
+    """Stream an identical run already in flight until it finishes.
+
+    Returns (run, research_results) once it completes, or None if it stopped
+    or went quiet first.
+    """
+    live = st.empty()
+    status = st.empty()
+    started = time.monotonic()
+    last_update = None
+    while True:
+        token.raise_if_cancelled()
+        # Also gives Streamlit a chance to act on a rerun between the leader's updates
+        status.caption(f"Following for {format_duration(time.monotonic() - started)}")
+        try:
+            run = get_shared_store().get_run(leader_run_id)
+            if run is not None and run["updated"] != last_update:
+                research_results = shared_research_results(leader_run_id)
+        except Exception as e:
+            # Treated like a leader that went away; the caller takes over
+            logging.error(f"Shared state error: {str(e)}")
+            run = None
+        if run is None:
+            live.empty()
+            status.empty()
+            return None
+        if run["updated"] != last_update:
+            last_update = run["updated"]
+            results = run["results"]
+            with live.container():
+                st.info("This topic is already being researched. Following that analysis as it runs...")
+                render_results(
+                    run["current_step"], results.get("random_fact"), results.get("tldr_summary"),
+                    results.get("refined_prompt"), results.get("framework"), research_results,
+                    results.get("final_analysis"), None
+                )
+        if run["status"] == COMPLETE:
+            live.empty()
+            status.empty()
+            return run, research_results
+        if run["status"] != RUNNING or time.time() - run["updated"] > FLIGHT_STALE_SECONDS:
+            live.empty()
+            status.empty()
+            return None
+        # Returns early, raising CancelledError, on a rerun or topic change
+        token.sleep(FOLLOW_POLL_SECONDS)
+
+def adopt_shared_run(run, research_results):
+    """Take a finished shared run's results as this session's own."""
+    results = run["results"]
+    st.session_state.update({
+        'random_fact': results.get("random_fact"),
+        'tldr_summary': results.get("tldr_summary"),
+        'refined_prompt': results.get("refined_prompt"),
+        'current_step': 4,
+        'analysis_complete': True,
+    })
+    save_artifact('framework', results.get("framework"))
+    save_artifact('research_results', research_results)
+    save_artifact('final_analysis', results.get("final_analysis"))
+    save_artifact('pdf_buffer', create_download_pdf(
+        results.get("tldr_summary"), research_results, results.get("final_analysis")
+    ))
+
+def template_token_counts():
+    """Prompt tokens each call type costs before its inputs are filled in."""
+    return {name: template.overhead_tokens for name, template in prompt_templates.items()}
+
+# Pre-flight estimate for the selected depth
+template_tokens = template_token_counts()
+low_estimate, high_estimate = estimate_depth(loops, topic, template_tokens, get_metrics())
+estimate_caption.caption(
+    f"Estimated {low_estimate.calls}–{high_estimate.calls} model calls, "
+    f"~{low_estimate.total_tokens:,}–{high_estimate.total_tokens:,} tokens, "
+    f"~{format_duration(low_estimate.seconds)}–{format_duration(high_estimate.seconds_p90)}"
+)
+
+# Convert slider selection to numeric loops (the deepest that fits the budget, if one is set)
+run_budget = None
+loops_num = choose_loops(
+    loops, topic, template_tokens, get_metrics(),
+    RunBudget(max_tokens=budget_tokens, max_seconds=budget_seconds)
+)
+
+start_requested = start_button or st.session_state.get('start_button_clicked', False)
+templates_hash = template_hash(prompt_templates)
+flight = flight_key(topic, loops, templates_hash, budget_tokens, budget_seconds)
 
 ########################################
-# MAIN LOGIC WHEN USER CLICKS BUTTON
+# SPECULATIVE PREFETCH WHILE TYPING
+########################################
+speculation_key = (topic.strip(), templates_hash)
+if (speculative_mode and not start_requested and not st.session_state.analysis_complete
+        and len(topic.strip()) >= SPECULATION_MIN_CHARS):
+    get_speculator().start(
+        session_id, speculation_key, speculative_stages(topic.strip(), template_tokens),
+        initializer=partial(add_script_run_ctx, ctx=get_script_run_ctx())
+    )
+
+########################################
+# CLAIM THE REQUEST, OR FOLLOW AN IDENTICAL RUN ALREADY IN FLIGHT
 ########################################
-if start_button or st.session_state.get('start_button_clicked', False):
+def claim_request(run_id):
+    """Claim this request's flight for `run_id`. Returns the run that owns it.
+
+    If the shared store fails, the run goes ahead on its own.
+    """
+    try:
+        return get_shared_store().claim_flight(flight, run_id, FLIGHT_STALE_SECONDS)
+    except Exception as e:
+        logging.error(f"Shared state error: {str(e)}")
+        return run_id
+
+coalesced = False
+if start_requested:
     # Reset the enter key trigger for next time
     st.session_state.start_button_clicked = False
-    
+
     if not topic.strip():
         st.warning("Please enter a topic.")
         st.stop()
-    
+
+    if time_box_too_short:
+        # A deadline that can't be met is refused rather than overrun
+        st.error(
+            f"A {format_duration(budget_seconds)} time box is too short for any research. "
+            f"Please allow at least {format_duration(shortest_time_box)}."
+        )
+        st.stop()
+
     # Complete reset before starting new analysis
     reset_all_states()
+
+    remaining_quota = get_scheduler().remaining_tokens(session_id, user_id)
+    if remaining_quota is not None and remaining_quota < estimate_run(1, topic, template_tokens, get_metrics()).total_tokens:
+        st.error(QUOTA_MESSAGE)
+        st.stop()
+
+    # A new run supersedes (and cancels) anything this session still has in flight
+    run_token = start_session_run()
+    if share("start_run", run_token.run_id, session_id, topic):
+        # Reachable from its ?run= link on any worker, so a disconnect doesn't end it
+        get_run_registry().detach(run_token)
+    # Claiming is atomic, so of identical requests arriving together exactly one runs
+    # and the others follow it
+    leader_id = claim_request(run_token.run_id)
+    if leader_id != run_token.run_id:
+        get_speculator().cancel(session_id, "following an identical run")
+        followed = None
+        took_over = False
+        try:
+            while not followed:
+                followed = follow_shared_run(leader_id, run_token)
+                if not followed:
+                    # The leader stopped early; take over unless another follower already has
+                    share("update_run", run_token.run_id)
+                    leader_id = claim_request(run_token.run_id)
+                    took_over = leader_id == run_token.run_id
+                    if took_over:
+                        break
+        except CancelledError as e:
+            logging.info(str(e))
+            st.info("Analysis cancelled.")
+            st.stop()
+        finally:
+            if not took_over:
+                # This session's run never started; it is shown the leader's instead
+                share("delete_run", run_token.run_id)
+                get_run_registry().finish_run(run_token, completed=bool(followed))
+
+        if followed:
+            adopt_shared_run(*followed)
+            st.query_params["run"] = leader_id
+            get_metrics().incr("singleflight.followed")
+            coalesced = True
+        else:
+            # With the response cache, picking up where it stopped costs little
+            get_metrics().incr("singleflight.took_over")
+            st.info("The analysis we were following stopped early. Continuing it here.")
+
+########################################
+# MAIN LOGIC WHEN USER CLICKS BUTTON
+########################################
+if start_requested and not coalesced:
+    # Stages prefetched while typing are used as-is; unfinished speculation is cancelled
+    prefetched = get_speculator().take(session_id, speculation_key)
+
+    run_completed = False
+    run_status = RUNNING
+    log_tokens = set_log_context(run_id=run_token.run_id)
+    run_id = st.session_state.run_id = run_token.run_id
+    # Lets any worker pick this run up from the URL
+    st.query_params["run"] = run_id
+    run_budget = RunBudget(max_tokens=budget_tokens, max_seconds=budget_seconds)
+    run_estimate = estimate_run(loops_num, topic, template_tokens, get_metrics())
     
     # Create progress indicator
-    step_container = st.empty()
-    step_container.markdown(render_stepper(st.session_state.current_step), unsafe_allow_html=True)
-    
-    # Show immediate feedback that analysis is starting
-    st.markdown("### 🔍 Beginning Analysis...")
+    progress_view = ProgressView(st.container(), STEPS)
+    progress_view.emit(ProgressEvent(stage=st.session_state.current_step, eta=run_estimate.seconds))
     
-    # Generate and display random fact immediately
-    with st.spinner("Discovering an interesting fact..."):
-        random_fact = generate_random_fact(topic)
-        if random_fact:
-            with st.expander("🎲 Did You Know?", expanded=True):
-                st.markdown(random_fact)
-        st.session_state.random_fact = random_fact
-    
-    # Generate quick summary
-    with st.spinner("Generating quick summary..."):
-        tldr_summary = generate_quick_summary(topic)
-        if tldr_summary:
-            with st.expander("💡 TL;DR", expanded=True):
-                st.markdown(tldr_summary)
-        st.session_state.tldr_summary = tldr_summary
-
-    # Visual separator
-    st.markdown("---")
+    try:
+        # Show immediate feedback that analysis is starting
+        st.markdown("### 🔍 Beginning Analysis...")
+        
+        # Against a deadline the fact and TL;DR are extras: they run alongside the framework
+        extras, extras_token = start_opening_extras(topic, run_token, prefetched) if budget_seconds else (None, None)
+        extras_view = st.container()
+
+        if extras is None:
+            # Generate and display random fact immediately
+            with st.spinner("Discovering an interesting fact..."):
+                random_fact = prefetched.get("fact") or generate_random_fact(topic, run_token)
+                show_opening_extras(random_fact, None)
+                st.session_state.random_fact = random_fact
+                share("set_result", run_id, "random_fact", random_fact)
+
+            # Generate quick summary
+            run_token.raise_if_cancelled()
+            with st.spinner("Generating quick summary..."):
+                tldr_summary = prefetched.get("summary") or generate_quick_summary(topic, run_token)
+                show_opening_extras(None, tldr_summary)
+                st.session_state.tldr_summary = tldr_summary
+                share("set_result", run_id, "tldr_summary", tldr_summary)
+
+        # Visual separator
+        st.markdown("---")
+
+        # Step 2: Framework Development
+        run_token.raise_if_cancelled()
+        with st.spinner("Optimizing research approach..."):
+            refined_prompt, framework = (
+                prefetched.get("framework") or generate_refined_prompt_and_framework(topic, run_token)
+            )
+            if not refined_prompt or not framework:
+                st.error("Could not generate refined prompt and framework. Please try again.")
+                st.stop()
+
+            st.session_state.refined_prompt = refined_prompt
+            save_artifact('framework', framework)
+            share("set_result", run_id, "refined_prompt", refined_prompt)
+            share("set_result", run_id, "framework", framework)
+
+            with st.expander("🎯 Refined Prompt", expanded=False):
+                st.markdown(refined_prompt)
+
+            with st.expander("🗺️ Investigation Framework", expanded=False):
+                formatted_text = format_framework_text(framework)
+                st.markdown(formatted_text)
+
+        if extras is not None:
+            # Whatever hasn't arrived with the framework is skipped rather than waited for
+            random_fact = prefetched.get("fact") or finished_extra(extras, "fact")
+            tldr_summary = prefetched.get("summary") or finished_extra(extras, "summary")
+            extras_token.cancel("late for the time box")
+            with extras_view:
+                show_opening_extras(random_fact, tldr_summary)
+            st.session_state.random_fact = random_fact
+            st.session_state.tldr_summary = tldr_summary
+            share("set_result", run_id, "random_fact", random_fact)
+            share("set_result", run_id, "tldr_summary", tldr_summary)
+
+        # Mark Step 1 complete and continue with rest of analysis
+        st.session_state.current_step = 1
+        progress_view.emit(ProgressEvent(
+            stage=1, eta=loops_num * run_estimate.research_seconds + run_estimate.synthesis_seconds
+        ))
+        share("update_run", run_id, current_step=1)
+
+        # Step 3: Research
+        aspects = extract_research_aspects(framework) or [refined_prompt]
+        research_results = []
+        prev_analysis = ""
+        # Each research call writes its own Works Cited; they are merged here
+        citation_index = CitationIndex()
+        st.session_state.current_step = 2
+        share("update_run", run_id, current_step=2)
+
+        if budget_seconds:
+            # Time-boxed run: research what fits before the deadline, in parallel
+            # The plan assumes every aspect's first iteration starts at once, so start only as many
+            # as the scheduler will run together for this session and user, and the budget covers
+            max_width = min(RESEARCH_MAX_PARALLEL, get_scheduler().free_slots(session_id, user_id))
+            width = next(
+                (n for n in range(max_width, 1, -1) if research_budget_allows(n)), 1
+            )
+            plan = plan_research(
+                aspects, run_budget.started + budget_seconds, DEPTH_LOOPS[loops][1], get_metrics(),
+                max_parallel=width
+            )
+            if not plan.iterations:
+                # The opening stages ran long; a report without research isn't worth the wait
+                st.error(
+                    "The time box ran out before research could start. "
+                    "Please try again with a longer time box."
+                )
+                st.stop()
+            st.caption(
+                f"Researching {plan.parallelism} aspect(s) in parallel, "
+                f"up to {plan.iterations} iteration(s) each."
+            )
+            progress_view.emit(ProgressEvent(
+                stage=2, eta=plan.iterations * plan.research_seconds + plan.synthesis_seconds
+            ))
+            with st.spinner("Researching in parallel..."):
+                for aspect, research in run_research_plan(
+                    plan, refined_prompt, framework, run_token, progress_view
+                ):
+                    research = citation_index.absorb(research)
+                    title, content = split_research_block(research, aspect)
+                    research_results.append((title, content))
+                    share("add_event", run_id, "research", [title, content])
+                    with st.expander(f"{get_title_emoji(title)}{title}", expanded=False):
+                        st.markdown(content)
+        else:
+            for iteration in range(1, loops_num + 1):
+                run_token.raise_if_cancelled()
+                # Keep enough budget back for the final synthesis
+                if research_results and not research_budget_allows():
+                    st.warning("Run budget reached. Moving on to the final analysis.")
+                    break
+
+                aspect = aspects[(iteration - 1) % len(aspects)]
+                progress_view.emit(ProgressEvent(
+                    stage=2, iteration=iteration, percent=100 * (iteration - 1) / loops_num,
+                    eta=(loops_num - iteration + 1) * run_estimate.research_seconds + run_estimate.synthesis_seconds
+                ))
+                with st.spinner(f"Researching ({iteration}/{loops_num}): {aspect}..."):
+                    research = conduct_research(refined_prompt, framework, prev_analysis, aspect, iteration, run_token)
+                if not research:
+                    st.error(f"Research iteration {iteration} failed. Continuing with what we have.")
+                    continue
+
+                research = citation_index.absorb(research)
+                title, content = split_research_block(research, aspect)
+                research_results.append((title, content))
+                share("add_event", run_id, "research", [title, content])
+                prev_analysis = research
+                with st.expander(f"{get_title_emoji(title)}{title}", expanded=False):
+                    st.markdown(content)
+
+        save_artifact('research_results', research_results)
+        if not research_results:
+            st.error("Research could not be completed. Please try again.")
+            st.stop()
 
-    # Step 2: Framework Development
-    with st.spinner("Optimizing research approach..."):
-        refined_prompt, framework = generate_refined_prompt_and_framework(topic)
-        if not refined_prompt or not framework:
-            st.error("Could not generate refined prompt and framework. Please try again.")
+        # Step 4: Final Analysis
+        run_token.raise_if_cancelled()
+        progress_view.emit(ProgressEvent(stage=2, percent=100, eta=run_estimate.synthesis_seconds))
+        with st.spinner("Synthesizing final analysis..."):
+            final_analysis = generate_final_analysis(
+                refined_prompt, framework, research_results, run_token, citation_index.render()
+            )
+        if not final_analysis:
+            st.error("Could not generate the final analysis. Please try again.")
             st.stop()
 
-        st.session_state.refined_prompt = refined_prompt
-        st.session_state.framework = framework
+        # One merged bibliography replaces whatever Works Cited the synthesis wrote
+        final_analysis = citation_index.finalize(final_analysis)
+        get_metrics().incr("citations.duplicates", citation_index.duplicates)
+        unresolved = citation_index.unresolved()
+        if unresolved:
+            logging.info(f"{len(unresolved)} in-text citation(s) have no Works Cited entry")
+
+        save_artifact('final_analysis', final_analysis)
+        share("set_result", run_id, "final_analysis", final_analysis)
+        with st.expander("📋 Final Analysis", expanded=True):
+            st.markdown(final_analysis)
+
+        st.session_state.analysis_complete = True
+        st.session_state.current_step = 4
+        progress_view.emit(ProgressEvent(stage=4))
+
+        pdf_data = create_download_pdf(tldr_summary, research_results, final_analysis)
+        save_artifact('pdf_buffer', pdf_data)
+        if pdf_data:
+            st.download_button(
+                "📥 Download Report (PDF)",
+                data=pdf_data,
+                file_name="research_report.pdf",
+                mime="application/pdf"
+            )
+        run_completed = True
+        run_status = COMPLETE
+
+    except CancelledError as e:
+        logging.info(str(e))
+        st.info("Analysis cancelled.")
+        run_status = CANCELLED
+
+    except QuotaExceeded as e:
+        logging.info(str(e))
+        st.error(QUOTA_MESSAGE)
+
+    finally:
+        # After st.stop() any st call, session_state included, raises again; none belong here
+        # Abandons any calls still in flight if the script stopped early
+        get_run_registry().finish_run(run_token, completed=run_completed)
+        share(
+            "update_run", run_id,
+            status=INCOMPLETE if run_status == RUNNING else run_status,
+            current_step=4 if run_completed else None
+        )
+        share("release_flight", flight, run_id)
+        reset_log_context(log_tokens)
 
-        with st.expander("🎯 Refined Prompt", expanded=False):
-            st.markdown(refined_prompt)
+elif st.session_state.analysis_complete:
+    render_stored_results()
 
-        with st.expander("🗺️ Investigation Framework", expanded=False):
-            formatted_text = format_framework_text(framework)
-            st.markdown(formatted_text)
-
-    # Mark Step 1 complete and continue with rest of analysis
-    st.session_state.current_step = 1
-    step_container.markdown(render_stepper(st.session_state.current_step), unsafe_allow_html=True)
-
-    # Continue with remaining steps...
-
-# Add emoji range check helper at the top of the file with other imports
-def is_emoji(c):
-    return c in [
-        '\U0001F300-\U0001F9FF',  # Emoticons
-        '\U0001F600-\U0001F64F',  # Emoticons
-        '\U0001F680-\U0001F6FF',  # Transport & Map
-        '\U0001F700-\U0001F77F',  # Alchemical
-        '\U0001F780-\U0001F7FF',  # Geometric
-        '\U0001F800-\U0001F8FF',  # Supplemental Arrows-C
-        '\U0001F900-\U0001F9FF',  # Supplemental Symbols and Pictographs
-        '\U0001FA00-\U0001FA6F',  # Chess Symbols
-        '\U0001FA70-\U0001FAFF',  # Symbols and Pictographs Extended-A
-        '\U00002702-\U000027B0',  # Dingbats
-        '\U000024C2-\U0001F251'   # Enclosed characters
-    ]
+elif st.query_params.get("run"):
+    # A run started on this or another worker, e.g. after the load balancer moved the user
+    render_shared_run(st.query_params["run"])
+
+########################################
+# FOLLOW-UP QUESTIONS ON A COMPLETED ANALYSIS
+########################################
+if st.session_state.analysis_complete:
+    st.markdown("---")
+    followup_question = st.text_input(
+        "Ask a follow-up question:",
+        placeholder="e.g. What evidence would settle the question?",
+        key="followup_input"
+    )
+
+    # Reuses the run's refined prompt, framework and report: one research call plus one update
+    if st.button("↪️ Follow Up") and followup_question.strip():
+        followup_token = start_session_run()
+        followup_completed = False
+        log_tokens = set_log_context(run_id=followup_token.run_id, stage="followup")
+        # The report without its bibliography goes to the prompts; the bibliography is rebuilt after
+        citation_index = CitationIndex()
+        final_analysis = citation_index.absorb(load_artifact('final_analysis', ""))
+        try:
+            with st.spinner("Researching your follow-up..."):
+                new_research = conduct_followup_research(
+                    followup_question,
+                    st.session_state.refined_prompt,
+                    load_artifact('framework', ""),
+                    final_analysis,
+                    followup_token
+                )
+            if not new_research:
+                st.error("Could not research the follow-up. Please try again.")
+                st.stop()
+            new_research = citation_index.absorb(new_research)
+
+            followup_token.raise_if_cancelled()
+            with st.spinner("Updating the analysis..."):
+                addendum = generate_followup_update(
+                    followup_question, new_research, final_analysis, followup_token
+                )
+            if not addendum:
+                st.error("Could not update the analysis. Please try again.")
+                st.stop()
+            addendum = citation_index.absorb(addendum)
+
+            title, content = split_research_block(new_research, followup_question)
+            research_results = load_artifact('research_results', []) + [(title, content)]
+            final_analysis = citation_index.finalize(
+                f"{final_analysis}\n\n## Follow-up: {followup_question.strip()}\n\n{addendum}"
+            )
+            save_artifact('research_results', research_results)
+            save_artifact('final_analysis', final_analysis)
+            st.session_state.followups.append(followup_question.strip())
+            save_artifact(
+                'pdf_buffer', create_download_pdf(st.session_state.tldr_summary, research_results, final_analysis)
+            )
+            # Recorded as a new run: sessions that followed this one keep seeing it without our follow-ups
+            followup_run_id = followup_token.run_id
+            if st.session_state.run_id and share("fork_run", st.session_state.run_id, followup_run_id, session_id):
+                share("add_event", followup_run_id, "research", [title, content])
+                share("set_result", followup_run_id, "final_analysis", final_analysis)
+                st.session_state.run_id = followup_run_id
+                st.query_params["run"] = followup_run_id
+            followup_completed = True
+
+            with st.expander(f"{get_title_emoji(title)}{title}", expanded=False):
+                st.markdown(content)
+            with st.expander(f"↪️ Follow-up: {followup_question.strip()}", expanded=True):
+                st.markdown(addendum)
+
+        except CancelledError as e:
+            logging.info(str(e))
+            st.info("Follow-up cancelled.")
+
+        except QuotaExceeded as e:
+            logging.info(str(e))
+            st.error(QUOTA_MESSAGE)
+
+        finally:
+            get_run_registry().finish_run(followup_token, completed=followup_completed)
+            reset_log_context(log_tokens)
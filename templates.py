@@ -0,0 +1,523 @@
+"""Prompt templates for the agents.
+
+Templates are parsed once (per distinct text), validated against the
+placeholders each prompt accepts, and rendered with str.format_map. Every prompt comes in a "verbose"
+variant (the original prompts) and a "compact" variant that trims the
+repeated formatting and citation instructions, so the two can be compared
+for latency and cost.
+"""
+
+import functools
+import hashlib
+import string
+
+from estimator import estimate_tokens
+
+
+class TemplateError(ValueError):
+    """Raised when a template is malformed or uses the wrong placeholders."""
+
+
+# Placeholders each prompt (required, optional) accepts
+TEMPLATE_FIELDS = {
+    "fact": (("topic",), ()),
+    "summary": (("topic",), ()),
+    "summary_retry": (("summary",), ()),
+    "framework": (("topic",), ()),
+    "research": (("refined_prompt", "framework", "current_aspect"), ("iteration",)),
+    "research_followup": (("previous_analysis",), ("iteration", "refined_prompt", "framework", "current_aspect")),
+    "synthesis": (("research_results",), ("refined_prompt", "framework", "bibliography")),
+    "followup_research": (("question",), ("refined_prompt", "framework", "final_analysis")),
+    "followup_update": (("question", "new_research"), ("final_analysis",)),
+}
+
+
+class PromptTemplate:
+    """A compiled prompt template."""
+
+    def __init__(self, name: str, text: str, required=(), optional=()):
+        self.name = name
+        self.text = text
+        literals, fields = [], set()
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise TemplateError(f"{name}: {str(e)}")
+
+        for literal, field, format_spec, conversion in parsed:
+            if field is not None:
+                if not field.isidentifier() or format_spec or conversion:
+                    raise TemplateError(f"{name}: unsupported placeholder {{{field}}}")
+                fields.add(field)
+            literals.append(literal)
+
+        self.fields = fields
+        self._literals = "".join(literals)
+        # Validated above, so str.format_map renders it exactly
+        self._format = text.format_map
+        unknown = self.fields - set(required) - set(optional)
+        missing = set(required) - self.fields
+        if unknown:
+            raise TemplateError(f"{name}: unknown placeholder(s) {', '.join(sorted('{' + f + '}' for f in unknown))}")
+        if missing:
+            raise TemplateError(f"{name}: missing placeholder(s) {', '.join(sorted('{' + f + '}' for f in missing))}")
+
+    def render(self, **values) -> str:
+        """Fill in the placeholders. Extra values are ignored."""
+        return self._format(values)
+
+    @property
+    def overhead_tokens(self) -> int:
+        """Tokens the template adds before any inputs are filled in."""
+        return estimate_tokens(self._literals)
+
+    def section_tokens(self) -> list:
+        """(section label, tokens) for each blank-line separated section."""
+        sections = []
+        for block in self.render(**{field: "" for field in self.fields}).split("\n\n"):
+            block = block.strip()
+            if block:
+                label = block.split("\n", 1)[0][:48]
+                sections.append((label, estimate_tokens(block)))
+        return sections
+
+
+@functools.lru_cache(maxsize=256)
+def compile_template(name: str, text: str) -> PromptTemplate:
+    """Compile `text` as the template for prompt `name` (cached per distinct text)."""
+    required, optional = TEMPLATE_FIELDS[name]
+    return PromptTemplate(name, text, required, optional)
+
+
+########################################
+# SHARED INSTRUCTION BLOCKS
+########################################
+WORKS_CITED_RULES = """   - Use APA 7th edition format
+   - Include all in-text citations
+   - Add DOIs where available
+   - List primary sources first
+   - Organize alphabetically
+   - Each entry should be on a new line
+   - Each entry should end with a period
+   - Each entry should start with a bullet point (*)"""
+
+CITATION_RULES = """Important:
+- Use proper APA in-text citations (Author, Year)
+- Each section should have at least 2-3 relevant citations
+- Ensure citations are from reputable academic sources
+- Include a mix of seminal works and recent research (last 5 years)
+- All citations must have corresponding entries in Works Cited
+
+Note: As this is iteration {iteration}, be more explorative and creative while maintaining academic rigor."""
+
+COMPACT_CITATION_RULES = """Cite sources in APA style (Author, Year) throughout and end with "Works Cited": one APA 7 entry per line, starting with "* ", with DOIs where available."""
+
+
+########################################
+# VERBOSE TEMPLATES (ORIGINAL PROMPTS)
+########################################
+VERBOSE_TEMPLATES = {
+    "fact": (
+        "Generate a fascinating and unexpected fact about this topic: "
+        "'{topic}'\n\n"
+        "The fact should:\n"
+        "- Be surprising, unique, or counter-intuitive\n"
+        "- Reveal an interesting connection or lesser-known aspect\n"
+        "- Use vivid, engaging language\n"
+        "- Include relevant statistics or specific details when possible\n"
+        "- Add 1-2 relevant emojis that enhance understanding\n"
+        "- Be exactly one sentence that hooks the reader\n"
+        "- Challenge common assumptions or expectations\n\n"
+        "Make it memorable and thought-provoking. Respond with just the fact, no additional text."
+    ),
+
+    "summary": '''Create a concise 1-2 sentence summary about {topic}.
+Include 1-4 relevant emojis naturally integrated into the text (not just at the beginning).
+The emojis should enhance readability and meaning, not distract from it.
+
+Guidelines:
+- Place emojis where they naturally relate to the concepts they represent
+- Don't cluster emojis together
+- Use emojis to highlight key points or transitions
+- Keep the total number of emojis between 1-4
+- Ensure the text makes sense even if emojis were removed
+
+Example format:
+"The rise of social media 📱 has transformed how we communicate, creating new opportunities for connection 🤝 while also raising concerns about privacy 🔐."
+
+Return only the summary with integrated emojis.''',
+
+    "summary_retry": '''Revise this summary to use fewer emojis (maximum 4):
+{summary}
+
+Keep the most relevant emojis and remove others while maintaining the meaning.''',
+
+    "framework": '''Analyze this topic and create:
+1. A refined research prompt
+2. A structured investigation framework
+
+Topic: {topic}
+
+Framework Requirements:
+1. Use clear section markers (SECTION_1, SECTION_2, etc.)
+2. Each point should have a clear identifier (POINT_1.1, POINT_1.2, etc.)
+3. Include supporting details with parent references (SUB_1.1.1, SUB_1.1.2, etc.)
+4. Add relevant metadata with META_ prefix
+5. Use pipe symbol (|) to separate point titles from descriptions
+
+Format:
+Refined Prompt:
+[prompt]
+---
+[structured framework]''',
+
+    "research": '''Using the following inputs:
+
+REFINED PROMPT:
+{refined_prompt}
+
+FRAMEWORK:
+{framework}
+
+CURRENT FOCUS:
+{current_aspect}
+
+Follow the methodological approaches and evaluation criteria specified in the framework.
+Provide detailed findings for each key area of investigation outlined.
+
+Structure your analysis using this format:
+
+Title: [Descriptive title reflecting the main focus of {current_aspect}]
+Subtitle: [Specific aspect of analysis and/or approach being analyzed]
+
+1. Introduction
+   - Context and background
+   - Scope of analysis
+   - Key objectives
+
+2. Methodology Overview
+   - Approach used
+   - Data sources
+   - Analytical methods
+
+3. Key Findings
+   - Primary discoveries (with citations)
+   - Supporting evidence (with citations)
+   - Critical insights
+
+4. Analysis
+   - Detailed examination of findings (with citations)
+   - Interpretation of results
+   - Connections and patterns
+
+5. Implications
+   - Theoretical implications
+   - Practical applications
+   - Future considerations
+
+6. Limitations and Gaps
+   - Current limitations
+   - Areas needing further research
+   - Potential biases
+
+7. Works Cited
+''' + WORKS_CITED_RULES + '''
+
+''' + CITATION_RULES,
+
+    "research_followup": '''
+PREVIOUS ANALYSIS:
+{previous_analysis}
+
+For iteration #{iteration}, focus on:
+1. Identifying gaps or areas needing more depth
+2. Exploring new connections and implications
+3. Refining and strengthening key arguments
+4. Adding new supporting evidence or perspectives
+
+Structure your analysis using this format:
+
+Title: [Descriptive title reflecting the new focus]
+Subtitle: [Specific aspect being expanded upon]
+
+1. Previous Analysis Review
+   - Key points from previous iteration
+   - Areas identified for expansion
+   - New perspectives to explore
+
+2. Expanded Analysis
+   - Deeper investigation of key themes (with citations)
+   - New evidence and insights (with citations)
+   - Advanced interpretations
+
+3. Novel Connections
+   - Cross-cutting themes (with citations)
+   - Interdisciplinary insights
+   - Emerging patterns
+
+4. Critical Evaluation
+   - Strengthened arguments (with citations)
+   - Counter-arguments addressed
+   - Enhanced evidence base
+
+5. Synthesis and Integration
+   - Integration with previous findings
+   - Enhanced understanding
+   - Refined conclusions
+
+6. Works Cited
+''' + WORKS_CITED_RULES + '''
+
+''' + CITATION_RULES,
+
+    "synthesis": '''Based on all previous research and analysis:
+
+REFINED PROMPT:
+{refined_prompt}
+
+FRAMEWORK:
+{framework}
+
+ALL RESEARCH RESULTS:
+{research_results}
+
+SOURCES (the merged Works Cited of the research above):
+{bibliography}
+
+Create a comprehensive research synthesis following this exact structure:
+
+Title: [Descriptive title reflecting the main focus of topic analysis]
+Subtitle: [Specific aspect of analysis]
+
+1. Executive Summary
+Provide a 2-3 paragraph overview that:
+- Synthesizes key findings with citations
+- Highlights major discoveries
+- Summarizes methodology
+
+2. Key Insights
+Present 4-6 major insights that:
+- Include specific citations
+- Focus on significant findings
+- Connect to methodology
+
+3. Analysis
+Develop a thorough analysis that:
+- Synthesizes all findings
+- Integrates perspectives
+- Evaluates evidence
+- Organizes by themes
+
+4. Conclusion
+Provide research implications:
+- Summarize key findings
+- Discuss impacts
+- Suggest future directions
+- Make recommendations
+
+5. Further Considerations
+Address complexities:
+- Present counter-arguments
+- Discuss limitations
+- Note uncertainties
+- Identify challenges
+
+6. Recommended Readings
+List essential sources:
+- Note seminal works
+- Include recent research
+- Add methodology guides
+- List digital resources
+
+7. Works Cited
+List only sources that are not already in SOURCES (SOURCES is appended to the report automatically):
+- Use APA 7th edition format
+- Add DOIs where available
+- Each entry should be on a new line
+- Each entry should end with a period
+- Each entry should start with a bullet point (*)
+
+Important Guidelines:
+- Use proper APA in-text citations (Author, Year)
+- Ensure every citation has a reference
+- Include both classic and recent works
+- Maintain academic tone
+- Cross-reference analyses
+- Format citations consistently
+- Include DOIs for recent works
+
+Format Guidelines:
+- Use numbered sections (1., 2., etc.)
+- Use bullet points for lists (-)
+- Include proper spacing between sections
+- Format references with bullet points
+- End each reference with a period''',
+
+    "followup_research": '''Using the following inputs from a completed analysis:
+
+REFINED PROMPT:
+{refined_prompt}
+
+FRAMEWORK:
+{framework}
+
+CURRENT REPORT:
+{final_analysis}
+
+FOLLOW-UP QUESTION:
+{question}
+
+Research the follow-up question in depth. Build on the current report rather than repeating it: cover only what is new or needed to answer the question.
+
+Structure your analysis using this format:
+
+Title: [Descriptive title reflecting the follow-up question]
+Subtitle: [Specific aspect being investigated]
+
+1. Answer Overview
+   - Direct answer to the question
+   - How it relates to the current report
+
+2. New Findings
+   - Evidence and insights not covered in the report (with citations)
+   - Supporting data (with citations)
+
+3. Implications
+   - How the findings change or extend the report's conclusions
+
+4. Works Cited
+''' + WORKS_CITED_RULES + '''
+
+Important:
+- Use proper APA in-text citations (Author, Year)
+- All citations must have corresponding entries in Works Cited''',
+
+    "followup_update": '''CURRENT REPORT:
+{final_analysis}
+
+FOLLOW-UP QUESTION:
+{question}
+
+NEW RESEARCH:
+{new_research}
+
+Write an addendum to the current report that answers the follow-up question using the new research. Do not rewrite the existing report.
+
+Guidelines:
+- Start with a 1-2 paragraph direct answer with citations
+- Note anything in the report that the new research revises or contradicts
+- End with any new Works Cited entries (APA 7th edition, one per line, each starting with a bullet point (*))
+
+Return only the addendum.''',
+}
+
+
+########################################
+# COMPACT TEMPLATES
+########################################
+COMPACT_TEMPLATES = {
+    "fact": '''One surprising, little-known, specific fact about '{topic}' in a single vivid sentence with 1-2 fitting emojis. Reply with the fact only.''',
+
+    "summary": '''Summarize {topic} in 1-2 sentences with 1-4 emojis placed next to the ideas they represent (not clustered, not only at the start). Reply with the summary only.''',
+
+    "summary_retry": '''Rewrite with at most 4 emojis, keeping the most relevant ones:
+{summary}''',
+
+    "framework": '''Topic: {topic}
+
+Write a refined research prompt, then "---", then an investigation framework using SECTION_n, POINT_n.m (title|description), SUB_n.m.k and META_ lines.
+
+Refined Prompt:
+[prompt]
+---
+[framework]''',
+
+    "research": '''REFINED PROMPT:
+{refined_prompt}
+
+FRAMEWORK:
+{framework}
+
+FOCUS: {current_aspect}
+
+Research the focus following the framework. Start with "Title: ..." and "Subtitle: ...", then cover: introduction, methodology, key findings, analysis, implications, limitations.
+''' + COMPACT_CITATION_RULES,
+
+    "research_followup": '''PREVIOUS ANALYSIS:
+{previous_analysis}
+
+Iteration #{iteration}: deepen this analysis. Start with "Title: ..." and "Subtitle: ...", then cover gaps, new evidence, novel connections, counter-arguments and an integrated conclusion.
+''' + COMPACT_CITATION_RULES,
+
+    "synthesis": '''REFINED PROMPT:
+{refined_prompt}
+
+FRAMEWORK:
+{framework}
+
+RESEARCH:
+{research_results}
+
+SOURCES:
+{bibliography}
+
+Synthesize the research into a report: "Title: ..." and "Subtitle: ...", then numbered sections 1. Executive Summary, 2. Key Insights, 3. Analysis, 4. Conclusion, 5. Further Considerations, 6. Recommended Readings, 7. Works Cited.
+Cite sources in APA style (Author, Year). SOURCES is appended as the Works Cited, so list there only new sources: one APA 7 entry per line, starting with "* ".''',
+
+    "followup_research": '''REFINED PROMPT:
+{refined_prompt}
+
+FRAMEWORK:
+{framework}
+
+CURRENT REPORT:
+{final_analysis}
+
+FOLLOW-UP QUESTION: {question}
+
+Research only what the report does not already cover to answer the question. Start with "Title: ..." and "Subtitle: ...", then a direct answer, new findings and implications.
+''' + COMPACT_CITATION_RULES,
+
+    "followup_update": '''CURRENT REPORT:
+{final_analysis}
+
+FOLLOW-UP QUESTION: {question}
+
+NEW RESEARCH:
+{new_research}
+
+Write only an addendum answering the question from the new research, noting anything in the report it revises, and ending with new APA Works Cited entries ("* " per line).''',
+}
+
+VARIANTS = {
+    "verbose": VERBOSE_TEMPLATES,
+    "compact": COMPACT_TEMPLATES,
+}
+
+
+def load_templates(variant: str = "verbose", overrides: dict = None):
+    """Compile the variant's templates, applying user-edited overrides.
+
+    Returns (templates, errors). An override that fails validation is
+    reported in `errors` and the variant's own template is used instead.
+    """
+    templates, errors = {}, {}
+    for name, text in VARIANTS[variant].items():
+        override = (overrides or {}).get(name)
+        if override is not None and override != text:
+            try:
+                templates[name] = compile_template(name, override)
+                continue
+            except TemplateError as e:
+                errors[name] = str(e)
+        templates[name] = compile_template(name, text)
+    return templates, errors
+
+
+def template_hash(templates: dict) -> str:
+    """Stable short hash of a template set (for cache and coalescing keys)."""
+    digest = hashlib.sha256()
+    for name in sorted(templates):
+        digest.update(name.encode())
+        digest.update(templates[name].text.encode())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,99 @@
+import io
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+import applog
+from applog import (
+    REDACTED, ContextFilter, DroppingQueueHandler, JsonFormatter, RedactingFilter, SamplingFilter,
+    add_secret, log_context, redact
+)
+
+API_KEY = "AIza" + "B" * 35
+
+
+@pytest.fixture(autouse=True)
+def no_secrets(monkeypatch):
+    monkeypatch.setattr(applog, "_secrets", set())
+
+
+def make_record(msg, *args, level=logging.INFO, name="test", exc_info=None):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+
+def to_json(record):
+    """The record as the app writes it: filtered on the logging thread, then formatted."""
+    for log_filter in (ContextFilter(), RedactingFilter()):
+        assert log_filter.filter(record)
+    return JsonFormatter().format(record)
+
+
+def test_redact_strips_keys_tokens_and_added_secrets():
+    add_secret("hunter2-password")
+    text = redact(f"key {API_KEY}, Bearer abcdefghijklmnopqrstu, url ?key=xyz&alt=json, hunter2-password")
+    assert text == f"key {REDACTED}, Bearer {REDACTED}, url ?key={REDACTED}&alt=json, {REDACTED}"
+
+
+def test_secrets_never_reach_the_json_output():
+    add_secret("s3cr3t-value")
+    record = make_record("Calling with %s and %s", API_KEY, "s3cr3t-value")
+    output = to_json(record)
+    assert API_KEY not in output and "s3cr3t-value" not in output
+    assert json.loads(output)["message"] == f"Calling with {REDACTED} and {REDACTED}"
+
+
+def test_secrets_are_redacted_from_tracebacks():
+    add_secret("s3cr3t-value")
+    try:
+        raise ValueError(f"bad key {API_KEY} for s3cr3t-value")
+    except ValueError:
+        record = make_record("Call failed", level=logging.ERROR, exc_info=sys.exc_info())
+    output = to_json(record)
+    assert API_KEY not in output and "s3cr3t-value" not in output
+    entry = json.loads(output)
+    assert "ValueError: bad key" in entry["exception"]
+    assert record.exc_info is None
+
+
+def test_context_fields_are_attached():
+    with log_context(run_id="run-1", stage="research", iteration=2):
+        entry = json.loads(to_json(make_record("working")))
+    assert (entry["run_id"], entry["stage"], entry["iteration"]) == ("run-1", "research", 2)
+    assert "run_id" not in json.loads(to_json(make_record("idle")))
+
+
+def test_sampling_keeps_one_in_n_debug_records_per_logger():
+    sampling = SamplingFilter(every=10)
+    kept = [sampling.filter(make_record("debug", level=logging.DEBUG, name="a")) for _ in range(100)]
+    assert sum(kept) == 10
+    assert sampling.filter(make_record("debug", level=logging.DEBUG, name="b"))
+    assert all(sampling.filter(make_record("info", level=logging.INFO, name="a")) for _ in range(5))
+
+
+def test_dropping_queue_handler_never_blocks():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.handle(make_record("record %d", i))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_configured_logger_writes_redacted_json(monkeypatch):
+    monkeypatch.setattr(applog, "_listener", None)
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    stream = io.StringIO()
+    listener = applog.configure_logging(stream=stream)
+    try:
+        add_secret("s3cr3t-value")
+        logging.getLogger("test_applog").info("key %s, secret %s", API_KEY, "s3cr3t-value")
+    finally:
+        listener.stop()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+    [line] = stream.getvalue().splitlines()
+    assert API_KEY not in line and "s3cr3t-value" not in line
+    assert json.loads(line)["logger"] == "test_applog"
@@ -0,0 +1,103 @@
+import os
+import time
+
+from artifacts import ArtifactStore
+
+
+def test_values_round_trip_in_memory_and_spilled():
+    store = ArtifactStore(spill_threshold=100)
+    small = store.put("s", "text", "short")
+    large = store.put("s", "pdf", b"x" * 1000)
+    listed = store.put("s", "results", [["Title", "Body"]])
+    assert store.get(small) == "short"
+    assert store.get(large) == b"x" * 1000
+    assert store.get(listed) == [["Title", "Body"]]
+    assert store.usage("s")["disk_bytes"] > 0
+    store.close()
+
+
+def test_memory_limit_spills_least_recently_used():
+    store = ArtifactStore(memory_limit=250, spill_threshold=1000)
+    first = store.put("s", "a", "a" * 200)
+    store.put("s", "b", "b" * 200)
+    assert store.memory_bytes() <= 250
+    assert store.get(first) == "a" * 200
+    store.close()
+
+
+def test_replacing_an_artifact_deletes_its_spilled_file():
+    store = ArtifactStore(spill_threshold=10)
+    store.put("s", "a", "x" * 100)
+    store.put("s", "a", "y" * 100)
+    assert len(os.listdir(os.path.join(store.spill_dir, "s"))) == 1
+    store.close()
+
+
+def test_reap_deletes_orphaned_spill_files():
+    store = ArtifactStore(spill_threshold=10)
+    kept = store.put("s", "a", "x" * 100)
+    open(os.path.join(store.spill_dir, "s", "orphan.z"), "wb").close()
+    os.makedirs(os.path.join(store.spill_dir, "closed-session"))
+    store.reap()
+    assert os.listdir(store.spill_dir) == ["s"]
+    assert os.listdir(os.path.join(store.spill_dir, "s")) == [f"{kept.key}.z"]
+    assert store.get(kept) == "x" * 100
+    store.close()
+
+
+def test_reap_drops_closed_sessions():
+    store = ArtifactStore(spill_threshold=10, disconnect_grace=0)
+    ref = store.put("s", "a", "x" * 100)
+    store.touch("s", is_alive=lambda: False)
+    store.reap()
+    assert store.get(ref) is None
+    assert not os.path.exists(os.path.join(store.spill_dir, "s"))
+    store.close()
+
+
+def test_reap_keeps_disconnected_sessions_for_the_grace_period():
+    store = ArtifactStore(disconnect_grace=0.05)
+    alive = [False]
+    ref = store.put("s", "a", "text")
+    store.touch("s", is_alive=lambda: alive[0])
+    store.reap()
+    assert store.get(ref) == "text"
+    # A reconnect restarts the grace period
+    alive[0] = True
+    time.sleep(0.06)
+    store.reap()
+    alive[0] = False
+    store.reap()
+    assert store.get(ref) == "text"
+    time.sleep(0.06)
+    store.reap()
+    assert store.get(ref) is None
+    store.close()
+
+
+def test_clearing_a_session_keeps_its_liveness_check():
+    store = ArtifactStore(disconnect_grace=0)
+    store.touch("s", is_alive=lambda: False)
+    old = store.put("s", "a", "old")
+    store.clear_session("s")
+    assert store.get(old) is None
+    new = store.put("s", "a", "new")
+    store.reap()
+    assert store.get(new) is None
+    store.close()
+
+
+def test_close_removes_its_own_spill_directory():
+    store = ArtifactStore(spill_threshold=10)
+    store.put("s", "a", "x" * 100)
+    spill_dir = store.spill_dir
+    store.close()
+    assert not os.path.exists(spill_dir)
+
+
+def test_close_leaves_a_given_directory_but_removes_its_files(tmp_path):
+    store = ArtifactStore(spill_dir=str(tmp_path), spill_threshold=10)
+    store.put("s", "a", "x" * 100)
+    store.close()
+    assert tmp_path.exists()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,208 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cancellation import CancelledError, CancelToken, RunRegistry, wait_for
+
+
+def test_cancel_is_one_shot_and_keeps_first_reason():
+    token = CancelToken("run")
+    assert token.cancel("first")
+    assert not token.cancel("second")
+    assert token.cancelled
+    assert token.reason == "first"
+
+
+def test_callbacks_run_once_and_immediately_when_already_cancelled():
+    token = CancelToken("run")
+    calls = []
+    token.add_callback(lambda: calls.append("early"))
+    token.cancel()
+    token.cancel()
+    token.add_callback(lambda: calls.append("late"))
+    assert calls == ["early", "late"]
+
+
+def test_removed_callback_is_not_called():
+    token = CancelToken("run")
+    calls = []
+    callback = lambda: calls.append(1)  # noqa: E731
+    token.add_callback(callback)
+    token.remove_callback(callback)
+    token.cancel()
+    assert calls == []
+
+
+def test_raise_if_cancelled_is_not_swallowed_by_except_exception():
+    token = CancelToken("run")
+    token.cancel("stop")
+    with pytest.raises(CancelledError):
+        try:
+            token.raise_if_cancelled()
+        except Exception:
+            pass
+
+
+def test_interrupted_check_cancels_at_checkpoint():
+    reason = []
+    token = CancelToken("run", interrupted=lambda: reason[0] if reason else None)
+    token.raise_if_cancelled()
+    reason.append("script rerun requested")
+    with pytest.raises(CancelledError):
+        token.raise_if_cancelled()
+    assert token.reason == "script rerun requested"
+
+
+def test_failing_interrupted_check_does_not_cancel():
+    token = CancelToken("run", interrupted=lambda: 1 / 0)
+    assert not token.poll()
+
+
+def test_wait_for_returns_result():
+    with ThreadPoolExecutor(1) as pool:
+        assert wait_for(pool.submit(lambda: 42), CancelToken("run")) == 42
+
+
+def test_wait_for_gives_up_when_cancelled_mid_call():
+    token = CancelToken("run")
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as pool:
+        future = pool.submit(release.wait, 5)
+        threading.Timer(0.1, token.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(CancelledError):
+            wait_for(future, token, poll_interval=0.02)
+        assert time.monotonic() - started < 1
+        release.set()
+
+
+def test_wait_for_removes_queued_work():
+    token = CancelToken("run")
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as pool:
+        pool.submit(release.wait, 5)
+        queued = pool.submit(lambda: "never")
+        threading.Timer(0.05, token.cancel).start()
+        with pytest.raises(CancelledError):
+            wait_for(queued, token, poll_interval=0.02)
+        assert queued.cancelled()
+        release.set()
+
+
+def test_wait_for_notices_interrupt_while_waiting():
+    interrupted = threading.Event()
+    token = CancelToken("run", interrupted=lambda: "rerun" if interrupted.is_set() else None)
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as pool:
+        future = pool.submit(release.wait, 5)
+        threading.Timer(0.1, interrupted.set).start()
+        with pytest.raises(CancelledError):
+            wait_for(future, token, poll_interval=0.02)
+        release.set()
+    assert token.reason == "rerun"
+
+
+def test_new_run_supersedes_previous_run_of_same_session():
+    registry = RunRegistry()
+    first = registry.start_run("session")
+    second = registry.start_run("session")
+    other = registry.start_run("other")
+    assert first.cancelled and first.reason == "superseded by a new run"
+    assert not second.cancelled and not other.cancelled
+    assert registry.active_runs() == 2
+
+
+def test_cancel_session_cancels_only_its_active_run():
+    registry = RunRegistry()
+    token = registry.start_run("session")
+    other = registry.start_run("other")
+    assert registry.cancel_session("session", "topic changed")
+    assert not registry.cancel_session("session", "again")
+    assert not registry.cancel_session("unknown", "no run")
+    assert token.reason == "topic changed"
+    assert not other.cancelled
+
+
+def test_finish_run_cancels_unless_completed():
+    registry = RunRegistry()
+    completed = registry.start_run("a")
+    abandoned = registry.start_run("b")
+    registry.finish_run(completed, completed=True)
+    registry.finish_run(abandoned)
+    assert not completed.cancelled
+    assert abandoned.cancelled
+    assert registry.active_runs() == 0
+
+
+def test_finishing_a_superseded_run_keeps_the_new_one_registered():
+    registry = RunRegistry()
+    old = registry.start_run("session")
+    new = registry.start_run("session")
+    registry.finish_run(old)
+    assert registry.active_runs() == 1
+    assert registry.cancel_session("session", "topic changed")
+    assert new.cancelled
+
+
+def test_reap_cancels_runs_of_closed_sessions():
+    registry = RunRegistry(disconnect_grace=0)
+    alive = {"a": True, "b": False}
+    a = registry.start_run("a", is_alive=lambda: alive["a"])
+    b = registry.start_run("b", is_alive=lambda: alive["b"])
+    failing = registry.start_run("c", is_alive=lambda: 1 / 0)
+    registry.reap()
+    assert not a.cancelled
+    assert b.cancelled and b.reason.startswith("session gone")
+    assert not failing.cancelled
+
+
+def test_reap_waits_out_a_disconnect_grace_period():
+    registry = RunRegistry(disconnect_grace=0.05)
+    alive = [False]
+    token = registry.start_run("a", is_alive=lambda: alive[0])
+    registry.reap()
+    assert not token.cancelled
+    # Reconnecting restarts the grace period
+    alive[0] = True
+    time.sleep(0.06)
+    registry.reap()
+    alive[0] = False
+    registry.reap()
+    assert not token.cancelled
+    time.sleep(0.06)
+    registry.reap()
+    assert token.cancelled
+
+
+def test_detached_runs_outlive_their_session():
+    registry = RunRegistry(disconnect_grace=0)
+    token = registry.start_run("a", is_alive=lambda: False)
+    registry.detach(token)
+    registry.reap()
+    assert not token.cancelled
+    assert registry.cancel_session("a", "topic changed")
+
+
+def test_reap_polls_interrupt_checks():
+    registry = RunRegistry()
+    token = registry.start_run("session", interrupted=lambda: "script stopped")
+    registry.reap()
+    assert token.cancelled and token.reason == "script stopped"
+
+
+def test_sleep_returns_after_the_delay():
+    started = time.monotonic()
+    CancelToken("run").sleep(0.05, poll_interval=0.01)
+    assert time.monotonic() - started >= 0.05
+
+
+def test_sleep_raises_as_soon_as_interrupted():
+    interrupted = threading.Event()
+    token = CancelToken("run", interrupted=lambda: "rerun" if interrupted.is_set() else None)
+    threading.Timer(0.05, interrupted.set).start()
+    started = time.monotonic()
+    with pytest.raises(CancelledError):
+        token.sleep(5, poll_interval=0.01)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,64 @@
+from citations import CitationIndex, in_text_citations, split_bibliography
+
+SMITH = "Smith, J. (2020). Woodpecker habitat in the Big Woods. Journal of Birds, 12(2), 1-20."
+SMITH_DOI = SMITH + " https://doi.org/10.1234/birds.5"
+DOE = "Doe, A., & Lee, K. (2019a). Acoustic surveys of large woodpeckers. Ornithology, 4, 33-40."
+
+
+def research(title, body, *entries):
+    works_cited = "\n".join(f"* {entry}" for entry in entries)
+    return f"Title: {title}\n{body}\n\n7. Works Cited\n{works_cited}"
+
+
+def test_split_bibliography_uses_last_heading():
+    text = "Intro about references.\n\n## References:\n- One.\n1. Two.\n\n"
+    body, entries = split_bibliography(text)
+    assert body == "Intro about references."
+    assert entries == ["One.", "Two."]
+    assert split_bibliography("No bibliography here.") == ("No bibliography here.", [])
+
+
+def test_in_text_citations_reads_grouped_citations():
+    cited = in_text_citations("As found (Smith, 2020; Doe & Lee, 2019a) and (see Müller et al., n.d.).")
+    assert cited == {("smith", "2020"), ("doe", "2019a"), ("muller", "n.d.")}
+
+
+def test_absorb_strips_bibliography_and_merges_duplicates():
+    index = CitationIndex()
+    first = index.absorb(research("Habitat", "Forests matter (Smith, 2020).", SMITH, DOE))
+    second = index.absorb(research("Sightings", "Calls were heard (Doe & Lee, 2019a).", SMITH_DOI, DOE))
+    assert "Works Cited" not in first and "Works Cited" not in second
+    assert len(index) == 2
+    assert index.duplicates == 2
+    # The copy with the DOI replaces the shorter one
+    assert any("doi.org/10.1234/birds.5" in entry for entry in index.entries())
+
+
+def test_doi_matches_despite_different_wording():
+    index = CitationIndex()
+    assert index.add("Smith, J. (2020). Habitat. https://doi.org/10.1234/birds.5")
+    assert not index.add("J. Smith 2020, a different title, doi:10.1234/BIRDS.5.")
+    assert len(index) == 1
+
+
+def test_render_lists_entries_alphabetically():
+    index = CitationIndex()
+    index.add(SMITH)
+    index.add(DOE)
+    assert index.render() == f"Works Cited\n\n* {DOE}\n* {SMITH}"
+    assert CitationIndex().render() == ""
+
+
+def test_finalize_replaces_bibliography_with_merged_one():
+    index = CitationIndex()
+    index.absorb(research("Habitat", "Forests (Smith, 2020).", SMITH))
+    final = index.finalize(research("Synthesis", "In sum (Smith, 2020; Doe & Lee, 2019a).", DOE))
+    body, entries = split_bibliography(final)
+    assert body == "Title: Synthesis\nIn sum (Smith, 2020; Doe & Lee, 2019a)."
+    assert entries == [DOE, SMITH]
+
+
+def test_unresolved_reports_citations_without_entries():
+    index = CitationIndex()
+    index.absorb(research("Habitat", "Forests (Smith, 2020) and calls (Garcia, 2018).", SMITH))
+    assert index.unresolved() == {("garcia", "2018")}
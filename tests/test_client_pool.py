@@ -0,0 +1,162 @@
+"""ClientPool against benchmarks/stub_gemini.py, over both transports."""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from client_pool import (  # noqa: E402
+    REST, TRANSPORTS, ClientPool, PoolExhausted, count_tokens_ping, gemini_client_factory
+)
+from metrics import Metrics  # noqa: E402
+from stub_gemini import start_stub  # noqa: E402
+
+
+@pytest.fixture(params=TRANSPORTS)
+def transport(request):
+    return request.param
+
+
+@pytest.fixture
+def stub(transport):
+    server = start_stub(transport, latency=0.2)
+    yield server
+    server.stop()
+
+
+def make_pool(transport, stub, **kwargs):
+    factory = gemini_client_factory("stub", "key", transport=transport, endpoint=stub.endpoint, max_concurrent=2)
+    kwargs.setdefault("health_interval", 3600)
+    return ClientPool(factory, metrics=Metrics(), **kwargs)
+
+
+def wait_until(check, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_model_is_bound_to_the_pooled_connection(transport, stub):
+    # gemini_client_factory relies on SDK internals (pinned in requirements.txt):
+    # GenerativeModel._client, and the REST transport's requests session
+    from google.ai import generativelanguage as glm
+
+    client = gemini_client_factory("stub", "key", transport=transport, endpoint=stub.endpoint, max_concurrent=2)()
+    try:
+        assert isinstance(client.model._client, glm.GenerativeServiceClient)
+        if transport == REST:
+            adapter = client.model._client._transport._session.get_adapter(stub.endpoint)
+            assert adapter._pool_maxsize == 2
+        assert client.model.generate_content("hi").text == "Stub response."
+        assert stub.requests == 1
+    finally:
+        client.close()
+
+
+def test_warm_up_connects_before_the_first_call(transport, stub):
+    pool = make_pool(transport, stub, size=1, warm_up=count_tokens_ping)
+    pool.start()
+    try:
+        wait_until(lambda: pool.stats()["connections"] == 1)
+        assert stub.requests == 1  # the count_tokens ping
+
+        assert pool.generate_content("hi").text == "Stub response."
+        assert pool.stats()["connections"] == 1
+        assert pool.metrics.get("client_pool.calls.reused_connection") == 1
+        assert pool.metrics.get("client_pool.calls.new_connection") == 0
+    finally:
+        pool.close()
+
+
+def test_calls_per_client_are_capped_at_max_concurrent(transport, stub):
+    pool = make_pool(transport, stub, size=1, max_concurrent=2)
+    peak = []
+    calls = [threading.Thread(target=pool.generate_content, args=(f"Prompt {i}",)) for i in range(4)]
+    started = time.monotonic()
+    for call in calls:
+        call.start()
+    while any(call.is_alive() for call in calls):
+        peak.append(pool.stats()["in_flight"])
+        time.sleep(0.01)
+    try:
+        assert max(peak) == 2
+        # Two rounds of two 0.2s calls on the one client
+        assert time.monotonic() - started >= 0.4
+        stats = pool.stats()
+        assert (stats["clients"], stats["in_flight"], stats["calls"]) == (1, 0, 4)
+    finally:
+        pool.close()
+
+
+def test_acquire_raises_pool_exhausted_when_every_slot_is_taken(transport, stub):
+    pool = make_pool(transport, stub, size=1, max_concurrent=2)
+    try:
+        held = [pool.acquire(), pool.acquire()]
+        assert held[0] is held[1]
+        assert pool.free_slots() == 0
+        with pytest.raises(PoolExhausted):
+            pool.acquire(timeout=0.1)
+        assert pool.metrics.get("client_pool.exhausted") == 1
+
+        pool.release(held.pop())
+        assert pool.acquire(timeout=0.1) is held[0]
+    finally:
+        pool.close()
+
+
+def test_client_is_replaced_after_max_failures(transport, stub):
+    pool = make_pool(transport, stub, size=1, max_failures=3)
+    try:
+        failing = pool.acquire()
+        pool.release(failing, ok=False)
+        pool.release(pool.acquire(), ok=False)
+        assert pool.stats()["clients"] == 1
+        pool.release(pool.acquire(), ok=False)
+        assert pool.stats()["clients"] == 0
+        assert pool.metrics.get("client_pool.recycled") == 1
+
+        replacement = pool.acquire()
+        assert replacement is not failing
+        assert replacement.model.generate_content("hi").text == "Stub response."
+        pool.release(replacement)
+    finally:
+        pool.close()
+
+
+def test_failed_health_check_replaces_the_client(transport, stub):
+    failing = threading.Event()
+
+    def check(model):
+        if failing.is_set():
+            raise ConnectionError("stub unreachable")
+        count_tokens_ping(model)
+
+    pool = make_pool(transport, stub, size=1, warm_up=check, health_interval=0)
+    try:
+        pool._fill()
+        original = pool.acquire()
+        pool.release(original)
+
+        pool._check()
+        assert pool.acquire(timeout=0.1) is original
+        pool.release(original)
+
+        failing.set()
+        pool._check()
+        assert pool.stats()["clients"] == 0
+        assert pool.metrics.get("client_pool.health_failures") == 1
+        assert pool.metrics.get("client_pool.recycled") == 1
+
+        failing.clear()
+        pool._fill()
+        replacement = pool.acquire(timeout=0.1)
+        assert replacement is not original
+        pool.release(replacement)
+    finally:
+        pool.close()
@@ -0,0 +1,53 @@
+from estimator import DEFAULT_CALL_PROFILES, DEPTH_LOOPS, RunBudget, choose_loops, estimate_run
+
+TEMPLATE_TOKENS = {call_type: 100 for call_type in DEFAULT_CALL_PROFILES}
+TOPIC = "Ivory-billed woodpecker sightings"
+
+
+def test_unlimited_budget_allows_anything():
+    budget = RunBudget()
+    budget.charge(10 ** 9)
+    assert budget.max_tokens is None and budget.max_seconds is None
+    assert budget.fits(estimate_run(10, TOPIC, TEMPLATE_TOKENS))
+    assert budget.allows(10 ** 9, 10 ** 6)
+
+
+def test_allows_keeps_the_reserve_free():
+    budget = RunBudget(max_tokens=1000)
+    budget.charge(600)
+    assert budget.allows(300, 0)
+    assert not budget.allows(300, 0, reserve_tokens=200)
+    assert not budget.allows(500, 0)
+
+
+def test_allows_counts_elapsed_time():
+    budget = RunBudget(max_seconds=100)
+    assert budget.allows(0, 60, reserve_seconds=30)
+    budget.started -= 50
+    assert budget.elapsed >= 50
+    assert not budget.allows(0, 30, reserve_seconds=30)
+
+
+def test_fits_checks_tokens_and_seconds():
+    estimate = estimate_run(2, TOPIC, TEMPLATE_TOKENS)
+    assert RunBudget(max_tokens=estimate.total_tokens, max_seconds=estimate.seconds).fits(estimate)
+    assert not RunBudget(max_tokens=estimate.total_tokens - 1).fits(estimate)
+    assert not RunBudget(max_seconds=estimate.seconds - 1).fits(estimate)
+
+
+def test_choose_loops_without_budget_stays_in_range():
+    low, high = DEPTH_LOOPS["Ocean"]
+    for _ in range(20):
+        assert low <= choose_loops("Ocean", TOPIC, TEMPLATE_TOKENS) <= high
+        assert low <= choose_loops("Ocean", TOPIC, TEMPLATE_TOKENS, budget=RunBudget()) <= high
+
+
+def test_choose_loops_picks_deepest_run_that_fits():
+    five = estimate_run(5, TOPIC, TEMPLATE_TOKENS)
+    assert choose_loops("Ocean", TOPIC, TEMPLATE_TOKENS, budget=RunBudget(max_tokens=five.total_tokens)) == 5
+    assert choose_loops("Ocean", TOPIC, TEMPLATE_TOKENS, budget=RunBudget(max_seconds=five.seconds)) == 5
+
+
+def test_choose_loops_falls_back_to_shallowest():
+    low, _ = DEPTH_LOOPS["Mariana Trench"]
+    assert choose_loops("Mariana Trench", TOPIC, TEMPLATE_TOKENS, budget=RunBudget(max_tokens=10)) == low
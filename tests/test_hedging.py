@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hedging import Hedger
+from metrics import Metrics
+
+
+def hedger_with_latency(seconds, **kwargs):
+    """A Hedger whose research calls are hedged after about `seconds`."""
+    metrics = Metrics()
+    for _ in range(20):
+        metrics.record_call("research", seconds, 0, 0)
+    return Hedger(metrics, min_samples=20, max_hedge_rate=1.0, **kwargs)
+
+
+def test_slow_call_is_hedged_and_duplicate_wins():
+    hedger = hedger_with_latency(0.05)
+    release = threading.Event()
+    submitted = []
+    with ThreadPoolExecutor(2) as pool:
+        def submit():
+            submitted.append("primary")
+            return pool.submit(lambda: release.wait(5) and "primary")
+
+        def duplicate():
+            submitted.append("duplicate")
+            return pool.submit(lambda: "duplicate")
+
+        assert hedger.call(submit, "research", duplicate=duplicate) == "duplicate"
+        assert submitted == ["primary", "duplicate"]
+        assert hedger.metrics.get("hedge.won.research") == 1
+        release.set()
+
+
+def test_queued_call_is_not_hedged():
+    hedger = hedger_with_latency(0.05)
+    release = threading.Event()
+    calls = []
+    with ThreadPoolExecutor(1) as pool:
+        pool.submit(release.wait, 5)
+
+        def submit():
+            calls.append("submit")
+            return pool.submit(lambda: "done")
+
+        threading.Timer(0.2, release.set).start()
+        assert hedger.call(submit, "research") == "done"
+    assert calls == ["submit"]
+
+
+def test_no_hedge_without_capacity():
+    hedger = hedger_with_latency(0.01, has_capacity=lambda: False)
+    calls = []
+    with ThreadPoolExecutor(2) as pool:
+        def submit():
+            calls.append("submit")
+            return pool.submit(time.sleep, 0.1)
+
+        hedger.call(submit, "research")
+    assert calls == ["submit"]
+    assert hedger.metrics.get("hedge.skipped_no_capacity") == 1
+
+
+def test_per_call_capacity_check_replaces_the_hedgers_own():
+    hedger = hedger_with_latency(0.01, has_capacity=lambda: True)
+    calls = []
+    with ThreadPoolExecutor(2) as pool:
+        def submit():
+            calls.append("submit")
+            return pool.submit(time.sleep, 0.1)
+
+        hedger.call(submit, "research", has_capacity=lambda: False)
+    assert calls == ["submit"]
+    assert hedger.metrics.get("hedge.skipped_no_capacity") == 1
+
+
+def test_running_loser_counts_against_the_hedge_rate():
+    hedger = hedger_with_latency(0.01)
+    hedger.max_hedge_rate = 0.25
+    for _ in range(8):
+        hedger._record(False)
+    release = threading.Event()
+    with ThreadPoolExecutor(4) as pool:
+        fast = iter([False, True])
+
+        def submit():
+            # The first call's primary hangs; its duplicate returns at once
+            return pool.submit(lambda quick=next(fast, True): "ok" if quick else release.wait(5))
+
+        assert hedger.call(submit, "research") == "ok"
+        assert hedger._losers_running == 1
+        # 1 hedge in 9 calls would allow another; the loser still running tips it over the cap
+        assert not hedger._may_hedge()
+        release.set()
+        deadline = time.monotonic() + 5
+        while hedger._losers_running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert hedger._losers_running == 0
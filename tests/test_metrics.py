@@ -0,0 +1,70 @@
+import json
+import logging
+
+import pytest
+
+from applog import JsonFormatter
+from metrics import Metrics
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_report_covers_counters_calls_and_samples():
+    metrics = Metrics()
+    metrics.incr("hedge.won.research")
+    metrics.record_call("research", 2.0, 100, 50)
+    metrics.observe("queue_wait.interactive", 0.5)
+    report = metrics.report()
+    assert report["counters"] == {"hedge.won.research": 1, "calls.research": 1}
+    assert report["calls"]["research"]["latency_p90"] == 2.0
+    assert report["samples"]["queue_wait.interactive"]["count"] == 1
+    json.dumps(report)
+
+
+class StopReporting(Exception):
+    pass
+
+
+def test_reporter_logs_the_report_as_json(monkeypatch):
+    capture = Capture()
+    logger = logging.getLogger("test_metrics_reporter")
+    logger.addHandler(capture)
+    logger.setLevel(logging.INFO)
+    metrics = Metrics()
+    metrics.incr("runs_cancelled", 2)
+
+    sleeps = []
+
+    def sleep(seconds):
+        # Let one report through, then stop the loop
+        sleeps.append(seconds)
+        if len(sleeps) > 1:
+            raise StopReporting
+
+    monkeypatch.setattr("metrics.time.sleep", sleep)
+    try:
+        with pytest.raises(StopReporting):
+            metrics._report_forever(300, logger)
+    finally:
+        logger.removeHandler(capture)
+
+    assert sleeps == [300, 300]
+    [record] = capture.records
+    assert record.getMessage() == "metrics report"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["metrics"]["counters"] == {"runs_cancelled": 2}
+
+
+def test_start_reporting_starts_one_thread():
+    metrics = Metrics()
+    metrics.start_reporting(3600)
+    reporter = metrics._reporter
+    metrics.start_reporting(3600)
+    assert metrics._reporter is reporter and reporter.daemon and reporter.is_alive()
@@ -0,0 +1,210 @@
+import threading
+import time
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import (
+    INTERACTIVE, PLACEHOLDER_EMAIL, RESEARCH, SPECULATIVE, QuotaExceeded, Scheduler, quota_user_id
+)
+
+
+def blocked_scheduler(**kwargs):
+    """A one-worker scheduler whose worker is held until the returned event is set."""
+    scheduler = Scheduler(max_workers=1, **kwargs)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    blocker = scheduler.submit(block, "blocker")
+    assert started.wait(5)
+    return scheduler, release, blocker
+
+
+def test_submit_runs_call_and_returns_result():
+    scheduler = Scheduler(max_workers=2)
+    assert scheduler.submit(lambda: 42, "session").result(5) == 42
+
+
+def test_call_errors_reach_the_future():
+    scheduler = Scheduler(max_workers=1)
+    future = scheduler.submit(lambda: 1 / 0, "session")
+    with pytest.raises(ZeroDivisionError):
+        future.result(5)
+
+
+def test_session_quota_rejects_calls_over_it():
+    scheduler = Scheduler(max_workers=1, session_token_quota=100)
+    scheduler.submit(lambda: None, "a", tokens=60).result(5)
+    with pytest.raises(QuotaExceeded):
+        scheduler.submit(lambda: None, "a", tokens=50)
+    # Another session has its own quota
+    scheduler.submit(lambda: None, "b", tokens=60).result(5)
+    assert scheduler.remaining_tokens("a") == 40
+
+
+def test_user_quota_spans_sessions():
+    scheduler = Scheduler(max_workers=1, user_token_quota=100)
+    scheduler.submit(lambda: None, "a", user_id="user", tokens=70).result(5)
+    with pytest.raises(QuotaExceeded):
+        scheduler.submit(lambda: None, "b", user_id="user", tokens=40)
+    assert scheduler.remaining_tokens("c", "user") == 30
+
+
+def test_output_tokens_charged_after_a_call_count_against_the_quota():
+    scheduler = Scheduler(max_workers=1, session_token_quota=100)
+    scheduler.charge("a", None, 90)
+    assert scheduler.remaining_tokens("a") == 10
+    with pytest.raises(QuotaExceeded):
+        scheduler.submit(lambda: None, "a", tokens=20)
+
+
+def test_quota_is_a_rolling_window():
+    scheduler = Scheduler(max_workers=1, session_token_quota=100, token_window=0.05)
+    scheduler.submit(lambda: None, "a", tokens=100).result(5)
+    time.sleep(0.1)
+    assert scheduler.remaining_tokens("a") == 100
+    scheduler.submit(lambda: None, "a", tokens=100).result(5)
+
+
+def test_no_quota_means_unlimited():
+    scheduler = Scheduler(max_workers=1)
+    assert scheduler.remaining_tokens("a") is None
+
+
+def test_call_cancelled_before_it_runs_is_refunded():
+    scheduler, release, _ = blocked_scheduler(session_token_quota=100)
+    queued = scheduler.submit(lambda: None, "a", tokens=80)
+    assert scheduler.remaining_tokens("a") == 20
+    assert queued.cancel()
+    assert scheduler.remaining_tokens("a") == 100
+    release.set()
+
+
+def test_call_that_started_is_not_refunded():
+    scheduler = Scheduler(max_workers=1, session_token_quota=100)
+    started = threading.Event()
+    release = threading.Event()
+    future = scheduler.submit(lambda: (started.set(), release.wait(5)), "a", tokens=80)
+    assert started.wait(5)
+    assert not future.cancel()
+    release.set()
+    future.result(5)
+    assert scheduler.remaining_tokens("a") == 20
+
+
+def test_higher_priority_calls_run_first():
+    scheduler, release, _ = blocked_scheduler()
+    order = []
+    futures = [
+        scheduler.submit(lambda: order.append("speculative"), "a", priority=SPECULATIVE),
+        scheduler.submit(lambda: order.append("research"), "a", call_type="research"),
+        scheduler.submit(lambda: order.append("fact"), "a", call_type="fact"),
+        scheduler.submit(lambda: order.append("synthesis"), "a", call_type="synthesis"),
+    ]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["fact", "synthesis", "research", "speculative"]
+
+
+def test_sessions_are_served_round_robin_within_a_priority():
+    scheduler, release, _ = blocked_scheduler()
+    order = []
+    futures = [
+        scheduler.submit(lambda i=i: order.append(f"a{i}"), "a", priority=RESEARCH)
+        for i in range(3)
+    ]
+    futures += [
+        scheduler.submit(lambda i=i: order.append(f"b{i}"), "b", priority=RESEARCH)
+        for i in range(2)
+    ]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["a0", "b0", "a1", "b1", "a2"]
+
+
+def test_session_concurrency_limit_lets_other_sessions_through():
+    scheduler = Scheduler(max_workers=3, session_concurrency=1)
+    release = threading.Event()
+    running = []
+    lock = threading.Lock()
+    peak = [0]
+
+    def call(name):
+        with lock:
+            running.append(name)
+            peak[0] = max(peak[0], sum(1 for r in running if r == "a"))
+        release.wait(5)
+        with lock:
+            running.remove(name)
+        return name
+
+    a1 = scheduler.submit(lambda: call("a"), "a", priority=INTERACTIVE)
+    a2 = scheduler.submit(lambda: call("a"), "a", priority=INTERACTIVE)
+    b = scheduler.submit(lambda: call("b"), "b", priority=INTERACTIVE)
+    deadline = time.monotonic() + 5
+    while "b" not in running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "b" in running
+    assert not a2.running() and not a2.done()
+    release.set()
+    assert [f.result(5) for f in (a1, a2, b)] == ["a", "a", "b"]
+    assert peak[0] == 1
+
+
+def test_cancelled_queued_calls_are_skipped():
+    scheduler, release, _ = blocked_scheduler()
+    ran = []
+    dropped = scheduler.submit(lambda: ran.append("dropped"), "a")
+    kept = scheduler.submit(lambda: ran.append("kept"), "a")
+    dropped.cancel()
+    release.set()
+    kept.result(5)
+    assert ran == ["kept"]
+    assert scheduler.queued() == 0
+
+
+def test_sessions_without_a_real_identity_get_separate_user_quotas():
+    scheduler = Scheduler(max_workers=1, user_token_quota=100)
+    users = {session: quota_user_id(email, session) for session, email in
+             (("a", PLACEHOLDER_EMAIL), ("b", PLACEHOLDER_EMAIL), ("c", None))}
+    assert len(set(users.values())) == 3
+    for session, user in users.items():
+        scheduler.submit(lambda: None, session, user_id=user, tokens=80).result(5)
+    assert quota_user_id("ada@example.org", "a") == quota_user_id("ada@example.org", "b")
+
+
+def test_idle_sessions_and_users_are_forgotten(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "USAGE_SWEEP_SECONDS", 0.0)
+    scheduler = Scheduler(max_workers=2, session_token_quota=100, token_window=0.05)
+    for session in ("a", "b", "c"):
+        scheduler.submit(lambda: None, session, user_id=f"user-{session}", tokens=10).result(5)
+    time.sleep(0.1)
+    scheduler.submit(lambda: None, "d", tokens=10).result(5)
+    deadline = time.monotonic() + 5
+    while scheduler._running_sessions and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert set(scheduler._usage) == {("session", "d"), ("user", "d")}
+    assert not scheduler._running_sessions and not scheduler._running_users
+
+
+def test_free_slots_counts_running_and_queued_calls_against_both_limits():
+    scheduler = Scheduler(max_workers=1, session_concurrency=3, user_concurrency=4)
+    release = threading.Event()
+    started = threading.Event()
+    scheduler.submit(lambda: (started.set(), release.wait(5)), "a", user_id="user")
+    assert started.wait(5)
+    scheduler.submit(lambda: None, "a", user_id="user")
+    assert scheduler.free_slots("a", "user") == 1
+    # The user's other session uses up the user's last slot
+    scheduler.submit(lambda: None, "b", user_id="user")
+    assert scheduler.free_slots("b", "user") == 1
+    scheduler.submit(lambda: None, "b", user_id="user")
+    assert scheduler.free_slots("a", "user") == 0
+    assert scheduler.free_slots("c") == 3
+    release.set()
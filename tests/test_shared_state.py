@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from shared_state import CANCELLED, COMPLETE, RUNNING, SharedStore, flight_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SharedStore(str(tmp_path / "state.db"))
+
+
+def test_first_claim_wins_and_later_claims_get_the_leader(store):
+    store.start_run("a", "s1", "topic")
+    store.start_run("b", "s2", "topic")
+    assert store.claim_flight("key", "a", 300) == "a"
+    assert store.claim_flight("key", "b", 300) == "a"
+    assert store.flight_leader("key", 300) == "a"
+
+
+def test_different_keys_do_not_coalesce(store):
+    store.start_run("a", "s1", "topic")
+    store.start_run("b", "s2", "other topic")
+    assert store.claim_flight("key-a", "a", 300) == "a"
+    assert store.claim_flight("key-b", "b", 300) == "b"
+
+
+def test_finished_or_released_leader_can_be_replaced(store):
+    store.start_run("a", "s1", "topic")
+    store.start_run("b", "s2", "topic")
+    store.start_run("c", "s3", "topic")
+    store.claim_flight("key", "a", 300)
+    store.update_run("a", status=COMPLETE)
+    assert store.claim_flight("key", "b", 300) == "b"
+    store.release_flight("key", "b")
+    assert store.flight_leader("key", 300) is None
+    assert store.claim_flight("key", "c", 300) == "c"
+
+
+def test_release_by_a_non_owner_keeps_the_claim(store):
+    store.start_run("a", "s1", "topic")
+    store.claim_flight("key", "a", 300)
+    store.release_flight("key", "b")
+    assert store.flight_leader("key", 300) == "a"
+
+
+def test_stale_leader_is_taken_over(store):
+    store.start_run("a", "s1", "topic")
+    store.claim_flight("key", "a", 300)
+    time.sleep(0.05)
+    store.start_run("b", "s2", "topic")
+    assert store.claim_flight("key", "b", 0.01) == "b"
+    assert store.get_run("a")["status"] == RUNNING
+
+
+def test_concurrent_claims_elect_one_leader(tmp_path):
+    path = str(tmp_path / "state.db")
+    SharedStore(path)
+    runs = [f"run-{i}" for i in range(8)]
+    barrier = threading.Barrier(len(runs))
+    leaders = {}
+
+    def claim(run_id):
+        # Separate stores stand in for separate worker processes
+        store = SharedStore(path, busy_timeout=10)
+        store.start_run(run_id, run_id, "topic")
+        barrier.wait()
+        leaders[run_id] = store.claim_flight("key", run_id, 300)
+
+    threads = [threading.Thread(target=claim, args=(run_id,)) for run_id in runs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(leaders.values())) == 1
+    assert set(leaders.values()) <= set(runs)
+
+
+def test_delete_run_removes_results_and_events(store):
+    store.start_run("a", "s1", "topic")
+    store.set_result("a", "fact", "A fact")
+    store.add_event("a", "research", ["Title", "Body"])
+    store.delete_run("a")
+    assert store.get_run("a") is None
+    assert store.events("a") == []
+
+
+def test_results_and_events_round_trip(store):
+    store.start_run("a", "s1", "topic")
+    store.set_result("a", "framework", {"aspects": ["x"]})
+    store.add_event("a", "research", ["T1", "B1"])
+    store.add_event("a", "progress", {"stage": 2})
+    store.add_event("a", "research", ["T2", "B2"])
+    store.update_run("a", status=CANCELLED, current_step=2)
+    run = store.get_run("a")
+    assert run["status"] == CANCELLED and run["current_step"] == 2
+    assert run["results"] == {"framework": {"aspects": ["x"]}}
+    assert [payload for _, _, payload in store.events("a", kind="research")] == [["T1", "B1"], ["T2", "B2"]]
+
+
+def test_flight_key_ignores_case_spacing_and_trailing_punctuation():
+    assert flight_key("Is it  extinct?", "Lake", "h") == flight_key("is it extinct", "Lake", "h")
+    assert flight_key("Is it extinct?", "Lake", "h") != flight_key("Is it extinct?", "Ocean", "h")
+
+
+def test_flight_key_includes_the_run_budget():
+    unlimited = flight_key("topic", "Ocean", "h")
+    assert flight_key("topic", "Ocean", "h", 0, 0) == unlimited
+    assert flight_key("topic", "Ocean", "h", max_seconds=180) != unlimited
+    assert flight_key("topic", "Ocean", "h", max_tokens=50000) != unlimited
+    assert flight_key("topic", "Ocean", "h", 50000, 180) != flight_key("topic", "Ocean", "h", 50000, 300)
+
+
+def test_fork_copies_a_run_and_leaves_the_original_alone(store):
+    store.start_run("a", "s1", "topic")
+    store.set_result("a", "final_analysis", "report")
+    store.add_event("a", "research", ["One", "first"])
+    store.add_event("a", "research", ["Two", "second"])
+    store.update_run("a", status=COMPLETE, current_step=4)
+
+    store.fork_run("a", "b", "s2")
+    store.add_event("b", "research", ["Follow-up", "third"])
+    store.set_result("b", "final_analysis", "report with addendum")
+
+    fork = store.get_run("b")
+    assert (fork["session_id"], fork["topic"], fork["status"], fork["current_step"]) == ("s2", "topic", COMPLETE, 4)
+    assert fork["results"] == {"final_analysis": "report with addendum"}
+    assert [payload for _, _, payload in store.events("b", kind="research")] == [
+        ["One", "first"], ["Two", "second"], ["Follow-up", "third"]
+    ]
+    assert store.get_run("a")["results"] == {"final_analysis": "report"}
+    assert len(store.events("a")) == 2
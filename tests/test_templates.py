@@ -0,0 +1,39 @@
+import re
+
+import pytest
+
+from templates import TEMPLATE_FIELDS, VARIANTS, TemplateError, compile_template, load_templates
+
+VALUES = {field: f"<{field}>" for required, optional in TEMPLATE_FIELDS.values() for field in required + optional}
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_render_matches_str_format(variant):
+    templates, errors = load_templates(variant)
+    assert not errors
+    for name, template in templates.items():
+        assert template.render(**VALUES, unused="ignored") == VARIANTS[variant][name].format(**VALUES)
+
+
+def test_escaped_braces_render_literally():
+    template = compile_template("fact", "About {topic}: {{not a field}}")
+    assert template.fields == {"topic"}
+    assert template.render(topic="birds") == "About birds: {not a field}"
+
+
+@pytest.mark.parametrize("text, message", [
+    ("Tell me about {topic", "fact: "),
+    ("{topic} and {audience}", "unknown placeholder(s) {audience}"),
+    ("No placeholders", "missing placeholder(s) {topic}"),
+    ("{topic!r}", "unsupported placeholder {topic}"),
+    ("{topic.title}", "unsupported placeholder {topic.title}"),
+])
+def test_invalid_templates_are_rejected(text, message):
+    with pytest.raises(TemplateError, match=re.escape(message)):
+        compile_template("fact", text)
+
+
+def test_bad_override_falls_back_to_the_variant_template():
+    templates, errors = load_templates("compact", {"fact": "Fact about {subject}"})
+    assert "unknown placeholder(s) {subject}" in errors["fact"]
+    assert templates["fact"].text == VARIANTS["compact"]["fact"]
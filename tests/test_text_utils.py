@@ -0,0 +1,22 @@
+from text_utils import count_emojis, get_title_emoji, is_emoji, to_latin1
+
+
+def test_count_emojis_counts_sequences_once():
+    assert count_emojis("plain ascii") == 0
+    assert count_emojis("🇺🇸 👍🏽 👨‍👩‍👧") == 3
+    assert count_emojis("▶️ Play ◀️") == 2
+
+
+def test_count_emojis_ignores_cjk_text():
+    assert count_emojis("中文 テキスト") == 0
+    assert not is_emoji("中")
+
+
+def test_title_emoji_uses_first_listed_keyword():
+    assert get_title_emoji("Economic Impact Analysis") == "📊 "
+    assert get_title_emoji("Economic impact") == "💥 "
+    assert get_title_emoji("Woodpeckers") == "🔍 "
+
+
+def test_to_latin1_drops_emoji_and_fixes_punctuation():
+    assert to_latin1("🐦 “Ivory-bill” — café") == ' "Ivory-bill" - café'
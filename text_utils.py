@@ -0,0 +1,227 @@
+"""Text helpers applied to model output.
+
+Everything here runs over every research block (thousands of them in a
+batch), so patterns are compiled once at import and lookups avoid
+per-call rebuilding.
+"""
+
+import bisect
+import logging
+import re
+
+# Code points that render as emoji, as inclusive (start, end) ranges in order
+EMOJI_RANGES = (
+    (0x231A, 0x231B),    # watch, hourglass
+    (0x23E9, 0x23F3),    # media controls, alarm clock
+    (0x23F8, 0x23FA),    # pause, stop, record
+    (0x24C2, 0x24C2),    # circled M
+    (0x25AA, 0x25AB),    # small squares
+    (0x25B6, 0x25B6),    # play
+    (0x25C0, 0x25C0),    # reverse
+    (0x25FB, 0x25FE),    # medium and small squares
+    (0x2600, 0x27BF),    # miscellaneous symbols, dingbats
+    (0x2934, 0x2935),    # curved arrows
+    (0x2B05, 0x2B07),    # arrows
+    (0x2B1B, 0x2B1C),    # large squares
+    (0x2B50, 0x2B50),    # star
+    (0x2B55, 0x2B55),    # circle
+    (0x3030, 0x3030),    # wavy dash
+    (0x303D, 0x303D),    # part alternation mark
+    (0x3297, 0x3297),    # circled ideograph congratulation
+    (0x3299, 0x3299),    # circled ideograph secret
+    (0x1F004, 0x1F004),  # mahjong tile
+    (0x1F0CF, 0x1F0CF),  # joker
+    (0x1F170, 0x1F251),  # enclosed letters and ideographs, regional indicators
+    (0x1F300, 0x1F64F),  # symbols and pictographs, emoticons
+    (0x1F680, 0x1F6FF),  # transport and map
+    (0x1F7E0, 0x1F7EB),  # coloured circles and squares
+    (0x1F900, 0x1F9FF),  # supplemental symbols and pictographs
+    (0x1FA70, 0x1FAFF),  # symbols and pictographs extended-A
+)
+_EMOJI_STARTS = [start for start, _ in EMOJI_RANGES]
+
+_EMOJI_CLASS = "".join(f"\\U{start:08X}-\\U{end:08X}" for start, end in EMOJI_RANGES)
+_MODIFIERS = "\\uFE0F\\U0001F3FB-\\U0001F3FF"  # variation selector, skin tones
+_REGIONAL = "\\U0001F1E6-\\U0001F1FF"  # flags are pairs of regional indicators
+# One visible emoji: a flag or a ZWJ sequence with modifiers. A single branch keeps
+# the scan fast; the lookbehind only runs once an emoji has matched.
+EMOJI_PATTERN = re.compile(
+    f"[{_EMOJI_CLASS}](?:(?<=[{_REGIONAL}])[{_REGIONAL}])?[{_MODIFIERS}]*"
+    f"(?:\\u200D[{_EMOJI_CLASS}][{_MODIFIERS}]*)*"
+)
+
+_FACT_PREFIX = re.compile(r"^(?:Fact:|Here's a fact:|The fact is:?)", re.IGNORECASE)
+_FACT_QUOTES = "\"“”"
+_TITLE_PREFIX = re.compile(r"^[#*\s]*(?:Title:)?", re.IGNORECASE)
+# "1. Habitat", "**2) Evidence**", "## 3. Sightings", "Section 4: Outlook"
+_SECTION_HEADER = re.compile(r"^[*#\s]*(?:section\s+)?\d+[.):]", re.IGNORECASE)
+_SECTION_MARKER = re.compile(r"^[*#\s]*(?:section\s+)?\d+[.):]?[*\s]*", re.IGNORECASE)
+# "- point", "• point", "* point" (but not "**bold**"), "a) point"
+_POINT_MARKER = re.compile(r"^(?:[-•⚫○●+]|\*(?!\*)|[a-zA-Z]\))\s*")
+_SUB_MARKER = re.compile(r"^(?:i|ii|iii|iv|v)\.\s*", re.IGNORECASE)
+# Typography models like to use, spelled with what the PDF's Latin-1 core fonts have
+_LATIN1_PUNCTUATION = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-", "−": "-", "…": "...", "•": "-",
+})
+
+
+def is_emoji(char: str) -> bool:
+    """Whether a single character is an emoji code point."""
+    if not char:
+        return False
+    code = ord(char[0])
+    i = bisect.bisect_right(_EMOJI_STARTS, code) - 1
+    return i >= 0 and code <= EMOJI_RANGES[i][1]
+
+
+def count_emojis(text: str) -> int:
+    """Number of visible emojis in `text` (a flag or ZWJ sequence counts once)."""
+    if not text or text.isascii():
+        return 0
+    return len(EMOJI_PATTERN.findall(text))
+
+
+TITLE_EMOJIS = {
+    # Analysis & Research
+    'analysis': '📊', 'research': '🔍', 'study': '📝', 'investigation': '🔎',
+    'findings': '📋', 'results': '📈', 'data': '📊', 'evidence': '🔍',
+
+    # Topics & Concepts
+    'history': '📜', 'development': '📈', 'impact': '💥', 'evolution': '🔄',
+    'technology': '💻', 'science': '🔬', 'nature': '🌿', 'social': '👥',
+    'economic': '💰', 'culture': '🎭', 'environment': '🌍', 'health': '🏥',
+    'education': '📚', 'politics': '🏛️', 'industry': '🏭', 'art': '🎨',
+
+    # Methods & Approaches
+    'comparison': '⚖️', 'evaluation': '📋', 'assessment': '📝', 'review': '🔎',
+    'survey': '📊', 'experiment': '🧪', 'observation': '👁️', 'test': '✅',
+
+    # Outcomes & Insights
+    'conclusion': '🎯', 'recommendation': '💡', 'solution': '🔑', 'problem': '⚠️',
+    'challenge': '🎯', 'success': '🏆', 'failure': '❌', 'improvement': '📈'
+}
+_TITLE_KEYWORDS = tuple(TITLE_EMOJIS.items())  # in priority order
+
+
+def get_title_emoji(title: str) -> str:
+    """Select an emoji based on keywords in the research block title."""
+    title_lower = title.lower()
+    for keyword, emoji in _TITLE_KEYWORDS:
+        if keyword in title_lower:
+            return f"{emoji} "
+    return "🔍 "
+
+
+def to_latin1(text: str) -> str:
+    """`text` as the PDF's core fonts can render it: emoji dropped, other gaps as "?"."""
+    if text.isascii():
+        return text
+    text = EMOJI_PATTERN.sub("", text).translate(_LATIN1_PUNCTUATION)
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+def clean_fact(fact: str) -> str:
+    """Strip quotes and lead-ins such as "Fact:" from a generated fact."""
+    fact = fact.strip().strip(_FACT_QUOTES)
+    return _FACT_PREFIX.sub("", fact, count=1).strip().strip(_FACT_QUOTES).strip()
+
+
+def split_research_block(research: str, fallback_title: str):
+    """Split a research result into its title line and body."""
+    lines = research.strip().split('\n', 1)
+    title = _TITLE_PREFIX.sub('', lines[0], count=1).strip(' *')
+    body = lines[1].strip() if len(lines) > 1 else ""
+    return (title or fallback_title), body
+
+
+def _framework_entry(text: str) -> str:
+    """'Point: description' as 'Point|description', without markdown emphasis on the point."""
+    point, sep, desc = text.partition(':')
+    point = point.replace('**', '').strip(' *')
+    return f"{point}|{desc.strip()}" if sep else point
+
+
+def process_framework_output(raw_framework: str) -> str:
+    """Process raw LLM framework output into a structured, machine-readable format."""
+    try:
+        processed = []
+        current_section = 0
+        point_counts = {}  # section -> points so far
+        sub_counts = {}  # (section, point) -> sub-points so far
+
+        for raw_line in raw_framework.split('\n'):
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            # Main section headers
+            if _SECTION_HEADER.match(line):
+                current_section += 1
+                title = _SECTION_MARKER.sub('', line, count=1).split(':', 1)[0].strip(' *').upper()
+                processed.append(f"SECTION_{current_section}:{title}")
+                continue
+
+            # Supporting details: indented bullets or roman-numbered lines under a point
+            marker = _POINT_MARKER.match(line)
+            sub_marker = _SUB_MARKER.match(line)
+            parent = point_counts.get(current_section)
+            if parent and (sub_marker or (marker and raw_line.startswith(('  ', '\t')))):
+                text = line[(sub_marker or marker).end():]
+                key = (current_section, parent)
+                number = sub_counts[key] = sub_counts.get(key, 0) + 1
+                processed.append(f"SUB_{current_section}.{parent}.{number}:{_framework_entry(text)}")
+                continue
+
+            # Primary research points
+            if marker:
+                number = point_counts[current_section] = point_counts.get(current_section, 0) + 1
+                processed.append(f"POINT_{current_section}.{number}:{_framework_entry(line[marker.end():])}")
+                continue
+
+            # Additional context or metadata
+            processed.append(f"META_{current_section}:{line}")
+
+        return '\n'.join(processed)
+
+    except Exception as e:
+        logging.error(f"Framework processing error: {str(e)}")
+        return raw_framework
+
+
+def extract_research_aspects(framework: str) -> list:
+    """Extract research aspect titles from machine-readable framework format."""
+    aspects = []
+    for line in framework.split('\n'):
+        tag, sep, content = line.partition(':')
+        if not sep:
+            continue
+        if tag.startswith('POINT_'):
+            aspects.append(content.split('|', 1)[0].strip())
+        elif tag.startswith('META_'):
+            # Only include substantial metadata
+            content = content.strip()
+            if len(content) > 10:
+                aspects.append(content)
+    return [aspect for aspect in aspects if aspect]
+
+
+def format_framework_text(framework: str) -> str:
+    """Render the machine-readable framework as markdown for display."""
+    lines = []
+    for line in framework.split('\n'):
+        if ':' not in line:
+            continue
+        tag, content = line.split(':', 1)
+        point, _, desc = content.partition('|')
+        point, desc = point.strip(), desc.strip()
+        text = f"**{point}**: {desc}" if desc else point
+
+        if tag.startswith('SECTION_'):
+            lines.append(f"\n#### {point.title()}")
+        elif tag.startswith('POINT_'):
+            lines.append(f"- {text}")
+        elif tag.startswith('SUB_'):
+            lines.append(f"    - {text}")
+        elif tag.startswith('META_'):
+            lines.append(f"\n_{content.strip()}_")
+    return '\n'.join(lines).strip()